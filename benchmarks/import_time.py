@@ -0,0 +1,93 @@
+"""
+Tracks the import time of the package modules, as reported by `python -X importtime`.
+
+    python -m benchmarks.import_time [--repeat N] [--json results.json] [--compare baseline.json] [modules...]
+
+Each module is imported in a fresh interpreter. The best of N runs is reported, together with
+the modules that contributed the most self time to it.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+DEFAULT_MODULES = [
+    "turing_complete_interface.logic_nodes",
+    "turing_complete_interface.circuit_parser",
+    "turing_complete_interface.specification_parser",
+    "turing_complete_interface.tc_components",
+    "turing_complete_interface.circuit_compiler",
+    "turing_complete_interface.scripts",
+]
+
+
+def import_times(module: str) -> dict[str, tuple[int, int]]:
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True)
+    if res.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{res.stderr}")
+    times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(self_us), int(cumulative_us)
+    return times
+
+
+def measure(module: str, repeat: int, top: int = 5) -> dict:
+    best = None
+    for _ in range(repeat):
+        times = import_times(module)
+        if best is None or times[module][1] < best[module][1]:
+            best = times
+    heaviest = sorted(best.items(), key=lambda t: t[1][0], reverse=True)[:top]
+    return {
+        "cumulative_us": best[module][1],
+        "heaviest": {name: self_us for name, (self_us, _) in heaviest},
+        "gui_loaded": any(name.split(".")[0] in ("pygame", "tkinter") for name in best),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Compare against results previously written with --json")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Relative slowdown against --compare that counts as a regression")
+    ns = parser.parse_args(argv)
+
+    baseline = {}
+    if ns.compare:
+        with open(ns.compare) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    for module in ns.modules:
+        r = results[module] = measure(module, ns.repeat)
+        line = f"{module:<50} {r['cumulative_us'] / 1000:>8.1f}ms"
+        if r["gui_loaded"]:
+            line += "  (loads GUI modules)"
+        if module in baseline:
+            old = baseline[module]["cumulative_us"]
+            line += f"  baseline {old / 1000:>8.1f}ms ({r['cumulative_us'] / old - 1:+.0%})"
+            if r["cumulative_us"] > old * (1 + ns.tolerance):
+                regressions.append(module)
+        print(line)
+        for name, self_us in r["heaviest"].items():
+            print(f"    {name:<46} {self_us / 1000:>8.1f}ms self")
+
+    if ns.json:
+        with open(ns.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        print("Import time regressions:", *regressions)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
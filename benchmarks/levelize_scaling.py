@@ -0,0 +1,70 @@
+"""
+Compares `CombinedLogicNode.execution_order` against the previous `graphlib.TopologicalSorter`
+based implementation on random NAND netlists of increasing size.
+
+    python -m benchmarks.levelize_scaling [sizes...]
+"""
+import random
+import sys
+from graphlib import TopologicalSorter
+from time import perf_counter
+
+from frozendict import frozendict
+
+from turing_complete_interface.logic_nodes import CombinedLogicNode, Execution, Wire, NAND_2W1, InputPin, OutputPin
+
+
+def random_nand_network(size: int, seed: int = 0) -> CombinedLogicNode:
+    rng = random.Random(seed)
+    nodes = {f"n{i}": NAND_2W1 for i in range(size)}
+    wires = []
+    for i in range(size):
+        for pin in ("a", "b"):
+            if i == 0 or rng.random() < 0.05:
+                wires.append(Wire((None, "in"), (f"n{i}", pin)))
+            else:
+                wires.append(Wire((f"n{rng.randrange(max(0, i - 64), i)}", "out"), (f"n{i}", pin)))
+    wires.append(Wire((f"n{size - 1}", "out"), (None, "out")))
+    return CombinedLogicNode(f"Random{size}", frozendict(nodes), frozendict({"in": InputPin(1, False)}),
+                             frozendict({"out": OutputPin(1)}), tuple(wires))
+
+
+def topological_sorter_order(node: CombinedLogicNode) -> tuple[tuple[Execution, ...], ...]:
+    sorter = TopologicalSorter({})
+    for wire in node.wires:
+        if wire.target[0] is not None:
+            dep = (Execution(wire.source[0], False),) if wire.source[0] is not None else ()
+            t = node.nodes[wire.target[0]]
+            if t.inputs[wire.target[1]].delayed:
+                sorter.add(Execution(wire.target[0], True), *dep)
+            else:
+                sorter.add(Execution(wire.target[0], False), *dep)
+                if t.any_delayed:
+                    sorter.add(Execution(wire.target[0], True), *dep)
+        elif wire.source[0] is not None:
+            sorter.add(Execution(wire.source[0], False))
+    sorter.prepare()
+    order = []
+    while sorter.is_active():
+        ready = sorter.get_ready()
+        sorter.done(*ready)
+        order.append(tuple(ready))
+    return tuple(order)
+
+
+def main(sizes: list[int]):
+    print(f"{'wires':>10} {'levels':>8} {'TopologicalSorter':>18} {'Levelizer':>10} {'speedup':>8}")
+    for size in sizes:
+        node = random_nand_network(size)
+        start = perf_counter()
+        reference = topological_sorter_order(node)
+        old = perf_counter() - start
+        start = perf_counter()
+        order = node.execution_order
+        new = perf_counter() - start
+        assert order == reference
+        print(f"{len(node.wires):>10} {len(order):>8} {old:>17.3f}s {new:>9.3f}s {old / new:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main([int(a) for a in sys.argv[1:]] or [1_000, 10_000, 100_000, 300_000])
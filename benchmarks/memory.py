@@ -0,0 +1,93 @@
+"""
+Measures how much memory netlists take per wire:
+
+    python -m benchmarks.memory [--size N] [--save path/to/circuit.data]
+
+`generate` builds a flat synthetic netlist, `compile` a node from a laid out save (by default the synthetic
+netlist laid out), both measured with tracemalloc, so everything allocated while building them counts.
+`instances` compares a memory of `--words` REGISTER_8 flattened into prefixed wires with its `InstanceNetlist`.
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+from pathlib import Path
+
+from turing_complete_interface import compile_cache
+from turing_complete_interface.circuit_compiler import build_gate
+from frozendict import frozendict
+
+from turing_complete_interface.circuit_parser import Circuit
+from turing_complete_interface.instance_netlist import InstanceNetlist
+from turing_complete_interface.logic_nodes import CombinedLogicNode, Wire, InputPin, OutputPin
+from turing_complete_interface.specification_parser import spec_components
+from turing_complete_interface.synthetic_circuits import generate, lay_out, SyntheticConfig
+
+
+def measured(func):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        res = func()
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return res, size
+
+
+def register_memory(words: int) -> CombinedLogicNode:
+    register = spec_components["REGISTER_8"]
+    nodes = {f"reg{i}": register for i in range(words)}
+    wires = [Wire((None, pin), (name, pin)) for name in nodes for pin in register.inputs]
+    wires.append(Wire(("reg0", "out"), (None, "out")))
+    return CombinedLogicNode(f"Memory{words}", frozendict(nodes), register.inputs,
+                             frozendict({"out": OutputPin(8)}), tuple(wires))
+
+
+def flattened_wires(netlist: InstanceNetlist) -> list[Wire]:
+    """ The wires of all instances with their node names prefixed by the instance path, like flattening """
+    paths = [netlist.instance_path(i) + "." for i in range(netlist.instance_count)]
+    prefixed = lambda p, n: None if n is None else p + n
+    return [Wire((prefixed(paths[i], w.source[0]), w.source[1]), (prefixed(paths[i], w.target[0]), w.target[1]),
+                 w.source_bits, w.target_bits)
+            for i, w in netlist.iter_flat_wires()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=100_000, help="Gates of the synthetic netlist")
+    parser.add_argument("--layout-size", type=int, default=2000, help="Gates of the synthetic save to compile")
+    parser.add_argument("--words", type=int, default=256, help="Registers of the memory for `instances`")
+    parser.add_argument("--save", type=Path, help="Compile this circuit.data instead of a synthetic one")
+    ns = parser.parse_args(argv)
+    compile_cache.enabled = False
+
+    node, size = measured(lambda: generate(SyntheticConfig(size=ns.size)))
+    print(f"generate {ns.size}: {len(node.wires)} wires, {size / 2 ** 20:.1f} MiB, "
+          f"{size / len(node.wires):.0f} bytes per wire")
+    del node
+
+    if ns.save is not None:
+        data = ns.save.read_bytes()
+        name = ns.save.parent.name
+    else:
+        data = bytes(lay_out(generate(SyntheticConfig(size=ns.layout_size))).to_bytes())
+        name = f"synthetic {ns.layout_size}"
+    circuit = Circuit.parse(data)
+    node, size = measured(lambda: build_gate(name, circuit))
+    print(f"compile {name}: {len(node.wires)} wires, {size / 2 ** 20:.1f} MiB, "
+          f"{size / len(node.wires):.0f} bytes per wire")
+
+    memory = register_memory(ns.words)
+    netlist, size = measured(lambda: InstanceNetlist.from_node(memory))
+    template_wires = sum(len(t.node.wires) for t in netlist.templates)
+    print(f"instances {memory.name}: {len(netlist.templates)} templates with {template_wires} wires, "
+          f"{netlist.instance_count} instances, {size / 2 ** 10:.0f} KiB")
+    wires, size = measured(lambda: flattened_wires(netlist))
+    print(f"flattened {memory.name}: {len(wires)} wires, {size / 2 ** 10:.0f} KiB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Measures how generating, scheduling, simulating and laying out synthetic netlists scale with their size.
+
+    python -m benchmarks.scaling [--max-layout N] [--json results.json] [sizes...]
+
+The output is one row per size, meant to be plotted. Laying out is skipped above `--max-layout` gates,
+since `Space.place` is far slower than the rest.
+"""
+import argparse
+import json
+import sys
+from time import perf_counter
+
+from bitarray import frozenbitarray
+from frozendict import frozendict
+
+from turing_complete_interface.synthetic_circuits import generate, lay_out, SyntheticConfig
+
+
+def timed(func):
+    start = perf_counter()
+    res = func()
+    return res, perf_counter() - start
+
+
+def measure(size: int, seed: int, max_layout: int) -> dict:
+    node, generate_time = timed(lambda: generate(SyntheticConfig(size=size, seed=seed)))
+    _, schedule_time = timed(lambda: node.execution_order)
+    inputs = frozendict({name: frozenbitarray(pin.bits, endian="little") for name, pin in node.inputs.items()})
+    _, evaluate_time = timed(lambda: node.evaluate(inputs, node.create_state(), True))
+    if size <= max_layout:
+        _, layout_time = timed(lambda: lay_out(node))
+    else:
+        layout_time = None
+    return {
+        "wires": len(node.wires),
+        "levels": len(node.execution_order),
+        "generate": generate_time,
+        "schedule": schedule_time,
+        "evaluate": evaluate_time,
+        "layout": layout_time,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sizes", nargs="*", type=int, default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-layout", type=int, default=10_000)
+    parser.add_argument("--json", help="Write the results to this file")
+    ns = parser.parse_args(argv)
+
+    print(f"{'gates':>10} {'wires':>10} {'levels':>8} {'generate':>10} {'schedule':>10} {'evaluate':>10} {'layout':>10}")
+    results = {}
+    for size in ns.sizes:
+        r = results[size] = measure(size, ns.seed, ns.max_layout)
+        layout = f"{r['layout']:>9.3f}s" if r["layout"] is not None else f"{'-':>10}"
+        print(f"{size:>10} {r['wires']:>10} {r['levels']:>8} {r['generate']:>9.3f}s {r['schedule']:>9.3f}s "
+              f"{r['evaluate']:>9.3f}s {layout}")
+    if ns.json:
+        with open(ns.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
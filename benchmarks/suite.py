@@ -0,0 +1,384 @@
+"""
+Times the main workloads of the library: parsing saves, compiling, simulating, layout and routing.
+
+    python -m benchmarks.suite [--filter REGEX] [--repeat N] [--json results.json] [--compare baseline.json]
+
+Every benchmark is set up once per repeat and then called `number` times; the best repeat is what
+gets compared. Results are written together with a description of the machine they were measured on,
+so that a file written with `--json` can be kept as the baseline for a later `--compare`.
+Real saves can be added with `--save path/to/circuit.data` and `--custom <id or name>`.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass
+from functools import cache, partial
+from itertools import product
+from pathlib import Path
+from statistics import median
+from time import perf_counter, strftime
+from typing import Callable, Any
+
+from bitarray import frozenbitarray
+from frozendict import frozendict
+
+from benchmarks.levelize_scaling import random_nand_network
+from turing_complete_interface import compile_cache, circuit_parser, save_codec
+from turing_complete_interface.circuit_builder import build_circuit, IOPosition, Space, PathFinder
+from turing_complete_interface.circuit_compiler import build_gate
+from turing_complete_interface.circuit_parser import Circuit
+from turing_complete_interface.logic_nodes import LogicNodeType, CombinedLogicNode, Wire
+from turing_complete_interface.memory_trace import MemoryTracer, read_log
+from turing_complete_interface.netlist_arrays import NetlistArrays
+from turing_complete_interface.netlist_file import write_netlist, NetlistFile
+from turing_complete_interface.specification_parser import load_all_components, spec_components
+from turing_complete_interface.synthetic_circuits import generate, lay_out, SyntheticConfig
+from turing_complete_interface.truth_table import TruthTable
+
+AREA = (-63, -63, 128, 128)
+TEMP_DIR = tempfile.TemporaryDirectory(prefix="tci_benchmarks_")
+
+
+@dataclass
+class Benchmark:
+    name: str
+    # Called once per repeat, returns the function that is timed
+    setup: Callable[[], Callable[[], Any]]
+    number: int = 1
+
+
+BENCHMARKS: list[Benchmark] = []
+
+
+def benchmark(name: str, number: int = 1):
+    def register(setup):
+        BENCHMARKS.append(Benchmark(name, setup, number))
+        return setup
+
+    return register
+
+
+@cache
+def laid_out_network(size: int) -> Circuit:
+    node = random_nand_network(size).force_bit_annotations
+    return build_circuit(node, IOPosition.from_node(node), Space(*AREA))
+
+
+def zero_inputs(node: LogicNodeType) -> frozendict[str, frozenbitarray]:
+    return frozendict({name: frozenbitarray(pin.bits, endian="little") for name, pin in node.inputs.items()})
+
+
+@benchmark("parse/nand_network_300", 20)
+def parse_synthetic():
+    return partial(Circuit.parse, bytes(laid_out_network(300).to_bytes()))
+
+
+def codec_args(circuit: Circuit) -> tuple:
+    return (circuit.save_version, [g.to_nim() for g in circuit.gates], [w.to_nim() for w in circuit.wires],
+            99_999, 99_999, circuit.menu_visible, circuit.clock_speed, circuit.nesting_level, circuit.description,
+            circuit.camera_position)
+
+
+@benchmark("save_codec/parse/nand_network_300", 20)
+def save_codec_parse():
+    return partial(save_codec.parse_state, bytes(laid_out_network(300).to_bytes()))
+
+
+@benchmark("save_codec/parse_lazy/nand_network_300", 20)
+def save_codec_parse_lazy():
+    return partial(save_codec.parse_state, bytes(laid_out_network(300).to_bytes()), lazy=True)
+
+
+@benchmark("save_codec/write/nand_network_300", 20)
+def save_codec_write():
+    return partial(save_codec.state_to_binary, *codec_args(laid_out_network(300)))
+
+
+if circuit_parser.save_monger is not save_codec:
+    # The same workloads through the Nim module, to compare against
+    @benchmark("save_monger/parse/nand_network_300", 20)
+    def save_monger_parse():
+        return partial(circuit_parser.save_monger.parse_state, list(laid_out_network(300).to_bytes()))
+
+
+    @benchmark("save_monger/write/nand_network_300", 20)
+    def save_monger_write():
+        return partial(circuit_parser.save_monger.state_to_binary, *codec_args(laid_out_network(300)))
+
+
+@benchmark("build_gate/nand_network_300", 5)
+def build_gate_synthetic():
+    return partial(build_gate, "Synthetic", laid_out_network(300))
+
+
+def evaluate_spec(name: str):
+    node = spec_components[name]
+    return partial(node.evaluate, zero_inputs(node), node.create_state(), True)
+
+
+benchmark("evaluate/ADDER_2W16", 20)(partial(evaluate_spec, "ADDER_2W16"))
+benchmark("evaluate/REGISTER_8", 20)(partial(evaluate_spec, "REGISTER_8"))
+
+
+@benchmark("evaluate/nand_network_5000")
+def evaluate_cpu_sized():
+    node = random_nand_network(5000)
+    node.execution_order  # Scheduling is part of compiling, not of simulating
+    return partial(node.evaluate, zero_inputs(node), None, True)
+
+
+@benchmark("netlist_arrays/from_node/nand_network_5000", 5)
+def netlist_arrays_from_node():
+    return partial(NetlistArrays.from_node, random_nand_network(5000))
+
+
+@benchmark("netlist_arrays/to_node/nand_network_5000", 5)
+def netlist_arrays_to_node():
+    return NetlistArrays.from_node(random_nand_network(5000)).to_node
+
+
+@cache
+def compiled_synthetic(size: int) -> CombinedLogicNode:
+    # Compiled from a laid out save, unlike the NAND networks it has the OR gates the compiler builds
+    return build_gate("Synthetic", Circuit.parse(bytes(lay_out(generate(SyntheticConfig(size=size))).to_bytes())))
+
+
+@benchmark("netlist_file/write_read/synthetic_1000", 5)
+def netlist_file_write_read():
+    node = compiled_synthetic(1000)
+    path = Path(TEMP_DIR.name) / "synthetic.tcnl"
+
+    def run():
+        write_netlist(node, path)
+        with NetlistFile(path) as f:
+            return f.to_node()
+
+    # The node types go through the compile cache's pickler, which has to give back the same OR gates
+    assert run() == node, "The netlist file doesn't give back the node it was written from"
+    return run
+
+
+def wrapped(node: LogicNodeType, name: str) -> CombinedLogicNode:
+    # A custom component that only contains `node`, with the same pins
+    return CombinedLogicNode(name, frozendict({"inner": node}), node.inputs, node.outputs, tuple(
+        Wire((None, pin), ("inner", pin)) for pin in node.inputs
+    ) + tuple(Wire(("inner", pin), (None, pin)) for pin in node.outputs))
+
+
+@benchmark("memory_trace/nested_ram_1000", 5)
+def memory_trace_nested_ram():
+    from turing_complete_interface.tc_components import get_component
+    node = wrapped(wrapped(get_component("Ram")[1], "RamBox"), "Outer")
+    rng = random.Random(0)
+    cycles = [{"address": rng.getrandbits(4), "load": 1, "save": rng.getrandbits(1), "value_in": rng.getrandbits(8)}
+              for _ in range(1000)]
+    path = Path(TEMP_DIR.name) / "ram.trace"
+
+    def run():
+        state = node.create_state()
+        with MemoryTracer(path) as tracer:
+            for cycle, inputs in enumerate(cycles):
+                tracer.cycle = cycle
+                state, _, _ = node.calculate(state, **inputs)
+
+    # The non delayed evaluations are repeated in the delayed one of each enclosing node, but every access is
+    # logged once, and the reads give back what was written before
+    run()
+    log = list(read_log(path))
+    assert [a.cycle for a in log if not a.write] == list(range(len(cycles))), "Reads aren't logged once per cycle"
+    assert sum(a.write for a in log) == sum(c["save"] for c in cycles), "Writes aren't logged once per cycle"
+    memory = {}
+    for a in log:
+        if a.write:
+            memory[a.address] = a.value
+        else:
+            assert memory.get(a.address, 0) == a.value, f"{a} doesn't match the logged writes"
+    return run
+
+
+@benchmark("load_all_components")
+def load_spec_components():
+    return partial(load_all_components, spec_components.base_path)
+
+
+@benchmark("build_circuit/nand_network_300")
+def build_circuit_synthetic():
+    node = random_nand_network(300).force_bit_annotations
+    return lambda: build_circuit(node, IOPosition.from_node(node), Space(*AREA))
+
+
+@benchmark("space_place/500_boxes")
+def space_place():
+    rng = random.Random(0)
+    sizes = [(rng.randint(1, 4), rng.randint(1, 4)) for _ in range(500)]
+
+    def run():
+        space = Space(*AREA)
+        for w, h in sizes:
+            space.place(w, h)
+
+    return run
+
+
+@benchmark("path_find/nand_network_300")
+def path_find():
+    circuit = laid_out_network(300)
+    finder = PathFinder.create(circuit, AREA)
+    rng = random.Random(0)
+    free = [(x, y) for x, y in product(range(AREA[2]), range(AREA[3])) if finder.taken[x][y] is None]
+    pairs = [tuple((p[0] + AREA[0], p[1] + AREA[1]) for p in rng.sample(free, 2)) for _ in range(20)]
+
+    def run():
+        for start, end in pairs:
+            finder.path_find(start, end)
+
+    return run
+
+
+@benchmark("truth_table/reduce_dupes_6in")
+def reduce_dupes():
+    def f(*bits):
+        total = sum(bits)
+        return total > 3, total % 2 == 1, (bits[0] and bits[1]) or bits[2]
+
+    table = TruthTable.from_function(tuple(f"i{i}" for i in range(6)), ("gt", "odd", "mix"), f)
+
+    def run():
+        random.seed(0)  # reduce_dupes shuffles
+        TruthTable(table.in_vars, table.out_vars, dict(table.cares)).reduce_dupes()
+
+    return run
+
+
+def forget_custom_nodes():
+    from turing_complete_interface.tc_components import cc_by_id, rev_components
+    for ref in cc_by_id.values():
+        if ref.node is not None:
+            del rev_components[ref.node.name]
+            ref.node = None
+
+
+def build_gate_custom(custom: str):
+    from turing_complete_interface.tc_components import get_custom_component
+    ref = get_custom_component(custom, no_node=True)
+    ref.circuit  # Parsing is benchmarked separately
+
+    def run():
+        forget_custom_nodes()  # So that nested custom components are compiled again as well
+        return ref.get()
+
+    return run
+
+
+def machine_info() -> dict:
+    from importlib.metadata import version, PackageNotFoundError
+
+    versions = {}
+    for package in ("bitarray", "frozendict", "lark"):
+        try:
+            versions[package] = version(package)
+        except PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "date": strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": f"{platform.python_implementation()} {platform.python_version()}",
+        "library_version": compile_cache.library_version(),
+        "commit": commit,
+        "packages": versions,
+    }
+
+
+def measure(bench: Benchmark, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        func = bench.setup()
+        start = perf_counter()
+        for _ in range(bench.number):
+            func()
+        times.append((perf_counter() - start) / bench.number)
+    return {
+        "best": min(times),
+        "median": median(times),
+        "repeat": repeat,
+        "number": bench.number,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", help="Only run the benchmarks whose name matches this regex")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks instead of running them")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", type=Path, action="append", default=[],
+                        help="Also benchmark parsing this circuit.data file")
+    parser.add_argument("--custom", action="append", default=[],
+                        help="Also benchmark compiling this custom component, by id or name")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Compare against results previously written with --json")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Relative slowdown against --compare that counts as a regression")
+    ns = parser.parse_args(argv)
+
+    # We want to measure compiling, not loading from the compile cache
+    compile_cache.enabled = False
+
+    benchmarks = list(BENCHMARKS)
+    for path in ns.save:
+        benchmarks.append(Benchmark(f"parse/{path.parent.name}", partial(partial, Circuit.parse, path.read_bytes())))
+    for custom in ns.custom:
+        benchmarks.append(Benchmark(f"build_gate/custom_{custom}", partial(build_gate_custom, custom)))
+    if ns.filter:
+        benchmarks = [b for b in benchmarks if re.search(ns.filter, b.name)]
+    if ns.list:
+        for b in benchmarks:
+            print(b.name)
+        return 0
+
+    baseline = {}
+    if ns.compare:
+        with open(ns.compare) as f:
+            old = json.load(f)
+        baseline = old["results"]
+        machine = machine_info()
+        for key in ("platform", "processor", "python"):
+            if old["machine"].get(key) != machine[key]:
+                print(f"Baseline was measured with a different {key}: {old['machine'].get(key)!r}")
+
+    results = {}
+    regressions = []
+    for bench in benchmarks:
+        r = results[bench.name] = measure(bench, ns.repeat)
+        line = f"{bench.name:<40} {r['best'] * 1000:>10.3f}ms  (median {r['median'] * 1000:.3f}ms)"
+        if bench.name in baseline:
+            old = baseline[bench.name]["best"]
+            line += f"  baseline {old * 1000:>10.3f}ms ({r['best'] / old - 1:+.0%})"
+            if r["best"] > old * (1 + ns.tolerance):
+                regressions.append(bench.name)
+        print(line)
+
+    if ns.json:
+        with open(ns.json, "w") as f:
+            json.dump({"machine": machine_info(), "results": results}, f, indent=2)
+    if regressions:
+        print("Performance regressions:", *regressions)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
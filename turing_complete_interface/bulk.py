@@ -0,0 +1,163 @@
+"""
+Parses and compiles every save below a directory (by default `SCHEMATICS_PATH`) in a process pool,
+writing one JSON object per save as soon as it is done:
+
+    python -m turing_complete_interface.bulk -o results.jsonl --checkpoint done.txt
+
+Each line has the save's path relative to the root, its metadata (score, version, description),
+the number of gates and wires, the size of the compiled node, how long parsing and compiling took,
+and the error if one of them failed. Lines are in the order the saves finish, not in path order.
+
+With `--checkpoint`, the path of each finished save is appended to that file, and saves already listed
+there are skipped, so an interrupted run can be restarted with the same arguments. When resuming,
+`--output` is appended to instead of overwritten.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sys
+from argparse import ArgumentParser
+from fnmatch import fnmatchcase
+from multiprocessing import Pool
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Iterator, Iterable
+
+from . import compile_cache, tc_components
+from .circuit_compiler import build_gate
+from .circuit_parser import Circuit, SCHEMATICS_PATH
+
+
+def discover(root: Path, patterns: Iterable[str] = ()) -> list[str]:
+    """ The paths of the directories containing a `circuit.data`, relative to root and sorted """
+    patterns = tuple(patterns)
+    saves = []
+    for file in root.rglob("circuit.data"):
+        rel = file.parent.relative_to(root).as_posix()
+        if not patterns or any(fnmatchcase(rel, p) for p in patterns):
+            saves.append(rel)
+    return sorted(saves)
+
+
+def _error(e: BaseException) -> str:
+    return f"{type(e).__name__}: {e}"
+
+
+def process(root: Path, rel: str, compile_save: bool = True) -> dict[str, Any]:
+    file = root / rel / "circuit.data"
+    result: dict[str, Any] = {"path": rel}
+    start = perf_counter()
+    try:
+        data = file.read_bytes()
+        circuit = Circuit.parse(data)
+    except Exception as e:
+        result["parse_error"] = _error(e)
+        return result
+    result["parse_time"] = perf_counter() - start
+    result.update({
+        "size": len(data),
+        "save_version": circuit.save_version,
+        "nand": circuit.nand,
+        "delay": circuit.delay,
+        "clock_speed": circuit.clock_speed,
+        "nesting_level": circuit.nesting_level,
+        "description": circuit.description,
+        "dependencies": list(circuit.dependencies),
+        "gates": sum(g is not None for g in circuit.gates),
+        "wires": len(circuit.wires),
+    })
+    if compile_save:
+        start = perf_counter()
+        try:
+            node = build_gate(rel.replace("/", "_"), circuit)
+            node.execution_order
+        except Exception as e:
+            result["compile_error"] = _error(e)
+        else:
+            result["compile_time"] = perf_counter() - start
+            result["nodes"] = len(node.nodes)
+            result["state_size"] = node.state_size
+    return result
+
+
+def _process(args: tuple[Path, str, bool]) -> dict[str, Any]:
+    return process(*args)
+
+
+def _init_worker(cache_enabled: bool):
+    # `compile_cache.enabled` is only inherited by forked workers, not by spawned ones
+    compile_cache.enabled = cache_enabled
+
+
+def run(root: Path, saves: list[str], jobs: int = None, compile_saves: bool = True) -> Iterator[dict[str, Any]]:
+    """ Yields the result of each save as it finishes """
+    # Bring the custom component index up to date once, instead of every worker racing to write it
+    if compile_saves and SCHEMATICS_PATH is not None:
+        tc_components.load_custom()
+    tasks = [(root, rel, compile_saves) for rel in saves]
+    if jobs == 1:
+        yield from map(_process, tasks)
+        return
+    with Pool(jobs, initializer=_init_worker, initargs=(compile_cache.enabled,)) as pool:
+        yield from pool.imap_unordered(_process, tasks)
+
+
+def read_checkpoint(file: Path) -> set[str]:
+    try:
+        return {line for line in file.read_text().splitlines() if line}
+    except FileNotFoundError:
+        return set()
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="Parse and compile all saves below a directory in parallel")
+    parser.add_argument("root", nargs="?", type=Path, default=SCHEMATICS_PATH,
+                        help="Directory to search for circuit.data, default the game's schematics")
+    parser.add_argument("-o", "--output", type=Path, help="JSON lines file to write, default stdout")
+    parser.add_argument("--append", action="store_true", help="Append to --output instead of overwriting it")
+    parser.add_argument("--checkpoint", type=Path, help="Skip the saves listed in this file and add finished ones")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--filter", action="append", default=[], metavar="GLOB",
+                        help="Only process saves whose relative path matches")
+    parser.add_argument("--no-compile", action="store_true", help="Only parse the saves")
+    parser.add_argument("--no-cache", action="store_true", help="Don't use the compile cache for custom components")
+    ns = parser.parse_args(argv)
+    if ns.root is None:
+        parser.error("The schematics folder wasn't found, give the directory to search")
+    if ns.no_cache:
+        compile_cache.enabled = False
+
+    saves = discover(ns.root, ns.filter)
+    done = read_checkpoint(ns.checkpoint) if ns.checkpoint is not None else set()
+    todo = [rel for rel in saves if rel not in done]
+    print(f"{len(saves)} saves, {len(saves) - len(todo)} already done", file=sys.stderr)
+
+    out = open(ns.output, "a" if ns.append or done else "w", encoding="utf-8") if ns.output is not None else sys.stdout
+    checkpoint = open(ns.checkpoint, "a", encoding="utf-8") if ns.checkpoint is not None else None
+    start = perf_counter()
+    count = errors = 0
+    try:
+        for result in run(ns.root, todo, ns.jobs, not ns.no_compile):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            # Only after the result is written, so that an interruption can't lose it
+            if checkpoint is not None:
+                checkpoint.write(result["path"] + "\n")
+                checkpoint.flush()
+            count += 1
+            errors += "parse_error" in result or "compile_error" in result
+    except KeyboardInterrupt:
+        print("Interrupted", file=sys.stderr)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if checkpoint is not None:
+            checkpoint.close()
+    elapsed = perf_counter() - start
+    print(f"Processed {count} saves ({errors} with errors) in {elapsed:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -51,6 +51,63 @@ class IOPosition:
         return ios
 
 
+class RectanglePacker:
+    """
+    The taken cells of a w x h area, one bitarray per row, that finds the first free rectangle of a size, first in
+    row major order of its top left corner. Cells are only ever taken, never freed (other than by `clear`), so the
+    first free position of a size only moves forward: each size resumes its search where the last one ended, and
+    placing many boxes of a few sizes costs a few bitarray operations per box instead of a scan of the area.
+    """
+
+    def __init__(self, w: int, h: int):
+        self.w = w
+        self.h = h
+        self.rows = [bitarray(w) for _ in range(h)]
+        for row in self.rows:
+            row.setall(0)
+        # Per size, a position at or before its first free one
+        self._resume: dict[tuple[int, int], tuple[int, int]] = {}
+
+    def is_filled(self, x: int, y: int) -> bool:
+        return bool(self.rows[y][x])
+
+    def fill(self, x: int, y: int, w: int, h: int):
+        """ Takes the rectangle, as far as it is inside the area """
+        x0, x1 = max(x, 0), min(x + w, self.w)
+        if x0 < x1:
+            for row in self.rows[max(y, 0):max(y + h, 0)]:
+                row[x0:x1] = 1
+
+    def find(self, w: int, h: int, accept: Callable[[int, int], bool] = None) -> tuple[int, int] | None:
+        """ The first free w x h rectangle for which `accept(x, y)` holds, None if there is none """
+        zeros = bitarray(w)
+        zeros.setall(0)
+        x, y = self._resume.get((w, h), (0, 0))
+        first_free = None
+        while y + h <= self.h:
+            free = self.rows[y]
+            if h > 1:
+                free = free | self.rows[y + 1]
+                for row in self.rows[y + 2:y + h]:
+                    free |= row
+            x = free.find(zeros, x)
+            while x != -1:
+                if first_free is None:
+                    first_free = x, y
+                if accept is None or accept(x, y):
+                    self._resume[w, h] = first_free
+                    return x, y
+                x = free.find(zeros, x + 1)
+            x, y = 0, y + 1
+        self._resume[w, h] = first_free or (0, y)
+        return None
+
+    def clear(self):
+        for row in self.rows:
+            row.setall(0)
+        self._resume.clear()
+
+
 @dataclass
 class Space:
     x: int
@@ -60,37 +117,26 @@ class Space:
     _observer: Any = None
     _placed_boxes: list[tuple[int, int, int, int]] = field(default_factory=list)
     _protected: set[Any] = field(default_factory=set)
-    _taken_spaces: bitarray = None
+    _packer: RectanglePacker = None
 
     def __post_init__(self):
-        self._taken_spaces = bitarray([0] * (self.w * self.h))
-        self._taken_spaces[:] = 0
+        self._packer = RectanglePacker(self.w, self.h)
 
     def place(self, w: int, h: int, force_pos: tuple[int, int] = None,
               hasher: Callable[[tuple[int, int]], Any] = None) -> tuple[int, int]:
         if force_pos is None:
-            for idx in self._taken_spaces.itersearch(bitarray([0] * w)):
-                y, x = divmod(idx, self.w)
-                if x + w > self.w:
-                    continue
-                if hasher is not None and hasher((x + self.x, y + self.y)) in self._protected:
-                    continue
-                for k in range(h):
-                    if idx + k * self.w + w >= self.h * self.w:
-                        break
-                    if self._taken_spaces[idx + k * self.w:idx + k * self.w + w].any():
-                        break
-                else:
-                    break
+            if hasher is None:
+                pos = self._packer.find(w, h)
             else:
+                pos = self._packer.find(w, h, lambda x, y: hasher((x + self.x, y + self.y)) not in self._protected)
+            if pos is None:
                 raise ValueError(f"No space left {w}, {h}")
+            x, y = pos
         else:
             x, y = force_pos
 
         self._placed_boxes.append((x, y, w, h))
-        idx = y * self.w + x
-        for k in range(h):
-            self._taken_spaces[idx + k * self.w:idx + k * self.w + w] = 1
+        self._packer.fill(x, y, w, h)
         if hasher is not None:
             self._protected.add(hasher((x + self.x, y + self.y)))
         if self._observer is not None:
@@ -98,10 +144,10 @@ class Space:
         return x + self.x, y + self.y
 
     def is_filled(self, x: int, y: int):
-        return self._taken_spaces[(y - self.y) * self.w + (x - self.x)]
+        return self._packer.is_filled(x - self.x, y - self.y)
 
     def clear(self):
-        self._taken_spaces.clear()
+        self._packer.clear()
         self._placed_boxes.clear()
         self._protected.clear()
 
@@ -254,17 +300,17 @@ def build_circuit(node: CombinedLogicNode, io_positions: list[IOPosition], space
         end = tuple(end)
         if not source_pin.is_byte and not target_pin.is_byte:
             assert wire.source_bits == wire.target_bits == (0, 1), wire
-            wires.append(CircuitWire(len(wires) + 1, False, 0, "", [tuple(start), tuple(end)]))
+            wires.append(CircuitWire(len(wires) + 1, "ck_bit", 0, "", [tuple(start), tuple(end)]))
         elif source_pin.is_byte and not target_pin.is_byte:
             assert wire.target_bits == (0, 1)
             if start not in splitters:
                 pos = place(bs_shape)
                 splitter = splitters[start] = GateReference("ByteSplitter", pos, 0, str(get_id()), "")
                 gate_refs.append(splitter)
-                wires.append(CircuitWire(get_id(), True, 0, "", [start, bs_shape.pin_position(splitter, "in")]))
+                wires.append(CircuitWire(get_id(), "ck_byte", 0, "", [start, bs_shape.pin_position(splitter, "in")]))
             else:
                 splitter = splitters[start]
-            wires.append(CircuitWire(get_id(), False, 0, "",
+            wires.append(CircuitWire(get_id(), "ck_bit", 0, "",
                                      [bs_shape.pin_position(splitter, f"r{wire.source_bits[0]}"), end]))
         elif not source_pin.is_byte and target_pin.is_byte:
             assert wire.source_bits == (0, 1)
@@ -272,11 +318,13 @@ def build_circuit(node: CombinedLogicNode, io_positions: list[IOPosition], space
                 pos = place(bm_shape)
                 maker = makers[end] = GateReference("ByteMaker", pos, 0, str(get_id()), "")
                 gate_refs.append(maker)
-                wires.append(CircuitWire(get_id(), True, 0, "", [bm_shape.pin_position(maker, "out"), end]))
+                wires.append(CircuitWire(get_id(), "ck_byte", 0, "", [bm_shape.pin_position(maker, "out"), end]))
             else:
                 maker = makers[end]
-            wires.append(CircuitWire(get_id(), False, 0, "",
+            wires.append(CircuitWire(get_id(), "ck_bit", 0, "",
                                      [start, bm_shape.pin_position(maker, f"r{wire.target_bits[0]}")]))
+        elif wire.source_bits == wire.target_bits == (0, 8):
+            wires.append(CircuitWire(get_id(), "ck_byte", 0, "", [start, end]))
         else:
             assert False, wire
     return Circuit(gate_refs, wires, 99_999, 99_999, level_version)
@@ -379,7 +427,7 @@ def layout_with_pydot(node: CombinedLogicNode, io_positions: list[IOPosition], s
         end = tuple(end)
         if not source_pin.is_byte and not target_pin.is_byte:
             assert wire.source_bits == wire.target_bits == (0, 1), wire
-            wires.append(CircuitWire(len(wires) + 1, False, 0, "", [tuple(start), tuple(end)]))
+            wires.append(CircuitWire(len(wires) + 1, "ck_bit", 0, "", [tuple(start), tuple(end)]))
         elif source_pin.is_byte and not target_pin.is_byte:
             assert wire.target_bits == (0, 1)
             if start not in splitters:
@@ -387,10 +435,10 @@ def layout_with_pydot(node: CombinedLogicNode, io_positions: list[IOPosition], s
                 pos = t - bm_shape.bounding_box[0], l - bm_shape.bounding_box[1]
                 splitter = splitters[start] = GateReference("ByteSplitter", pos, 0, str(get_id()), "")
                 gate_refs.append(splitter)
-                wires.append(CircuitWire(get_id(), True, 0, "", [start, bs_shape.pin_position(splitter, "in")]))
+                wires.append(CircuitWire(get_id(), "ck_byte", 0, "", [start, bs_shape.pin_position(splitter, "in")]))
             else:
                 splitter = splitters[start]
-            wires.append(CircuitWire(get_id(), False, 0, "",
+            wires.append(CircuitWire(get_id(), "ck_bit", 0, "",
                                      [bs_shape.pin_position(splitter, f"r{wire.source_bits[0]}"), end]))
         elif not source_pin.is_byte and target_pin.is_byte:
             assert wire.source_bits == (0, 1)
@@ -399,10 +447,10 @@ def layout_with_pydot(node: CombinedLogicNode, io_positions: list[IOPosition], s
                 pos = t - bm_shape.bounding_box[0], l - bm_shape.bounding_box[1]
                 maker = makers[end] = GateReference("ByteMaker", pos, 0, str(get_id()), "")
                 gate_refs.append(maker)
-                wires.append(CircuitWire(get_id(), True, 0, "", [bm_shape.pin_position(maker, "out"), end]))
+                wires.append(CircuitWire(get_id(), "ck_byte", 0, "", [bm_shape.pin_position(maker, "out"), end]))
             else:
                 maker = makers[end]
-            wires.append(CircuitWire(get_id(), False, 0, "",
+            wires.append(CircuitWire(get_id(), "ck_bit", 0, "",
                                      [start, bm_shape.pin_position(maker, f"r{wire.target_bits[0]}")]))
         else:
             assert False, wire
@@ -1,5 +1,8 @@
+import sys
 from collections import defaultdict
 from dataclasses import dataclass
+from typing import Mapping
+
 from frozendict import frozendict
 
 from turing_complete_interface.tc_components import compute_gate_shape, get_component, spec_components
@@ -9,7 +12,7 @@ from .circuit_parser import Circuit, GateReference, GateShape, Pos
 
 
 
-@dataclass
+@dataclass(slots=True)
 class PinInfo:
     gate_ref: GateReference
     node_type: LogicNodeType
@@ -23,7 +26,8 @@ class PinInfo:
 
     @property
     def id(self):
-        return str(self.gate_ref.id)
+        # Interned, since it ends up as the node name in every wire connected to the gate
+        return sys.intern(str(self.gate_ref.id))
 
     @property
     def connector(self):
@@ -52,8 +56,8 @@ class PinInfo:
 
 def build_connected_groups(circuit: Circuit) -> tuple[dict[str, LogicNodeType], list[list[PinInfo]], list[PinInfo],
                                                       dict[str, InputPin], dict[str, OutputPin]]:
-    connections = {p: frozenset(ps) for p, ps in circuit.connections.items()}
-    connected_groups: defaultdict[frozenset[Pos], list[PinInfo]] = defaultdict(list)
+    connectivity = circuit.connectivity
+    connected_groups: defaultdict[int, list[PinInfo]] = defaultdict(list)
     nodes = {}
     missing_pins = []
     circuit_inputs = {}
@@ -64,7 +68,7 @@ def build_connected_groups(circuit: Circuit) -> tuple[dict[str, LogicNodeType],
         assert set(node.inputs.keys()) | set(node.outputs.keys()) == set(map(str, shape.pins)), (
             set(node.inputs.keys()) | set(node.outputs.keys()), set(map(str, shape.pins)), node, shape)
         if not shape.is_io:
-            nodes[str(gate.id)] = node
+            nodes[sys.intern(str(gate.id))] = node
         for name, pin in shape.pins.items():
             p = gate.translate(pin.pos)
             if shape.is_io:
@@ -80,15 +84,21 @@ def build_connected_groups(circuit: Circuit) -> tuple[dict[str, LogicNodeType],
                     circuit_inputs[pin_name] = InputPin(bit_size)
             else:
                 pin_name = str(name)
-            if p in connections:
-                group = connections[p]
-                connected_groups[group].append(PinInfo(gate, node, shape, str(name), pin_name))
+            pin_name = sys.intern(pin_name)
+            if (net := connectivity.net_of(p)) is not None:
+                connected_groups[net].append(PinInfo(gate, node, shape, str(name), pin_name))
             elif str(name) in node.inputs:
                 missing_pins.append(PinInfo(gate, node, shape, str(name), pin_name))
 
     return nodes, list(connected_groups.values()), missing_pins, circuit_inputs, circuit_outputs
 
 
+def apply_input_pins(shape: GateShape, inputs: Mapping[str, InputPin]):
+    for name, pin in inputs.items():
+        shape.pins[name].is_byte = pin.bits == 8
+        shape.pins[name].is_delayed = pin.delayed
+
+
 def build_gate(circuit_name: str, circuit: Circuit) -> CombinedLogicNode:
     wires: list[Wire] = []
     nodes, connected_groups, missing_pins, circuit_inputs, circuit_outputs = build_connected_groups(circuit)
@@ -179,9 +189,6 @@ def build_gate(circuit_name: str, circuit: Circuit) -> CombinedLogicNode:
             new_inputs[name] = InputPin(old.bits, True)
     assert len(new_inputs) == len(circuit_inputs)
 
-    shape = compute_gate_shape(circuit, circuit_name)
-    for name, pin in new_inputs.items():
-        shape.pins[name].is_byte = pin.bits == 8
-        shape.pins[name].is_delayed = pin.delayed
+    apply_input_pins(compute_gate_shape(circuit, circuit_name), new_inputs)
     return CombinedLogicNode(circuit_name, frozendict(nodes), frozendict(new_inputs), frozendict(circuit_outputs),
                              tuple(wires))
@@ -3,7 +3,7 @@ from __future__ import annotations
 import os
 import sys
 from collections import defaultdict
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from math import isfinite
 from pathlib import Path
 from typing import Callable, TypedDict, Literal
@@ -11,8 +11,13 @@ from typing import Callable, TypedDict, Literal
 try:
     import nimporter
 except ImportError:
-    print("Couldn't import nimporter. Assuming that save_monger is available anyway.")
-from turing_complete_interface import save_monger
+    pass
+try:
+    from turing_complete_interface import save_monger
+except ImportError:
+    # No Nim build available, the pure Python codec reads and writes the same format
+    from turing_complete_interface import save_codec as save_monger
+from turing_complete_interface import save_codec
 
 Pos = tuple[int, int]
 
@@ -31,7 +36,7 @@ class NimPoint(TypedDict):
     y: int
 
 
-@dataclass
+@dataclass(slots=True)
 class GateReference:
     name: str
     pos: tuple[int, int]
@@ -85,7 +90,7 @@ class GateReference:
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class CircuitWire:
     id: int
     kind: str
@@ -149,6 +154,83 @@ class CircuitWire:
         return BIT_COLORS[self.color]
 
 
+class Connectivity:
+    """
+    Which wire endpoints are connected, as a union-find over integer ids of the positions.
+    Net ids are the ids of the root positions and stay valid until the next wire is added.
+
+    Wires appended to the wire list are picked up by `sync`, anything else (removing or changing wires)
+    needs `Circuit.invalidate_connectivity`.
+    """
+
+    def __init__(self):
+        self._ids: dict[Pos, int] = {}
+        self._positions: list[Pos] = []
+        self._parent: list[int] = []
+        self._size: list[int] = []
+        self._wires: list[CircuitWire] | None = None
+        self._wire_count = 0
+        self._members: dict[int, frozenset[Pos]] | None = None
+
+    def _id(self, p: Pos) -> int:
+        i = self._ids.get(p)
+        if i is None:
+            i = self._ids[p] = len(self._positions)
+            self._positions.append(p)
+            self._parent.append(i)
+            self._size.append(1)
+        return i
+
+    def _find(self, i: int) -> int:
+        parent = self._parent
+        while parent[i] != i:
+            parent[i] = i = parent[parent[i]]
+        return i
+
+    def add_wire(self, wire: CircuitWire):
+        if len(wire.positions) <= 1:
+            return
+        a, b = self._find(self._id(wire.positions[0])), self._find(self._id(wire.positions[-1]))
+        if a == b:
+            return
+        if self._size[a] < self._size[b]:
+            a, b = b, a
+        self._parent[b] = a
+        self._size[a] += self._size[b]
+        self._members = None
+
+    def sync(self, wires: list[CircuitWire]) -> Connectivity:
+        if wires is not self._wires or len(wires) < self._wire_count:
+            self.__init__()
+            self._wires = wires
+        for i in range(self._wire_count, len(wires)):
+            self.add_wire(wires[i])
+        self._wire_count = len(wires)
+        return self
+
+    def __contains__(self, p: Pos) -> bool:
+        return p in self._ids
+
+    def net_of(self, p: Pos) -> int | None:
+        i = self._ids.get(p)
+        return None if i is None else self._find(i)
+
+    def nets(self) -> dict[int, frozenset[Pos]]:
+        if self._members is None:
+            groups: defaultdict[int, list[Pos]] = defaultdict(list)
+            for i, p in enumerate(self._positions):
+                groups[self._find(i)].append(p)
+            self._members = {net: frozenset(ps) for net, ps in groups.items()}
+        return self._members
+
+    def members(self, net: int) -> frozenset[Pos]:
+        return self.nets()[net]
+
+    def connected_to(self, p: Pos) -> frozenset[Pos]:
+        net = self.net_of(p)
+        return frozenset() if net is None else self.nets()[net]
+
+
 @dataclass
 class Circuit:
     gates: list[GateReference]
@@ -166,13 +248,32 @@ class Circuit:
     shape: GateShape | None = None
     store_score: bool = False
     _raw_nim_data: dict = field(default_factory=dict)
+    _connectivity: Connectivity = field(default_factory=Connectivity, init=False, repr=False, compare=False)
+
+    @property
+    def dependencies(self) -> list[int]:
+        # The custom ids of the custom components used by this circuit, as stored in the save header
+        return self._raw_nim_data.get("dependencies", [])
 
     @classmethod
-    def parse(cls, text: bytes) -> Circuit:
-        data = save_monger.parse_state(list(text))
+    def parse(cls, text: bytes, meta_only: bool = False, compact: bool = False) -> Circuit:
+        # With meta_only, gates and wires are not decoded and left empty.
+        # With compact, they are kept in a `circuit_store.CircuitStore` instead of lists of objects
+        if save_monger is save_codec:
+            data = save_codec.parse_state(text, meta_only, lazy=compact)
+        else:
+            data = save_monger.parse_state(list(text), meta_only)
+        if compact:
+            from .circuit_store import CircuitStore, StoredGates, StoredWires
+            store = CircuitStore.from_nim(data["components"], data["wires"])
+            gates, wires = StoredGates(store), StoredWires(store)
+            data["components"] = data["wires"] = []
+        else:
+            gates = [GateReference.from_nim(**c) for c in data["components"]]
+            wires = [CircuitWire.from_nim(**c) for c in data["wires"]]
         return Circuit(
-            [GateReference.from_nim(**c) for c in data["components"]],
-            [CircuitWire.from_nim(**c) for c in data["wires"]],
+            gates,
+            wires,
             data["nand"],
             data["delay"],
             data["save_version"],
@@ -212,10 +313,26 @@ class Circuit:
         kwargs.setdefault("label", "")
         new_id = max((w.id for w in self.wires), default=1) + 1
         self.wires.append(w := CircuitWire(new_id, kind, positions=path, **kwargs))
+        self._connectivity.sync(self.wires)
         return w
 
+    def compacted(self) -> Circuit:
+        """ A copy with the gates and wires in a `circuit_store.CircuitStore` """
+        from .circuit_store import CircuitStore, StoredGates, StoredWires
+        store = CircuitStore()
+        for g in self.gates:
+            if g is not None:
+                store.add_gate_reference(g)
+        for w in self.wires:
+            store.add_circuit_wire(w)
+        return replace(self, gates=StoredGates(store), wires=StoredWires(store))
+
     def bounding_box(self, include_wires: bool = False):
         from turing_complete_interface.tc_components import get_component
+        from .circuit_store import StoredGates
+
+        if isinstance(self.gates, StoredGates) and (not include_wires or self.wires.store is self.gates.store):
+            return self.gates.store.bounding_box(include_wires)
 
         start_x, start_y = (200, 200)
         end_x, end_y = (-200, -200)
@@ -251,20 +368,15 @@ class Circuit:
             return start_x, start_y, end_x - start_x, end_y - start_y
 
     @property
-    def connections(self):
-        connections: defaultdict[Pos, set[Pos]] = defaultdict(set)
-        for wire in self.wires:
-            if len(wire.positions) > 1:
-                a, b = connections[wire.positions[0]], connections[wire.positions[-1]]
-                if a is b:
-                    continue
-                assert a.isdisjoint(b)
-                a.update({wire.positions[0], wire.positions[-1]})
-                a.update(b)
-                connections[wire.positions[-1]] = a
-                for p in b:
-                    connections[p] = a
-        return connections
+    def connectivity(self) -> Connectivity:
+        return self._connectivity.sync(self.wires)
+
+    def invalidate_connectivity(self):
+        self._connectivity = Connectivity()
+
+    @property
+    def connections(self) -> dict[Pos, frozenset[Pos]]:
+        return {p: ps for ps in self.connectivity.nets().values() for p in ps}
 
 
 @dataclass
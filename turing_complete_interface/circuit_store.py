@@ -0,0 +1,473 @@
+"""
+A compact representation of the gates and wires of a `Circuit`, for saves too large to hold as lists of
+`GateReference` and `CircuitWire`:
+
+    circuit = Circuit.parse(data, compact=True)
+
+Every field is kept in a typed `array`, and all wire paths share one flat int16 buffer of x, y pairs,
+addressed by a start and a length per wire. `circuit.gates` and `circuit.wires` are then `StoredGates` and
+`StoredWires`, which hand out `GateView` and `WireView`: subclasses of `GateReference` and `CircuitWire`
+that read and write the arrays, so the rest of the library works with them unchanged.
+"""
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_right
+from itertools import compress, repeat
+from operator import add, le, ge, and_, eq
+from typing import Iterable, MutableSequence, Sequence, Any
+
+from .circuit_parser import GateReference, CircuitWire, Pos
+
+WIRE_KINDS = ("ck_bit", "ck_byte", "ck_qword")
+_WIRE_KIND_IDS = {k: i for i, k in enumerate(WIRE_KINDS)}
+_NIM_WIRE_KINDS = {"wk_1": 0, "wk_8": 1, "wk_64": 2}
+
+
+class CircuitStore:
+    def __init__(self):
+        # Strings that repeat a lot (component kinds, custom data) are stored once and referenced by index
+        self.strings: list[str] = [""]
+        self._string_ids: dict[str, int] = {"": 0}
+
+        self.gate_kind = array("H")
+        self.gate_x = array("h")
+        self.gate_y = array("h")
+        self.gate_rotation = array("B")
+        self.gate_id = array("q")
+        self.gate_custom_data = array("I")
+        self.gate_custom_id = array("q")
+        # Rarely set, so only stored for the gates that have them
+        self.gate_program_name: dict[int, str] = {}
+        self.gate_real_offset: dict[int, int] = {}
+
+        self.wire_id = array("q")
+        self.wire_kind = array("B")
+        self.wire_color = array("B")
+        self.wire_label: dict[int, str] = {}
+        self.wire_start = array("Q")  # index of the first point in `path`
+        self.wire_length = array("I")
+        self.path = array("h")  # x0, y0, x1, y1, ...
+        # Points in `path` that no wire uses anymore, after paths were replaced
+        self._garbage = 0
+        self._gate_rects: tuple[array, array, array, array] | None = None
+
+    def string_id(self, s: str) -> int:
+        i = self._string_ids.get(s)
+        if i is None:
+            i = self._string_ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def add_gate(self, name: str, pos: Pos, rotation: int, id: int, custom_data: str = "", custom_id: int = 0,
+                 program_name: str = "", real_offset: int = 0) -> int:
+        i = len(self.gate_kind)
+        self.gate_kind.append(self.string_id(name))
+        self.gate_x.append(pos[0])
+        self.gate_y.append(pos[1])
+        self.gate_rotation.append(rotation)
+        self.gate_id.append(int(id))
+        self.gate_custom_data.append(self.string_id(custom_data or ""))
+        self.gate_custom_id.append(custom_id or 0)
+        if program_name:
+            self.gate_program_name[i] = program_name
+        if real_offset:
+            self.gate_real_offset[i] = real_offset
+        self._gate_rects = None
+        return i
+
+    def add_gate_reference(self, gate: GateReference) -> int:
+        return self.add_gate(gate.name, gate.pos, gate.rotation, gate.id, gate.custom_data, gate.custom_id,
+                             gate.program_name, gate.real_offset)
+
+    def _add_path(self, positions: Iterable[Pos]) -> tuple[int, int]:
+        start = len(self.path) // 2
+        for x, y in positions:
+            self.path.append(x)
+            self.path.append(y)
+        return start, len(self.path) // 2 - start
+
+    def add_wire(self, id: int, kind: str, color: int, label: str, positions: Iterable[Pos]) -> int:
+        i = len(self.wire_id)
+        self.wire_id.append(id)
+        self.wire_kind.append(_WIRE_KIND_IDS[kind])
+        self.wire_color.append(color)
+        if label:
+            self.wire_label[i] = label
+        start, length = self._add_path(positions)
+        self.wire_start.append(start)
+        self.wire_length.append(length)
+        return i
+
+    def add_circuit_wire(self, wire: CircuitWire) -> int:
+        return self.add_wire(wire.id, wire.kind, wire.color, wire.label, wire.positions)
+
+    def set_path(self, i: int, positions: Iterable[Pos]):
+        positions = list(positions)
+        if len(positions) <= self.wire_length[i]:
+            start = self.wire_start[i]
+            for j, (x, y) in enumerate(positions):
+                self.path[2 * (start + j)] = x
+                self.path[2 * (start + j) + 1] = y
+            self._garbage += self.wire_length[i] - len(positions)
+            self.wire_length[i] = len(positions)
+        else:
+            self._garbage += self.wire_length[i]
+            self.wire_start[i], self.wire_length[i] = self._add_path(positions)
+
+    def compact(self):
+        """ Drops the points of replaced paths, so that `path` holds the wires in order again """
+        if not self._garbage:
+            return
+        path = array("h")
+        for i, (start, length) in enumerate(zip(self.wire_start, self.wire_length)):
+            self.wire_start[i] = len(path) // 2
+            path.extend(self.path[2 * start:2 * (start + length)])
+        self.path = path
+        self._garbage = 0
+
+    @classmethod
+    def from_nim(cls, components: Iterable[dict[str, Any]], wires: Iterable[dict[str, Any]]) -> CircuitStore:
+        """ From the dicts of `save_monger.parse_state` (best with `save_codec.parse_state(..., lazy=True)`) """
+        from .circuit_parser import save_monger
+
+        store = cls()
+        for c in components:
+            if save_monger.is_virtual(c["kind"]):
+                continue
+            store.add_gate(c["kind"], (c["position"]["x"], c["position"]["y"]), c["rotation"], c["permanent_id"],
+                           c["custom_string"], c["custom_id"], c["program_name"], c.get("real_offset", 0))
+        for w in wires:
+            store.add_wire(0, WIRE_KINDS[_NIM_WIRE_KINDS[w["kind"]]], w["color"], w["comment"],
+                           ((p["x"], p["y"]) for p in w["path"]))
+        return store
+
+    def nbytes(self) -> int:
+        """ The size of the arrays, not counting the shared strings and the sparse dicts """
+        arrays = (self.gate_kind, self.gate_x, self.gate_y, self.gate_rotation, self.gate_id,
+                  self.gate_custom_data, self.gate_custom_id, self.wire_id, self.wire_kind, self.wire_color,
+                  self.wire_start, self.wire_length, self.path)
+        return sum(a.itemsize * len(a) for a in arrays)
+
+    # The geometric queries below work on whole arrays through map/compress, without a Python loop per item
+
+    def gate_rects(self) -> tuple[array, array, array, array]:
+        """
+        Per gate, the top left and the bottom right corner of its shape's bounding box, with the
+        same corner convention as `Circuit.bounding_box`: the translated (x, y) and (x + w, y + h).
+        """
+        if self._gate_rects is not None:
+            return self._gate_rects
+        from .tc_components import get_component
+
+        # One offset per distinct kind, custom data and rotation
+        codes: dict[tuple[int, int, int, int], int] = {}
+        offsets: list[tuple[int, int, int, int]] = []
+        gate_codes = array("I")
+        for kind, custom_data, custom_id, rotation in zip(self.gate_kind, self.gate_custom_data,
+                                                          self.gate_custom_id, self.gate_rotation):
+            key = kind, custom_data, custom_id, rotation
+            code = codes.get(key)
+            if code is None:
+                name = self.strings[kind]
+                shape = get_component(name, self.strings[custom_data] if name != "Custom" else custom_id,
+                                      no_node=True)[0]
+                x, y, w, h = shape.bounding_box
+                probe = GateReference(name, (0, 0), rotation, 0)
+                code = codes[key] = len(offsets)
+                offsets.append((*probe.translate((x, y)), *probe.translate((x + w, y + h))))
+            gate_codes.append(code)
+        rects = []
+        for k, coordinates in enumerate((self.gate_x, self.gate_y, self.gate_x, self.gate_y)):
+            column = array("h", (o[k] for o in offsets))
+            rects.append(array("i", map(add, coordinates, map(column.__getitem__, gate_codes))))
+        self._gate_rects = tuple(rects)
+        return self._gate_rects
+
+    def bounding_box(self, include_wires: bool = False) -> tuple[int, int, int, int]:
+        # Same result as `Circuit.bounding_box`, including starting from (200, 200) and (-200, -200)
+        start_x, start_y, end_x, end_y = 200, 200, -200, -200
+        if len(self.gate_kind):
+            x0, y0, x1, y1 = self.gate_rects()
+            start_x, start_y, end_x, end_y = min(start_x, min(x0)), min(start_y, min(y0)), \
+                max(end_x, max(x1)), max(end_y, max(y1))
+        if include_wires and len(self.path):
+            self.compact()
+            xs, ys = self.path[0::2], self.path[1::2]
+            start_x, start_y, end_x, end_y = min(start_x, min(xs)), min(start_y, min(ys)), \
+                max(end_x, max(xs)), max(end_y, max(ys))
+        if 200 == end_x == end_y == start_x == start_y:
+            return 0, 0, 0, 0
+        return start_x, start_y, end_x - start_x, end_y - start_y
+
+    def gates_at(self, x: int, y: int) -> list[int]:
+        """ The indices of the gates whose bounding box contains the point """
+        x0, y0, x1, y1 = self.gate_rects()
+        n = len(x0)
+        mask = map(and_, map(and_, map(le, x0, repeat(x, n)), map(le, y0, repeat(y, n))),
+                   map(and_, map(ge, x1, repeat(x, n)), map(ge, y1, repeat(y, n))))
+        return list(compress(range(n), mask))
+
+    def wires_at(self, x: int, y: int) -> list[int]:
+        """ The indices of the wires that have a point at (x, y) """
+        self.compact()
+        xs, ys = self.path[0::2], self.path[1::2]
+        n = len(xs)
+        points = compress(range(n), map(and_, map(eq, xs, repeat(x, n)), map(eq, ys, repeat(y, n))))
+        wires = []
+        for p in points:
+            i = bisect_right(self.wire_start, p) - 1
+            # Wires with an empty path share their start with the next one
+            while self.wire_length[i] == 0 or p >= self.wire_start[i] + self.wire_length[i]:
+                i -= 1
+            if not wires or wires[-1] != i:
+                wires.append(i)
+        return wires
+
+
+class GateView(GateReference):
+    """ A gate of a `CircuitStore`, changes are written back into it """
+    __slots__ = ("_store", "_i")
+
+    def __init__(self, store: CircuitStore, i: int):
+        self._store = store
+        self._i = i
+
+    def __repr__(self):
+        return (f"GateView(name={self.name!r}, pos={self.pos!r}, rotation={self.rotation!r}, id={self.id!r}, "
+                f"custom_data={self.custom_data!r}, custom_id={self.custom_id!r})")
+
+    def __eq__(self, other):
+        if not isinstance(other, GateReference):
+            return NotImplemented
+        return (self.name, self.pos, self.rotation, self.id, self.custom_data, self.custom_id, self.program_name,
+                self.real_offset) == (other.name, other.pos, other.rotation, other.id, other.custom_data,
+                                      other.custom_id, other.program_name, other.real_offset)
+
+    @property
+    def name(self) -> str:
+        return self._store.strings[self._store.gate_kind[self._i]]
+
+    @name.setter
+    def name(self, value: str):
+        self._store.gate_kind[self._i] = self._store.string_id(value)
+        self._store._gate_rects = None
+
+    @property
+    def pos(self) -> Pos:
+        return self._store.gate_x[self._i], self._store.gate_y[self._i]
+
+    @pos.setter
+    def pos(self, value: Pos):
+        self._store.gate_x[self._i], self._store.gate_y[self._i] = value
+        self._store._gate_rects = None
+
+    @property
+    def rotation(self) -> int:
+        return self._store.gate_rotation[self._i]
+
+    @rotation.setter
+    def rotation(self, value: int):
+        self._store.gate_rotation[self._i] = value
+        self._store._gate_rects = None
+
+    @property
+    def id(self) -> int:
+        return self._store.gate_id[self._i]
+
+    @id.setter
+    def id(self, value: int):
+        self._store.gate_id[self._i] = int(value)
+
+    @property
+    def custom_data(self) -> str:
+        return self._store.strings[self._store.gate_custom_data[self._i]]
+
+    @custom_data.setter
+    def custom_data(self, value: str):
+        self._store.gate_custom_data[self._i] = self._store.string_id(value)
+        self._store._gate_rects = None
+
+    @property
+    def custom_id(self) -> int:
+        return self._store.gate_custom_id[self._i]
+
+    @custom_id.setter
+    def custom_id(self, value: int):
+        self._store.gate_custom_id[self._i] = value
+        self._store._gate_rects = None
+
+    @property
+    def program_name(self) -> str:
+        return self._store.gate_program_name.get(self._i, "")
+
+    @program_name.setter
+    def program_name(self, value: str):
+        self._store.gate_program_name[self._i] = value
+
+    @property
+    def real_offset(self) -> int:
+        return self._store.gate_real_offset.get(self._i, 0)
+
+    @real_offset.setter
+    def real_offset(self, value: int):
+        self._store.gate_real_offset[self._i] = value
+
+
+class PathView(Sequence):
+    """ The positions of one wire, read from the flat path buffer """
+    __slots__ = ("_store", "_i")
+
+    def __init__(self, store: CircuitStore, i: int):
+        self._store = store
+        self._i = i
+
+    def __len__(self):
+        return self._store.wire_length[self._i]
+
+    def __getitem__(self, index):
+        length = self._store.wire_length[self._i]
+        if isinstance(index, slice):
+            return [self[j] for j in range(*index.indices(length))]
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError(index)
+        j = 2 * (self._store.wire_start[self._i] + index)
+        return self._store.path[j], self._store.path[j + 1]
+
+    def __iter__(self):
+        start = 2 * self._store.wire_start[self._i]
+        coordinates = self._store.path[start:start + 2 * self._store.wire_length[self._i]]
+        return zip(coordinates[0::2], coordinates[1::2])
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class WireView(CircuitWire):
+    """ A wire of a `CircuitStore`, changes are written back into it """
+    __slots__ = ("_store", "_i")
+
+    def __init__(self, store: CircuitStore, i: int):
+        self._store = store
+        self._i = i
+
+    def __repr__(self):
+        return (f"WireView(id={self.id!r}, kind={self.kind!r}, color={self.color!r}, label={self.label!r}, "
+                f"positions={self.positions!r})")
+
+    def __eq__(self, other):
+        if not isinstance(other, CircuitWire):
+            return NotImplemented
+        return ((self.id, self.kind, self.color, self.label, list(self.positions)) ==
+                (other.id, other.kind, other.color, other.label, list(other.positions)))
+
+    @property
+    def id(self) -> int:
+        return self._store.wire_id[self._i]
+
+    @id.setter
+    def id(self, value: int):
+        self._store.wire_id[self._i] = value
+
+    @property
+    def kind(self) -> str:
+        return WIRE_KINDS[self._store.wire_kind[self._i]]
+
+    @kind.setter
+    def kind(self, value: str):
+        self._store.wire_kind[self._i] = _WIRE_KIND_IDS[value]
+
+    @property
+    def color(self) -> int:
+        return self._store.wire_color[self._i]
+
+    @color.setter
+    def color(self, value: int):
+        self._store.wire_color[self._i] = value
+
+    @property
+    def label(self) -> str:
+        return self._store.wire_label.get(self._i, "")
+
+    @label.setter
+    def label(self, value: str):
+        self._store.wire_label[self._i] = value
+
+    @property
+    def positions(self) -> PathView:
+        return PathView(self._store, self._i)
+
+    @positions.setter
+    def positions(self, value: Iterable[Pos]):
+        self._store.set_path(self._i, value)
+
+
+class _StoredSequence(MutableSequence):
+    # Appending adds to the store. Items can be replaced, but not removed or inserted.
+    _view: type
+
+    def __init__(self, store: CircuitStore):
+        self.store = store
+
+    def _count(self) -> int:
+        raise NotImplementedError
+
+    def _add(self, item):
+        raise NotImplementedError
+
+    def __len__(self):
+        return self._count()
+
+    def __getitem__(self, index):
+        n = self._count()
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(n))]
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError(index)
+        return self._view(self.store, index)
+
+    def __iter__(self):
+        view, store = self._view, self.store
+        return (view(store, i) for i in range(self._count()))
+
+    def __setitem__(self, index, value):
+        view = self[index]
+        for name in value.__dataclass_fields__:
+            setattr(view, name, getattr(value, name))
+
+    def __delitem__(self, index):
+        raise TypeError(f"Can't remove from {type(self).__name__}")
+
+    def insert(self, index, value):
+        if index < self._count():
+            raise TypeError(f"{type(self).__name__} can only be appended to")
+        self._add(value)
+
+
+class StoredGates(_StoredSequence):
+    _view = GateView
+
+    def _count(self) -> int:
+        return len(self.store.gate_kind)
+
+    def _add(self, gate: GateReference):
+        self.store.add_gate_reference(gate)
+
+
+class StoredWires(_StoredSequence):
+    _view = WireView
+
+    def _count(self) -> int:
+        return len(self.store.wire_id)
+
+    def _add(self, wire: CircuitWire):
+        self.store.add_circuit_wire(wire)
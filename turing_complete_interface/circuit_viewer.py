@@ -3,8 +3,10 @@ import json
 import os
 from abc import ABC, abstractmethod
 from argparse import ArgumentParser
+from collections import OrderedDict
+from contextlib import nullcontext
 from dataclasses import dataclass, field
-from graphlib import CycleError
+from math import floor
 from pathlib import Path
 from pprint import pprint
 from typing import Callable, Sequence
@@ -19,10 +21,13 @@ from turing_complete_interface.tc_assembler import assemble
 from turing_complete_interface.verilog_parser import parse_verilog
 from .circuit_compiler import build_gate
 from .tc_components import screens, AsciiScreen, get_component, compute_gate_shape
-from . import tc_components
+from . import tc_components, compile_cache
 from .circuit_parser import CircuitWire, Circuit, GateShape, GateReference, SCHEMATICS_PATH, Pos
 from .logic_nodes import file_safe_name, LogicNodeType
 from .specification_tester import BitsInput
+from .spatial_index import CircuitIndex
+from .simulation_worker import SimulationWorker, Snapshot
+from .waveform import WaveformRecorder
 from .world_view import WorldView
 
 BIT_COLORS = {
@@ -100,18 +105,26 @@ class FastBotTurtle(WorldHandler):
             self.line.append(self.pos)
 
 
+TILE_SIZE = 256  # screen pixels
+MAX_TILES = 256
+DETAIL_SCALE = 8  # screen pixels per world unit below which text, pins and wire ends are not drawn
+
+
 @dataclass(kw_only=True)
 class CircuitView(WorldView):
     circuit: Circuit
-    annotations: dict[tuple[int, int], str] = field(default_factory=dict)
     space: Space | None = None
+    _index: CircuitIndex | None = field(default=None, init=False, repr=False)
+    # The static layer, cut into tiles of TILE_SIZE screen pixels, only valid for `_tiles_key`
+    _tiles: OrderedDict[tuple[int, int], pg.Surface] = field(default_factory=OrderedDict, init=False, repr=False)
+    _tiles_key: tuple | None = field(default=None, init=False, repr=False)
 
-    def draw_gate(self, gate: GateReference, gate_shape: GateShape,
-                  wire_values: dict = None, highlight: bool = False):
-        pos = gate.pos
-        if wire_values is None:
-            wire_values = {}
+    @property
+    def detailed(self) -> bool:
+        return min(self.scale_x, self.scale_y) >= DETAIL_SCALE
 
+    def draw_gate(self, gate: GateReference, gate_shape: GateShape):
+        pos = gate.pos
         if gate_shape.big_shape is not None:
             tl = gate.translate(gate_shape.big_shape.tl)
             size = gate.rot(gate_shape.big_shape.size)
@@ -126,24 +139,20 @@ class CircuitView(WorldView):
         for dp in gate_shape.blocks:
             p = gate.translate(dp)
             self.draw.rect(gate_shape.color, (p[0] - 0.5, p[1] - 0.5, 1, 1))
-            self.annotations[p] = f"{gate.id}"
+        if not self.detailed:
+            return
         for name, p in gate_shape.pins.items():
             xy = gate.translate(p.pos)
-            if gate_shape.is_io:
-                pin_source = None, str(gate.id)
-                if pin_source not in wire_values:
-                    pin_source = None, f"{gate.id}.{name}"
-            else:
-                pin_source = str(gate.id), name
-            value = wire_values.get(pin_source, bitarray())
             self.draw.circle((255 * p.is_byte, 255 * p.is_delayed, 255 * p.is_input),
                              xy, 0.25)
-            self.annotations[xy] = f"{gate.id}.{name}: {value.to01()[::-1]}"
-        self.draw.text((255, 255, 255), pos, gate_shape.text(gate), size=1,
-                       background=((255, 0, 0) if highlight else None))
+        self.draw.text((255, 255, 255), pos, gate_shape.text(gate), size=1)
 
     def draw_wire(self, wire):
         color = wire.screen_color
+        if not self.detailed:
+            if len(wire.positions) > 1:
+                self.draw.lines(color, False, wire.positions, 0.5)
+            return
         if len(wire.positions) > 2:
             self.draw.lines(color, False, wire.positions, 0.5)
         if len(wire.positions) == 2:
@@ -162,35 +171,103 @@ class CircuitView(WorldView):
                 pos = wire.positions[mid]
             self.draw.text((255, 255, 255), pos, str(wire.label), angle=dr.angle_to((1, 0)))
 
-    def draw_background(self):
-        for i in range(self.space.w // 8):
-            for j in range(self.space.w // 8):
+    def draw_background(self, visible: tuple[float, float, float, float]):
+        x0, y0, x1, y1 = visible
+        n = self.space.w // 8
+        for i in range(max(0, int((x0 - self.space.x) // 8)), min(n, int((x1 - self.space.x) // 8) + 1)):
+            for j in range(max(0, int((y0 - self.space.y) // 8)), min(n, int((y1 - self.space.y) // 8) + 1)):
                 if (i + j) % 2 == 1:
                     c = (65, 65, 65)
                     self.draw.rect(c, (self.space.x + i * 8 + 0.5, self.space.y + j * 8 + 0.5, 8, 8))
         self.draw.rect((255, 0, 0), (self.space.x - 0.5, self.space.y - 0.5, self.space.w, self.space.h), width=1)
 
-    def draw_circuit(self, wire_values=None, cycle=None, connections=None):
-
+    @property
+    def index(self) -> CircuitIndex:
+        if self._index is None or not self._index.is_current(self.circuit):
+            self._index = CircuitIndex(self.circuit)
+        return self._index
+
+    def draw_static(self):
+        # Everything that doesn't depend on the simulation, for the part of the world on the screen
+        self.screen.fill((127, 127, 127))
+        # Gate texts and wire labels stick out of their bounding boxes a bit
+        visible = self.visible_rect(margin=4)
         if self.space is not None:
-            self.draw_background()
-
-        for wire in self.circuit.wires:
+            self.draw_background(visible)
+        index = self.index
+        for wire in index.wires_in(*visible):
             self.draw_wire(wire)
-        for gate in self.circuit.gates:
-            shape, _ = get_component(gate.name, gate.custom_data if gate.name != "Custom" else gate.custom_id, True)
-            self.draw_gate(gate, shape, wire_values, (gate.id in cycle if cycle else False))
+        for gate, shape in index.gates_in(*visible):
+            self.draw_gate(gate, shape)
+
+    def _render_tile(self, tx: int, ty: int) -> pg.Surface:
+        tile = pg.Surface((TILE_SIZE, TILE_SIZE))
+        screen, offset = self.screen, (self.offset_x, self.offset_y)
+        self.screen = tile
+        self.offset_x, self.offset_y = -tx * TILE_SIZE / self.scale_x, -ty * TILE_SIZE / self.scale_y
+        try:
+            self.draw_static()
+        finally:
+            self.screen = screen
+            self.offset_x, self.offset_y = offset
+        return tile
+
+    def blit_static(self):
+        # Panning only changes which tiles are needed, zooming or changing the circuit throws them all away
+        key = (self.scale_x, self.scale_y, self.index, id(self.space))
+        if key != self._tiles_key:
+            self._tiles.clear()
+            self._tiles_key = key
+        ox, oy = self.offset_x * self.scale_x, self.offset_y * self.scale_y
+        w, h = self.screen.get_size()
+        for tx in range(floor(-ox / TILE_SIZE), floor((w - ox) / TILE_SIZE) + 1):
+            for ty in range(floor(-oy / TILE_SIZE), floor((h - oy) / TILE_SIZE) + 1):
+                tile = self._tiles.get((tx, ty))
+                if tile is None:
+                    tile = self._tiles[tx, ty] = self._render_tile(tx, ty)
+                    if len(self._tiles) > MAX_TILES:
+                        self._tiles.popitem(last=False)
+                else:
+                    self._tiles.move_to_end((tx, ty))
+                self.screen.blit(tile, (floor(tx * TILE_SIZE + ox), floor(ty * TILE_SIZE + oy)))
+
+    def annotation(self, p: Pos, wire_values: dict = None) -> str | None:
+        if wire_values is None:
+            wire_values = {}
+        for gate, shape in self.index.gates_in(*p, *p):
+            for name, pin in shape.pins.items():
+                if gate.translate(pin.pos) != p:
+                    continue
+                if shape.is_io:
+                    pin_source = None, str(gate.id)
+                    if pin_source not in wire_values:
+                        pin_source = None, f"{gate.id}.{name}"
+                else:
+                    pin_source = str(gate.id), name
+                value = wire_values.get(pin_source, bitarray())
+                return f"{gate.id}.{name}: {value.to01()[::-1]}"
+            if any(gate.translate(dp) == p for dp in shape.blocks):
+                return f"{gate.id}"
+        return None
+
+    def draw_circuit(self, wire_values=None, cycle=None, connections=None):
+        self.blit_static()
+
+        index = self.index
+        if cycle:
+            for gate, shape in index.gates_in(*self.visible_rect(margin=4)):
+                if gate.id in cycle:
+                    self.draw.text((255, 255, 255), gate.pos, shape.text(gate), size=1, background=(255, 0, 0))
         # shape = compute_gate_shape(circuit, "main")
         # draw_gate(view, GateReference("main", (0,0), 0, "-1", ""), shape)
         p = self.s2w(pg.mouse.get_pos())
         p = int(round(p[0])), int(round(p[1]))
-        connections = connections or self.circuit.connections
-        if p in connections:
-            for q in connections[p]:
-                self.draw.circle((255, 255, 0), q, 0.75)
+        connected = connections.get(p, ()) if connections else self.circuit.connectivity.connected_to(p)
+        for q in connected:
+            self.draw.circle((255, 255, 0), q, 0.75)
 
         self.draw.text((0, 0, 0), p, str(p), anchor="bottomleft", background=(127, 127, 127))
-        if t := self.annotations.get(p, None):
+        if t := self.annotation(p, wire_values):
             self.draw.text((0, 0, 0), p, t, anchor="topleft", background=(127, 127, 127))
 
 
@@ -258,11 +335,13 @@ class ExtraWindow:
 
 
 class Simulator(tk.Tk, ExtraWindow):
-    def __init__(self, node: LogicNodeType, output_handler: WorldHandler):
+    def __init__(self, node: LogicNodeType, output_handler: WorldHandler, recorder: WaveformRecorder = None):
         super(Simulator, self).__init__()
         self.node = node
-        self.current_state = node.create_state()
         self.output_handler = output_handler
+        self.worker = SimulationWorker(node, output_handler, recorder)
+        self._sent_inputs: dict[str, int] = {}
+        self._shown_cycle = -1
 
         self.bit_widgets: dict[str, BitsInput] = {}
         i = 0
@@ -274,31 +353,43 @@ class Simulator(tk.Tk, ExtraWindow):
             w = self.bit_widgets[name] = BitsInput(self, name, pin.bits, locked=True)
             w.grid(column=0, row=i)
             i += 1
+        self.worker.start()
 
-    def step(self):
-        args = {}
+    def _send_inputs(self):
+        changed = {}
         for name in self.node.inputs:
-            args[name] = self.bit_widgets[name].value
-        if self.output_handler is not None:
-            args["3.value"] = self.output_handler.get_input()
-        try:
-            new_state, values, wire_values = self.node.calculate(self.state, **args)
-        except CycleError as e:
-            print(e)
-            return {}, [exe.node for exe in e.args[-1]]
-        for name, v in values.items():
-            self.bit_widgets[name].value = v
-        if self.output_handler is not None:
-            if values["3.control"]:
-                self.output_handler.took_input()
-            if values["4.control"]:
-                self.output_handler.got_output(values["4.value"])
-        self.state = new_state
-        return wire_values, None
+            v = self.bit_widgets[name].value
+            if self._sent_inputs.get(name) != v:
+                changed[name] = self._sent_inputs[name] = v
+        if changed:
+            self.worker.set_inputs(**changed)
+
+    def step(self):
+        self._send_inputs()
+        self.worker.step()
+
+    def toggle_running(self):
+        self._send_inputs()
+        self.worker.toggle()
+
+    def poll(self) -> Snapshot:
+        self._send_inputs()
+        snapshot = self.worker.snapshot
+        if snapshot.cycle != self._shown_cycle:
+            self._shown_cycle = snapshot.cycle
+            for name, v in snapshot.output_ints().items():
+                self.bit_widgets[name].value = v
+            if snapshot.error is not None:
+                print(snapshot.error)
+        return snapshot
 
     def extra_update(self) -> bool:
         self.update()
 
+    def destroy(self):
+        self.worker.stop(1)
+        super(Simulator, self).destroy()
+
 
 @dataclass
 class Selector(ABC):
@@ -408,7 +499,6 @@ class CircuitManager:
             #     else:
             #         output_handler.draw(screen)
             # else:
-            self.main.screen.fill((127, 127, 127))
             self.main.draw_circuit()
             pg.display.update()
             if self.selector is None:
@@ -426,7 +516,8 @@ class CircuitManager:
         return s
 
 
-def view_circuit(circuit, node, space, output_handler: Callable[[pg.Surface], WorldHandler] = None):
+def view_circuit(circuit, node, space, output_handler: Callable[[pg.Surface], WorldHandler] = None,
+                 recorder: WaveformRecorder = None):
     W, H = 640, 480
     # sdl_frame = tk.Frame(root, width=W, height=H)
     # sdl_frame.grid(column=1, row=0, rowspan=max(i, 1))
@@ -434,8 +525,6 @@ def view_circuit(circuit, node, space, output_handler: Callable[[pg.Surface], Wo
     # os.environ["SDL_WINDOWID"] = str(sdl_frame.winfo_id())
     # wire_values = {}
 
-    connections = circuit.connections
-
     pg.init()
     FLAGS = pg.RESIZABLE
     FONT_SIZE = 30
@@ -447,13 +536,21 @@ def view_circuit(circuit, node, space, output_handler: Callable[[pg.Surface], Wo
     W, H = screen.get_size()
     view = CircuitView.centered(screen, space=space, scale_x=40, circuit=circuit)
 
-    cycle = None
+    wire_values = cycle = None
+    status = ""
     pg.key.set_repeat(100, 50)
 
     if node is not None:
-        simulator = Simulator(node, output_handler)
+        simulator = Simulator(node, output_handler, recorder)
     else:
         simulator = None
+    # The simulation thread calls the output handler as well
+    io_lock = simulator.worker.io_lock if simulator is not None else nullcontext()
+
+    def handle_output_event(event: pg.event.Event):
+        with io_lock:
+            return output_handler.handle_event(event)
+
     show_circuit = True
 
     clock = pg.time.Clock()
@@ -478,19 +575,27 @@ def view_circuit(circuit, node, space, output_handler: Callable[[pg.Surface], Wo
                     W, H = screen.get_size()
                 case event if show_circuit and view.handle_event(event):
                     pass
-                case event if not show_circuit and output_handler and output_handler.handle_event(event):
+                case event if not show_circuit and output_handler and handle_output_event(event):
                     pass
                 case Event(type=pg.KEYDOWN, key=pg.K_RETURN):
                     show_circuit = not show_circuit
+                # Function keys, because the Keyboard components get every key that has a byte value
+                case Event(type=pg.KEYDOWN, key=pg.K_F5) if simulator is not None:
+                    simulator.step()
+                case Event(type=pg.KEYDOWN, key=pg.K_F6) if simulator is not None:
+                    simulator.toggle_running()
                 case Event(type=pg.KEYDOWN, key=key):
                     tc_components.last_key = key % 256
         # Logic
         dt = clock.tick()
         view.update(dt)
-        if pg.key.get_pressed()[pg.K_SPACE]:
-            wire_values, cycle = simulator.step()
+        if simulator is not None:
+            snapshot = simulator.poll()
+            wire_values, cycle = snapshot.values, snapshot.cycle_nodes
+            status = f" | cycle {snapshot.cycle} | {snapshot.cycles_per_second:.1f} cycles/sec"
         if output_handler is not None:
-            output_handler.update(dt)
+            with io_lock:
+                output_handler.update(dt)
 
         # Render
         if not show_circuit:
@@ -514,12 +619,14 @@ def view_circuit(circuit, node, space, output_handler: Callable[[pg.Surface], Wo
                                 t = font.render(chr(ch), True, col)
                                 screen.blit(t, (x * (FONT_SIZE), y * (FONT_SIZE)))
             else:
-                output_handler.draw(screen)
+                with io_lock:
+                    output_handler.draw(screen)
         else:
-            view.screen.fill((127, 127, 127))
-            view.draw_circuit()
+            view.draw_circuit(wire_values, cycle)
         pg.display.update()
-        pg.display.set_caption(f"FPS: {clock.get_fps():.2f}")
+        pg.display.set_caption(f"FPS: {clock.get_fps():.2f}{status}")
+    if simulator is not None:
+        simulator.worker.stop(1)
 
 
 if __name__ == '__main__':
@@ -533,8 +640,15 @@ if __name__ == '__main__':
     arg_parser.add_argument("-v", "--verilog", action="store", type=Path)
     arg_parser.add_argument("--fast-bot-turtle", action="store_true")
     arg_parser.add_argument("--observe", action="store_true")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Don't use the compile cache for custom components")
+    arg_parser.add_argument("--vcd", action="store", type=Path,
+                            help="Record the simulation into this VCD file (gzipped if it ends with .gz)")
+    arg_parser.add_argument("--trace", action="append",
+                            help="Glob pattern over the signal paths to record with --vcd, default all")
 
     ns = arg_parser.parse_args()
+    if ns.no_cache:
+        compile_cache.enabled = False
     if ns.level is None and SCHEMATICS_PATH is not None:
         options = [d.name for d in SCHEMATICS_PATH.iterdir() if d.is_dir()]
         ns.level = prompt("Enter level name> ", completer=FuzzyCompleter(WordCompleter(options, sentence=True)))
@@ -551,5 +665,8 @@ if __name__ == '__main__':
                         options.append(actual_level.stem + "/" + assembly.stem)
         ns.assembly = prompt("Enter assembly name> ", completer=FuzzyCompleter(WordCompleter(options, sentence=True)))
 
-    view_circuit(*load_circuit(ns),
-                 FastBotTurtle if ns.fast_bot_turtle else None)
+    circuit, node, space = load_circuit(ns)
+    if ns.vcd is not None and node is None:
+        arg_parser.error("--vcd needs a simulated circuit, which saves aren't yet, use --verilog")
+    with WaveformRecorder(node, ns.vcd, ns.trace or ("*",)) if ns.vcd is not None else nullcontext() as recorder:
+        view_circuit(circuit, node, space, FastBotTurtle if ns.fast_bot_turtle else None, recorder)
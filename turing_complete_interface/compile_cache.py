@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import hashlib
+import io
+import os
+import pickle
+import sys
+from dataclasses import dataclass, field
+from functools import cache
+from pathlib import Path
+from typing import Iterable
+
+from .logic_nodes import LogicNodeType, DirectLogicNodeType, builtins_gates, build_or
+
+CACHE_FORMAT = 2
+DEFAULT_MAX_SIZE = 256 * 2 ** 20
+
+# Set to False (e.g. via `--no-cache`) or set the environment variable TCI_NO_CACHE to bypass the cache
+enabled: bool = not os.environ.get("TCI_NO_CACHE")
+
+
+@cache
+def library_version() -> str:
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+        return version("turing_complete_interface")
+    except PackageNotFoundError:
+        return "dev"
+
+
+def get_cache_path() -> Path | None:
+    if "TCI_CACHE_DIR" in os.environ:
+        return Path(os.environ["TCI_CACHE_DIR"])
+    match sys.platform.lower():
+        case "windows" | "win32":
+            base = Path(os.environ.get("LOCALAPPDATA", "~/AppData/Local")).expanduser()
+        case "darwin":
+            base = Path("~/Library/Caches").expanduser()
+        case "linux":
+            base = Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")).expanduser()
+        case _:
+            return None
+    return base / "turing_complete_interface"
+
+
+def cache_key(data: bytes, name: str, dependencies: Iterable[str] = ()) -> str:
+    h = hashlib.sha256()
+    h.update(f"{CACHE_FORMAT}|{library_version()}|{name}|".encode())
+    for dep in sorted(dependencies):
+        h.update(dep.encode())
+    h.update(b"|")
+    h.update(data)
+    return h.hexdigest()
+
+
+class _NodePickler(pickle.Pickler):
+    # Library nodes are stored as references and rebuilt on load: they contain closures and
+    # are not picklable, and they belong to the library version anyway, not to the cached circuit.
+    def __init__(self, file, root: LogicNodeType):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.root = root
+
+    def persistent_id(self, obj):
+        if obj is self.root or not isinstance(obj, LogicNodeType):
+            return None
+        from .tc_components import rev_components, spec_components
+
+        if builtins_gates.get(obj.name) is obj:
+            return "builtin", obj.name
+        if isinstance(obj, DirectLogicNodeType) and obj.func.__qualname__ == "_build_or.<locals>._or_func":
+            (out_name, out), = obj.outputs.items()
+            return "or", tuple(obj.inputs), out.bits, out_name
+        if spec_components.get(obj.name) is obj:
+            return "spec", obj.name
+        if obj.name in rev_components:
+            return ("component", *rev_components[obj.name])
+        return None
+
+
+class _NodeUnpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        from .tc_components import get_component, spec_components
+
+        match pid:
+            case ("or", names, bits, out_name):
+                return build_or(*names, bit_size=bits, out_name=out_name)
+            case ("spec", name):
+                return spec_components[name]
+            case ("builtin", name):
+                return builtins_gates[name]
+            case ("component", gate_name, custom_data):
+                return get_component(gate_name, custom_data)[1]
+            case _:
+                raise pickle.UnpicklingError(f"Unknown reference {pid!r}")
+
+
+@dataclass
+class CompileCache:
+    path: Path
+    max_size: int = DEFAULT_MAX_SIZE
+    # Running total of the entries' sizes, so that `store` only scans the directory when it may be over `max_size`.
+    # Counted from the first store on, it misses what other processes write meanwhile until the next `evict`.
+    _size: int | None = field(default=None, init=False, repr=False)
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{key}.node"
+
+    def load(self, key: str) -> LogicNodeType | None:
+        file = self._file(key)
+        try:
+            data = file.read_bytes()
+        except OSError:
+            return None
+        try:
+            node = _NodeUnpickler(io.BytesIO(data)).load()
+        except Exception as e:
+            print(f"Discarding broken cache entry {file.name}:", type(e), e)
+            file.unlink(missing_ok=True)
+            return None
+        try:
+            os.utime(file)  # LRU bookkeeping
+        except OSError:
+            pass
+        return node
+
+    def store(self, key: str, node: LogicNodeType):
+        if hasattr(node, "execution_order"):
+            node.execution_order  # Make sure the schedule is part of the cached entry
+        buffer = io.BytesIO()
+        try:
+            _NodePickler(buffer, node).dump(node)
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            print(f"Can't cache {node.name}:", type(e), e)
+            return
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            file = self._file(key)
+            tmp = file.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_bytes(buffer.getvalue())
+            if self._size is None:
+                self._size = self.size()
+            try:
+                self._size -= file.stat().st_size  # Replaced
+            except OSError:
+                pass
+            os.replace(tmp, file)
+        except OSError as e:
+            print("Can't write compile cache:", type(e), e)
+            return
+        self._size += len(buffer.getvalue())
+        if self._size > self.max_size:
+            # With some room left, the next stores don't have to scan again right away
+            self.evict(self.max_size * 3 // 4)
+
+    def entries(self) -> list[os.DirEntry]:
+        try:
+            return [e for e in os.scandir(self.path) if e.name.endswith(".node")]
+        except OSError:
+            return []
+
+    def size(self) -> int:
+        return sum(e.stat().st_size for e in self.entries())
+
+    def evict(self, max_size: int = None):
+        if max_size is None:
+            max_size = self.max_size
+        entries = sorted(((e.stat(), e) for e in self.entries()), key=lambda t: t[0].st_mtime)
+        total = sum(st.st_size for st, _ in entries)
+        for st, e in entries:
+            if total <= max_size:
+                break
+            try:
+                os.unlink(e.path)
+            except OSError:
+                continue
+            total -= st.st_size
+        self._size = total
+
+    def clear(self):
+        self.evict(0)
+
+
+_cache_path = get_cache_path()
+cache: CompileCache | None = CompileCache(_cache_path / "nodes") if _cache_path is not None else None
+
+
+def load(key: str) -> LogicNodeType | None:
+    if not enabled or cache is None:
+        return None
+    return cache.load(key)
+
+
+def store(key: str, node: LogicNodeType):
+    if enabled and cache is not None:
+        cache.store(key, node)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or clear the compile cache for custom components")
+    parser.add_argument("command", choices=["info", "clear-cache"])
+    ns = parser.parse_args()
+    if cache is None:
+        print(f"No cache directory known on {sys.platform=}")
+    elif ns.command == "info":
+        print(f"{cache.path}: {len(cache.entries())} entries, {cache.size() / 2 ** 20:.2f} MiB "
+              f"(limit {cache.max_size / 2 ** 20:.0f} MiB)")
+    else:
+        cache.clear()
+        print(f"Cleared {cache.path}")
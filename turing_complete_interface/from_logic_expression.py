@@ -36,7 +36,7 @@ PRE_NEGATION: "¬" | "˜" | "!" | "~"
 POST_NEGATION: "'"
 NAME: /\w+/
 %ignore /\s+/
-""", parser="lalr", maybe_placeholders=True)
+""", parser="lalr", maybe_placeholders=True, cache=True)
 
 OR_OPERATORS = frozenset({"∨", "+", "∥", "|", "||"})
 NOR_OPERATORS = frozenset({"⊽"})
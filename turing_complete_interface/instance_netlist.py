@@ -0,0 +1,204 @@
+"""
+A hierarchical view of a `CombinedLogicNode` that keeps each distinct component once, as a template, and lists
+where it is used in an instance table, instead of flattening the hierarchy into a copy of every inner wire:
+
+    netlist = InstanceNetlist.from_node(node)
+    netlist.flat_wire_count  # how many wires flattening would produce, computed per template
+    i = netlist.find("ram.reg3.bit0")
+    netlist.state_of(state, i)  # the part of the root state that belongs to this instance
+
+Templates are hash-consed: structurally equal sub nodes share one template even if they are different objects,
+e.g. the same custom component compiled twice. Instances are numbered depth first, so the instances inside
+instance `i` are `i + 1` up to `instance_end[i]`. Each has the absolute offset of its state in the root node's
+state, following the layout of `CombinedLogicNode.evaluate` (sub node states in order of their names).
+"""
+from __future__ import annotations
+
+from array import array
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Iterator
+
+from bitarray import frozenbitarray
+
+from .logic_nodes import CombinedLogicNode, LogicNodeType, Wire
+from .netlist_arrays import NetlistArrays
+
+
+@dataclass(eq=False)
+class Template:
+    node: CombinedLogicNode
+    # Per sub node: its template, None for nodes that aren't combined
+    children: dict[str, int | None] = field(default_factory=dict)
+    # Per sub node with state: where it starts within this template's state
+    state_offsets: dict[str, int] = field(default_factory=dict)
+    # The combined sub nodes, which are instances, numbered as in `InstanceNetlist.instance_child`
+    instance_children: list[str] = field(default_factory=list)
+    instance_count: int = 0
+    flat_wire_count: int = 0
+    flat_leaf_count: int = 0
+
+    @cached_property
+    def arrays(self) -> NetlistArrays:
+        return NetlistArrays.from_node(self.node)
+
+
+def _state_offsets(node: CombinedLogicNode) -> dict[str, int]:
+    offsets = {}
+    i = 0
+    for name, sub in sorted(node.nodes.items()):
+        if sub.state_size:
+            offsets[name] = i
+            i += sub.state_size
+    return offsets
+
+
+class InstanceNetlist:
+    def __init__(self):
+        self.templates: list[Template] = []
+        self._template_keys: dict[tuple, int] = {}
+        self._template_ids: dict[int, int] = {}  # id(node) -> template, with `_nodes` keeping the nodes alive
+        self._nodes: list[CombinedLogicNode] = []
+
+        self.instance_template = array("I")
+        self.instance_parent = array("i")  # -1 for the root
+        self.instance_end = array("I")
+        self.instance_state = array("Q")
+        self.instance_child = array("I")  # index into the parent template's `instance_children`
+
+    def template_of(self, node: CombinedLogicNode) -> int:
+        t = self._template_ids.get(id(node))
+        if t is not None:
+            return t
+        children = {
+            name: self.template_of(sub) if isinstance(sub, CombinedLogicNode) else None
+            for name, sub in node.nodes.items()
+        }
+        # Leaves are compared as they are, combined sub nodes by their template
+        key = (node.name, node.inputs, node.outputs, node.wires, tuple(
+            (name, sub if children[name] is None else children[name]) for name, sub in node.nodes.items()
+        ))
+        t = self._template_keys.get(key)
+        if t is None:
+            template = Template(node, children, _state_offsets(node),
+                                [name for name, child in children.items() if child is not None])
+            template.flat_wire_count = len(node.wires)
+            for name, child in children.items():
+                if child is None:
+                    template.flat_leaf_count += 1
+                else:
+                    template.flat_wire_count += self.templates[child].flat_wire_count
+                    template.flat_leaf_count += self.templates[child].flat_leaf_count
+            t = self._template_keys[key] = len(self.templates)
+            self.templates.append(template)
+        self._template_ids[id(node)] = t
+        self._nodes.append(node)
+        return t
+
+    @classmethod
+    def from_node(cls, node: CombinedLogicNode) -> InstanceNetlist:
+        self = cls()
+        self._add_instance(self.template_of(node), -1, 0, 0)
+        return self
+
+    def _add_instance(self, template: int, parent: int, child: int, state: int):
+        i = len(self.instance_template)
+        self.instance_template.append(template)
+        self.instance_parent.append(parent)
+        self.instance_end.append(0)
+        self.instance_state.append(state)
+        self.instance_child.append(child)
+        t = self.templates[template]
+        t.instance_count += 1
+        for c, name in enumerate(t.instance_children):
+            self._add_instance(t.children[name], i, c, state + t.state_offsets.get(name, 0))
+        self.instance_end[i] = len(self.instance_template)
+
+    @property
+    def root(self) -> Template:
+        return self.templates[self.instance_template[0]]
+
+    @property
+    def instance_count(self) -> int:
+        return len(self.instance_template)
+
+    @property
+    def flat_wire_count(self) -> int:
+        return self.root.flat_wire_count
+
+    @property
+    def flat_leaf_count(self) -> int:
+        return self.root.flat_leaf_count
+
+    def template(self, instance: int) -> Template:
+        return self.templates[self.instance_template[instance]]
+
+    def children(self, instance: int) -> Iterator[int]:
+        i = instance + 1
+        end = self.instance_end[instance]
+        while i < end:
+            yield i
+            i = self.instance_end[i]
+
+    def instance_name(self, instance: int) -> str | None:
+        """ The sub node name of the instance in its parent, None for the root """
+        if instance == 0:
+            return None
+        return self.template(self.instance_parent[instance]).instance_children[self.instance_child[instance]]
+
+    def instance_path(self, instance: int) -> str:
+        names = []
+        while instance > 0:
+            names.append(self.instance_name(instance))
+            instance = self.instance_parent[instance]
+        return ".".join(reversed(names))
+
+    def find(self, path: str) -> int:
+        """ The instance at the dotted path of sub node names, "" being the root """
+        instance = 0
+        for name in path.split(".") if path else ():
+            try:
+                c = self.template(instance).instance_children.index(name)
+            except ValueError:
+                raise KeyError(path, name)
+            for child in self.children(instance):
+                if self.instance_child[child] == c:
+                    instance = child
+                    break
+        return instance
+
+    def state_slice(self, instance: int) -> slice:
+        start = self.instance_state[instance]
+        return slice(start, start + self.template(instance).node.state_size)
+
+    def state_of(self, state: frozenbitarray, instance: int) -> frozenbitarray:
+        return state[self.state_slice(instance)]
+
+    def leaf_state(self, state: frozenbitarray, instance: int, name: str) -> frozenbitarray:
+        """ The state of the sub node `name` of the instance, also if it isn't a combined node """
+        t = self.template(instance)
+        start = self.instance_state[instance] + t.state_offsets[name]
+        return state[start:start + t.node.nodes[name].state_size]
+
+    def iter_flat_wires(self) -> Iterator[tuple[int, Wire]]:
+        """
+        Every wire of the flattened circuit, as the instance it is in and the template's wire, without building
+        the flattened circuit.
+        """
+        for i, t in enumerate(self.instance_template):
+            for wire in self.templates[t].node.wires:
+                yield i, wire
+
+    def iter_flat_leaves(self) -> Iterator[tuple[int, str, LogicNodeType]]:
+        """ Every node that isn't combined, as its instance, name in it and type """
+        for i, t in enumerate(self.instance_template):
+            template = self.templates[t]
+            for name, child in template.children.items():
+                if child is None:
+                    yield i, name, template.node.nodes[name]
+
+    def nbytes(self) -> int:
+        """ The size of the instance table, not counting the templates, which the node holds anyway """
+        arrays = (self.instance_template, self.instance_parent, self.instance_end, self.instance_state,
+                  self.instance_child)
+        return sum(a.itemsize * len(a) for a in arrays)
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from array import array
+from graphlib import CycleError
+from typing import Sequence
+
+
+class Levelizer:
+    """
+    Drop-in for the `add`/`get_ready`/`done` pattern of `graphlib.TopologicalSorter`.
+    Keys get integer ids in order of first appearance, so the levels come out in the same order.
+    """
+
+    def __init__(self):
+        self.keys: list = []
+        self.ids: dict = {}
+        self._sources = array("l")
+        self._targets = array("l")
+
+    def id_of(self, key) -> int:
+        try:
+            return self.ids[key]
+        except KeyError:
+            i = self.ids[key] = len(self.keys)
+            self.keys.append(key)
+            return i
+
+    def add(self, key, *predecessors):
+        target = self.id_of(key)
+        for p in predecessors:
+            self._sources.append(self.id_of(p))
+            self._targets.append(target)
+
+    def levels(self) -> list[array]:
+        return levelize(len(self.keys), self._sources, self._targets)
+
+
+def levelize(count: int, sources: Sequence[int], targets: Sequence[int]) -> list[array]:
+    """
+    Kahn's algorithm on integer node ids `0..count-1` with edges `sources[i] -> targets[i]`.
+    Returns a list of levels, each an array of node ids. Raises `CycleError` with a list
+    of node ids (first id repeated at the end) if the graph is not acyclic.
+    """
+    assert len(sources) == len(targets), (len(sources), len(targets))
+    in_degree = array("l", bytes(array("l").itemsize * count))
+    out_start = array("l", bytes(array("l").itemsize * (count + 1)))
+    for s in sources:
+        out_start[s + 1] += 1
+    for t in targets:
+        in_degree[t] += 1
+    for i in range(count):
+        out_start[i + 1] += out_start[i]
+    fill = out_start[:-1]
+    successors = array("l", bytes(array("l").itemsize * len(sources)))
+    for s, t in zip(sources, targets):
+        successors[fill[s]] = t
+        fill[s] += 1
+
+    current = array("l", (i for i in range(count) if not in_degree[i]))
+    levels = []
+    done = 0
+    while current:
+        levels.append(current)
+        done += len(current)
+        following = array("l")
+        for n in current:
+            for k in range(out_start[n], out_start[n + 1]):
+                t = successors[k]
+                in_degree[t] -= 1
+                if not in_degree[t]:
+                    following.append(t)
+        current = following
+    if done != count:
+        raise CycleError("nodes are in a cycle", _find_cycle(count, out_start, successors))
+    return levels
+
+
+def _find_cycle(count: int, out_start: array, successors: array) -> list[int]:
+    # Same search order as graphlib, so the reported cycle matches what TopologicalSorter would report
+    seen = bytearray(count)
+    for start in range(count):
+        if seen[start]:
+            continue
+        stack = []
+        positions = []
+        on_stack = {}
+        node = start
+        while True:
+            if seen[node]:
+                if node in on_stack:
+                    return stack[on_stack[node]:] + [node]
+            else:
+                seen[node] = 1
+                on_stack[node] = len(stack)
+                stack.append(node)
+                positions.append(out_start[node])
+            while stack:
+                top = stack[-1]
+                if positions[-1] < out_start[top + 1]:
+                    node = successors[positions[-1]]
+                    positions[-1] += 1
+                    break
+                del on_stack[stack.pop()]
+                positions.pop()
+            else:
+                break
+    return []
+
@@ -10,19 +10,103 @@ from typing import Optional, Callable, Protocol, Literal, Any, Mapping, TypeAlia
 from bitarray import bitarray, frozenbitarray, bits2bytes
 from bitarray.util import int2ba, ba2int
 from frozendict import frozendict
-from graphlib import TopologicalSorter
+from graphlib import CycleError
+
+from .levelizer import Levelizer
+
+# The last installed `EvaluationHook`, if any. Sub node evaluations go through its `call`
+_evaluation_hook = None
+
+
+class EvaluationHook:
+    """
+    Sees every sub node evaluation of `CombinedLogicNode.evaluate` while installed, like `EvaluationProfiler` and
+    `WaveformRecorder`. Hooks are chained: the last installed one is called first, and `evaluate_next` passes the
+    call on to the one installed before it, the first one evaluates the node. They can be uninstalled in any order.
+    """
+    _next_hook: EvaluationHook | None = None
+    _installed = False
+
+    def install(self):
+        global _evaluation_hook
+        assert not self._installed, "The hook is already installed"
+        self._next_hook = _evaluation_hook
+        _evaluation_hook = self
+        self._installed = True
+
+    def uninstall(self):
+        global _evaluation_hook
+        if not self._installed:
+            return
+        if _evaluation_hook is self:
+            _evaluation_hook = self._next_hook
+        else:
+            hook = _evaluation_hook
+            while hook._next_hook is not self:
+                hook = hook._next_hook
+            hook._next_hook = self._next_hook
+        self._next_hook = None
+        self._installed = False
 
+    def evaluate_next(self, name: str, node: LogicNodeType, inputs: frozendict[str, frozenbitarray],
+                      state: Optional[frozenbitarray], delayed: bool | Literal["toplevel"]) -> tuple[Any, ...]:
+        if self._next_hook is None:
+            return node.evaluate(inputs, state, delayed)
+        return self._next_hook.call(name, node, inputs, state, delayed)
 
-@dataclass(frozen=True)
+    def call(self, name: str, node: LogicNodeType, inputs: frozendict[str, frozenbitarray],
+             state: Optional[frozenbitarray], delayed: bool | Literal["toplevel"]) -> tuple[Any, ...]:
+        return self.evaluate_next(name, node, inputs, state, delayed)
+
+
+# Pins are immutable and there are only a handful of different ones, so every node shares the same instances. Their
+# fields are set once by `__new__`, the `__init__` of the dataclass would overwrite them on every call
+_pins: dict[tuple, InputPin | OutputPin] = {}
+
+
+@dataclass(frozen=True, slots=True)
 class InputPin:
     bits: int
     delayed: bool = None
 
+    def __new__(cls, bits: int, delayed: bool = None):
+        bits = int(bits)
+        if delayed is not None:
+            delayed = bool(delayed)
+        key = (cls, bits, delayed)
+        pin = _pins.get(key)
+        if pin is None:
+            pin = _pins[key] = object.__new__(cls)
+            object.__setattr__(pin, "bits", bits)
+            object.__setattr__(pin, "delayed", delayed)
+        return pin
 
-@dataclass(frozen=True)
+    def __init__(self, bits: int, delayed: bool = None):
+        pass
+
+    def __reduce__(self):
+        return type(self), (self.bits, self.delayed)
+
+
+@dataclass(frozen=True, slots=True)
 class OutputPin:
     bits: int
 
+    def __new__(cls, bits: int):
+        bits = int(bits)
+        key = (cls, bits)
+        pin = _pins.get(key)
+        if pin is None:
+            pin = _pins[key] = object.__new__(cls)
+            object.__setattr__(pin, "bits", bits)
+        return pin
+
+    def __init__(self, bits: int):
+        pass
+
+    def __reduce__(self):
+        return type(self), (self.bits,)
+
 
 class LogicNodeType(ABC):
     name: str
@@ -81,19 +165,35 @@ class DirectLogicNodeType(LogicNodeType):
 NodePin: TypeAlias = tuple[str | None, str]
 
 
-@dataclass(frozen=True)
+# Bit ranges like (0, 1) and (0, 8) are part of most wires, each one is stored once
+_bit_ranges: dict[tuple[int, int], tuple[int, int]] = {}
+
+
+@dataclass(frozen=True, slots=True)
 class Wire:
     source: NodePin
     target: NodePin
     source_bits: tuple[int, int] | None = None  # None means all
     target_bits: tuple[int, int] | None = None
 
+    def __post_init__(self):
+        if self.source_bits is not None:
+            object.__setattr__(self, "source_bits", _bit_ranges.setdefault(self.source_bits, self.source_bits))
+        if self.target_bits is not None:
+            object.__setattr__(self, "target_bits", _bit_ranges.setdefault(self.target_bits, self.target_bits))
 
-@dataclass(frozen=True)
+    def __reduce__(self):
+        return type(self), (self.source, self.target, self.source_bits, self.target_bits)
+
+
+@dataclass(frozen=True, slots=True)
 class Execution:
     node: str
     delayed: bool
 
+    def __reduce__(self):
+        return type(self), (self.node, self.delayed)
+
 
 def file_safe_name(s):
     return s.replace(".", "_")
@@ -185,16 +285,14 @@ wires: {group(wires)}
     @cached_property
     def execution_order(self) -> tuple[tuple[Execution, ...], ...]:
         try:
-            sorter = TopologicalSorter({})
+            levelizer = Levelizer()
             for wire in self.wires:
                 if wire.target[0] is not None:
-                    s: LogicNodeType
                     t: LogicNodeType
-                    sp: OutputPin
                     tp: InputPin
 
                     if wire.source[0] is not None:
-                        dep = (Execution(wire.source[0], False),)
+                        dep = ((wire.source[0], False),)
                     else:
                         dep = ()
                     t = self.nodes[wire.target[0]]
@@ -203,31 +301,27 @@ wires: {group(wires)}
                     except KeyError:
                         raise KeyError(wire)
                     if tp.delayed:
-                        sorter.add(Execution(wire.target[0], True), *dep)
+                        levelizer.add((wire.target[0], True), *dep)
                     else:
-                        sorter.add(Execution(wire.target[0], False), *dep)
+                        levelizer.add((wire.target[0], False), *dep)
                         if t.any_delayed:
-                            sorter.add(Execution(wire.target[0], True), *dep)
+                            levelizer.add((wire.target[0], True), *dep)
                 elif wire.source[0] is not None:
-                    sorter.add(Execution(wire.source[0], False))
-
-            sorter.prepare()
-            order = []
-            while sorter.is_active():
-                nodes = sorter.get_ready()
-                current = []
-                for n in nodes:
-                    sorter.done(n)
-                    assert isinstance(n, Execution), n
-                    current.append(Execution(n.node, n.delayed))
-                order.append(tuple(current))
-            return tuple(order)
+                    levelizer.add((wire.source[0], False))
+
+            executions = [Execution(*key) for key in levelizer.keys]
+            try:
+                levels = levelizer.levels()
+            except CycleError as e:
+                raise CycleError(e.args[0], [executions[i] for i in e.args[1]])
+            return tuple(tuple(executions[i] for i in level) for level in levels)
         except Exception as e:
             raise type(e)(self.name, *e.args)
 
     def evaluate(self, inputs: frozendict[str, frozenbitarray], state: Optional[frozenbitarray],
                  delayed: bool) -> \
             tuple[frozendict[str, Optional[frozenbitarray]], Optional[frozenbitarray], Any]:
+        hook = _evaluation_hook
         try:
             states = {}
             if state is not None:
@@ -262,8 +356,12 @@ wires: {group(wires)}
                             target[:] = source
                     args = {name: frozenbitarray(v) for name, v in args.items()}
                     try:
-                        res, new_state, _ = node.evaluate(frozendict(args), states.get(exe.node, None),
-                                                          exe.delayed and delayed)
+                        if hook is None:
+                            res, new_state, _ = node.evaluate(frozendict(args), states.get(exe.node, None),
+                                                              exe.delayed and delayed)
+                        else:
+                            res, new_state, _ = hook.call(exe.node, node, frozendict(args),
+                                                          states.get(exe.node, None), exe.delayed and delayed)
                     except Exception as e:
                         raise type(e)(exe, *e.args)
                     if new_state is not None and states is not None and exe.delayed and delayed:
@@ -471,13 +569,17 @@ builtins_gates = {
 }
 
 
-@cache
 def build_or(*names: str, bit_size: int = 1, gate_name="OR_{wire_count}W{bit_size}",
              out_name: str = "out") -> LogicNodeType:
+    # Cached on the normalized arguments, so `build_or("a", "b")` and `build_or("a", "b", bit_size=1)` are one node
+    return _build_or(names, bit_size, gate_name.format(wire_count=len(names), bit_size=bit_size), out_name)
+
+
+@cache
+def _build_or(names: tuple[str, ...], bit_size: int, gate_name: str, out_name: str) -> LogicNodeType:
     def _or_func(args, _, _1):
         return frozendict({out_name: reduce(or_, args.values())}), None
 
-    gate_name = gate_name.format(wire_count=len(names), bit_size=bit_size)
     return DirectLogicNodeType(
         gate_name, frozendict(dict.fromkeys(names, InputPin(bit_size, False))),
         frozendict({out_name: OutputPin(bit_size)}), 0, _or_func
@@ -0,0 +1,181 @@
+"""
+Watchpoints and an access log for the Ram components of a simulation, both the state based and the paged ones:
+
+    with MemoryTracer("ram.trace", [Watchpoint(0x40, 0x48, read=False)]) as tracer:
+        for cycle in range(cycles):
+            tracer.cycle = cycle
+            out, state, values = node.evaluate(inputs, state, True)
+            if tracer.hits:
+                break  # tracer.hits[0] is the first matching access
+
+Accesses are taken from the pins of each Ram evaluation (a read when `load` is set, a write when `save` is set in
+the delayed evaluation), so nothing is diffed. A combined node evaluates its non delayed sub nodes again in its
+delayed evaluation, so reads are only taken from the pass where every enclosing evaluation is delayed, like the
+evaluation that is passed `delayed=True` at the top level. Memories are named by the dotted path of their gate, like signals in
+`waveform`. The tracer is an evaluation hook, only installed while it is entered, so without one there is no cost.
+
+The log is binary: the magic b"TCMT", then records of cycle (u64), memory (u32), address (u64), value (u8) and
+kind (u8), little endian. A record of kind `NAME` comes before the first access of a memory and is followed by
+`address` bytes of its UTF-8 path. `read_log` reads it back.
+"""
+from __future__ import annotations
+
+import struct
+from dataclasses import dataclass
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Any, Optional, Literal, BinaryIO, Iterator
+
+from bitarray import frozenbitarray
+from bitarray.util import ba2int
+from frozendict import frozendict
+
+from .logic_nodes import LogicNodeType, EvaluationHook
+from .paged_memory import RamNodeType
+
+MAGIC = b"TCMT"
+_RECORD = struct.Struct("<QIQBB")
+
+READ = 0
+WRITE = 1
+NAME = 2
+
+
+@dataclass(frozen=True)
+class Watchpoint:
+    start: int
+    end: int = None  # exclusive, default start + 1
+    read: bool = True
+    write: bool = True
+    memory: str = "*"  # fnmatch pattern over the memory paths
+
+    def matches(self, memory: str, address: int, write: bool) -> bool:
+        end = self.start + 1 if self.end is None else self.end
+        return (self.write if write else self.read) and self.start <= address < end \
+            and fnmatchcase(memory, self.memory)
+
+
+@dataclass(frozen=True)
+class Access:
+    cycle: int
+    memory: str
+    address: int
+    value: int
+    write: bool
+
+    def __str__(self):
+        return f"{'write' if self.write else 'read'} {self.value:#04x} at {self.memory}[{self.address:#x}] " \
+               f"in cycle {self.cycle}"
+
+
+def parse_watchpoint(text: str) -> Watchpoint:
+    """ `[r|w]START[-END][@RAM]`, e.g. "w0x40-0x48@*.ram", with END exclusive """
+    read = write = True
+    if text[:1] in ("r", "w"):
+        read, write = text[0] == "r", text[0] == "w"
+        text = text[1:]
+    text, _, memory = text.partition("@")
+    start, _, end = text.partition("-")
+    return Watchpoint(int(start, 0), int(end, 0) if end else None, read, write, memory or "*")
+
+
+def _is_ram(node: LogicNodeType) -> bool:
+    from .tc_components import std_components
+    return type(node) is RamNodeType or node is std_components["Ram"][1]
+
+
+class MemoryTracer(EvaluationHook):
+    def __init__(self, log: str | Path | BinaryIO = None, watchpoints: list[Watchpoint] = (),
+                 buffer_size: int = 2 ** 16):
+        self.watchpoints = list(watchpoints)
+        self.hits: list[Access] = []
+        self.cycle = 0
+        self.buffer_size = buffer_size
+        self._buffer = bytearray()
+        self._memories: dict[str, int] = {}
+        self._stack: list[tuple[str, bool]] = []  # (name, delayed) of the enclosing evaluations
+        self._is_ram: dict[int, bool] = {}
+
+        if isinstance(log, (str, Path)):
+            self._file = open(log, "wb")
+            self._owns_file = True
+        else:
+            self._file = log
+            self._owns_file = False
+        if self._file is not None:
+            self._file.write(MAGIC)
+
+    def __enter__(self) -> MemoryTracer:
+        if self.watchpoints or self._file is not None:
+            self.install()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def call(self, name: str, node: LogicNodeType, inputs: frozendict[str, frozenbitarray],
+             state: Optional[frozenbitarray], delayed: bool | Literal["toplevel"]) -> tuple[Any, ...]:
+        self._stack.append((name, bool(delayed)))
+        try:
+            res = self.evaluate_next(name, node, inputs, state, delayed)
+            is_ram = self._is_ram.get(id(node))
+            if is_ram is None:
+                is_ram = self._is_ram[id(node)] = _is_ram(node)
+            if is_ram:
+                if delayed and inputs["save"].any():
+                    self.access(self._path(), ba2int(inputs["address"]), ba2int(inputs["value_in"]), True)
+                elif not delayed and inputs["load"].any() and all(d for _, d in self._stack[:-1]):
+                    self.access(self._path(), ba2int(inputs["address"]), ba2int(res[0]["value_out"]), False)
+        finally:
+            self._stack.pop()
+        return res
+
+    def _path(self) -> str:
+        return ".".join(name for name, _ in self._stack)
+
+    def access(self, memory: str, address: int, value: int, write: bool):
+        if self._file is not None:
+            i = self._memories.get(memory)
+            if i is None:
+                i = self._memories[memory] = len(self._memories)
+                path = memory.encode("utf-8")
+                self._buffer += _RECORD.pack(self.cycle, i, len(path), 0, NAME) + path
+            self._buffer += _RECORD.pack(self.cycle, i, address, value, WRITE if write else READ)
+            if len(self._buffer) >= self.buffer_size:
+                self.flush()
+        for watchpoint in self.watchpoints:
+            if watchpoint.matches(memory, address, write):
+                self.hits.append(Access(self.cycle, memory, address, value, write))
+                break
+
+    def flush(self):
+        if self._file is not None:
+            self._file.write(self._buffer)
+            self._file.flush()
+        self._buffer.clear()
+
+    def close(self):
+        self.uninstall()
+        if self._file is None or self._file.closed:
+            return
+        self.flush()
+        if self._owns_file:
+            self._file.close()
+
+
+def read_log(file: str | Path | BinaryIO) -> Iterator[Access]:
+    if isinstance(file, (str, Path)):
+        with open(file, "rb") as f:
+            yield from read_log(f)
+        return
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a memory trace")
+    names: list[str] = []
+    while record := file.read(_RECORD.size):
+        if len(record) < _RECORD.size:
+            raise ValueError("Truncated memory trace")
+        cycle, memory, address, value, kind = _RECORD.unpack(record)
+        if kind == NAME:
+            names.append(file.read(address).decode("utf-8"))
+        else:
+            yield Access(cycle, names[memory], address, value, kind == WRITE)
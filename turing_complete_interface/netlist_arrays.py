@@ -0,0 +1,230 @@
+"""
+An integer indexed form of a `CombinedLogicNode`, for engines, optimizers and analyses that want to walk a netlist
+without hashing names and tuples:
+
+    arrays = NetlistArrays.from_node(node)
+    for w in arrays.fan_out(pin):
+        arrays.pin_node[arrays.wire_target[w]]
+
+Every node has an index into `node_names` and `node_type` (which indexes `types`). Every pin has an index into
+the pin table: first the inputs then the outputs of the circuit itself (with `pin_node` -1), then for each node its
+inputs and outputs, so the pins of node `i` are `pin_start[i]` up to `pin_start[i + 1]`. Wires are columns of
+source and target pin indexes and bit ranges, in the order of `node.wires`.
+
+The fan in and fan out of the pins are in CSR form: the wires into pin `p` are `fan_in_wires[fan_in_start[p]:
+fan_in_start[p + 1]]`. Because the pins of a node are contiguous, so are all wires into (or out of) a node.
+
+`to_node` gives back a `CombinedLogicNode` equal to the one it was made from.
+"""
+from __future__ import annotations
+
+from array import array
+from typing import Iterable
+
+from frozendict import frozendict
+
+from .logic_nodes import CombinedLogicNode, LogicNodeType, InputPin, OutputPin, Wire, NodePin
+
+BOUNDARY = -1  # `pin_node` of the pins of the circuit itself
+NO_BITS = -1  # `wire_*_lo` and `wire_*_hi` of a wire without a bit range, i.e. all bits
+
+PIN_INPUT = 0
+PIN_OUTPUT = 1
+PIN_UNDECLARED = 2  # named by a wire but not declared by its node, kept to convert back the same wires
+
+_DELAYED = {None: -1, False: 0, True: 1}
+_FROM_DELAYED = {-1: None, 0: False, 1: True}
+
+
+def _csr(keys: Iterable[int], count: int) -> tuple[array, array]:
+    """ Groups the indexes of `keys` by their value (0 <= key < count), keeping them in order within a group """
+    keys = array("I", keys)
+    start = array("I", bytes(4 * (count + 1)))
+    for k in keys:
+        start[k + 1] += 1
+    for i in range(count):
+        start[i + 1] += start[i]
+    fill = start[:-1]
+    items = array("I", bytes(4 * len(keys)))
+    for i, k in enumerate(keys):
+        items[fill[k]] = i
+        fill[k] += 1
+    return start, items
+
+
+class NetlistArrays:
+    def __init__(self, name: str):
+        self.name = name
+        # Pin names repeat across nodes of the same type, they are stored once and referenced by index
+        self.strings: list[str] = []
+        self._string_ids: dict[str, int] = {}
+
+        self.types: list[LogicNodeType] = []
+        self.node_names: list[str] = []
+        self.node_type = array("I")
+
+        self.pin_start = array("I", [0])  # per node, its first pin; one more entry than nodes
+        self.pin_node = array("i")
+        self.pin_name = array("I")  # index into `strings`
+        self.pin_kind = array("B")  # PIN_INPUT or PIN_OUTPUT, from the node's side, or PIN_UNDECLARED
+        self.pin_bits = array("H")
+        self.pin_delayed = array("b")  # -1 for None, only meaningful for inputs
+        self.boundary_inputs = 0
+        self.boundary_outputs = 0
+
+        self.wire_source = array("I")
+        self.wire_target = array("I")
+        self.wire_source_lo = array("i")
+        self.wire_source_hi = array("i")
+        self.wire_target_lo = array("i")
+        self.wire_target_hi = array("i")
+
+        self.fan_in_start = array("I")
+        self.fan_in_wires = array("I")
+        self.fan_out_start = array("I")
+        self.fan_out_wires = array("I")
+
+    def string_id(self, s: str) -> int:
+        i = self._string_ids.get(s)
+        if i is None:
+            i = self._string_ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def _add_pin(self, node: int, name: str, kind: int, bits: int, delayed: bool | None = None) -> int:
+        self.pin_node.append(node)
+        self.pin_name.append(self.string_id(name))
+        self.pin_kind.append(kind)
+        self.pin_bits.append(bits)
+        self.pin_delayed.append(_DELAYED[delayed])
+        return len(self.pin_node) - 1
+
+    @classmethod
+    def from_node(cls, node: CombinedLogicNode) -> NetlistArrays:
+        self = cls(node.name)
+        # Pins that wires refer to without them existing, e.g. in a broken spec. Per node, None for the circuit.
+        undeclared: dict[str | None, dict[str, None]] = {}
+        for wire in node.wires:
+            for (node_name, name), is_source in ((wire.source, True), (wire.target, False)):
+                if node_name is None:
+                    pins = node.inputs if is_source else node.outputs
+                elif node_name in node.nodes:
+                    pins = node.nodes[node_name].outputs if is_source else node.nodes[node_name].inputs
+                else:
+                    raise KeyError(node.name, wire, node_name)
+                if name not in pins:
+                    undeclared.setdefault(node_name, {})[name] = None
+
+        # Where wires can start and end: (node, name) of circuit inputs and node outputs, resp. of circuit
+        # outputs and node inputs. The same name can be both an input and an output of the circuit.
+        sources: dict[NodePin, int] = {}
+        targets: dict[NodePin, int] = {}
+
+        def add_undeclared(i: int, node_name: str | None):
+            for name in undeclared.get(node_name, ()):
+                key = node_name, name
+                if key not in sources or key not in targets:
+                    p = self._add_pin(i, name, PIN_UNDECLARED, 0)
+                    sources.setdefault(key, p)
+                    targets.setdefault(key, p)
+
+        for name, pin in node.inputs.items():
+            sources[None, name] = self._add_pin(BOUNDARY, name, PIN_INPUT, pin.bits, pin.delayed)
+        for name, pin in node.outputs.items():
+            targets[None, name] = self._add_pin(BOUNDARY, name, PIN_OUTPUT, pin.bits)
+        self.boundary_inputs = len(node.inputs)
+        self.boundary_outputs = len(node.outputs)
+        add_undeclared(BOUNDARY, None)
+        self.pin_start[0] = len(self.pin_node)
+
+        type_ids: dict[int, int] = {}
+        for i, (node_name, sub) in enumerate(node.nodes.items()):
+            t = type_ids.get(id(sub))
+            if t is None:
+                t = type_ids[id(sub)] = len(self.types)
+                self.types.append(sub)
+            self.node_names.append(node_name)
+            self.node_type.append(t)
+            for name, pin in sub.inputs.items():
+                targets[node_name, name] = self._add_pin(i, name, PIN_INPUT, pin.bits, pin.delayed)
+            for name, pin in sub.outputs.items():
+                sources[node_name, name] = self._add_pin(i, name, PIN_OUTPUT, pin.bits)
+            add_undeclared(i, node_name)
+            self.pin_start.append(len(self.pin_node))
+
+        for wire in node.wires:
+            self.wire_source.append(sources[wire.source])
+            self.wire_target.append(targets[wire.target])
+            lo, hi = wire.source_bits if wire.source_bits is not None else (NO_BITS, NO_BITS)
+            self.wire_source_lo.append(lo)
+            self.wire_source_hi.append(hi)
+            lo, hi = wire.target_bits if wire.target_bits is not None else (NO_BITS, NO_BITS)
+            self.wire_target_lo.append(lo)
+            self.wire_target_hi.append(hi)
+
+        self.fan_in_start, self.fan_in_wires = _csr(self.wire_target, len(self.pin_node))
+        self.fan_out_start, self.fan_out_wires = _csr(self.wire_source, len(self.pin_node))
+        return self
+
+    def to_node(self) -> CombinedLogicNode:
+        strings = self.strings
+        inputs = {}
+        outputs = {}
+        for p in range(self.boundary_inputs):
+            inputs[strings[self.pin_name[p]]] = InputPin(self.pin_bits[p], _FROM_DELAYED[self.pin_delayed[p]])
+        for p in range(self.boundary_inputs, self.boundary_inputs + self.boundary_outputs):
+            outputs[strings[self.pin_name[p]]] = OutputPin(self.pin_bits[p])
+        nodes = {name: self.types[t] for name, t in zip(self.node_names, self.node_type)}
+        wires = []
+        for w in range(len(self.wire_source)):
+            source_lo, source_hi = self.wire_source_lo[w], self.wire_source_hi[w]
+            target_lo, target_hi = self.wire_target_lo[w], self.wire_target_hi[w]
+            wires.append(Wire(self.pin_ref(self.wire_source[w]), self.pin_ref(self.wire_target[w]),
+                              (source_lo, source_hi) if source_lo != NO_BITS else None,
+                              (target_lo, target_hi) if target_lo != NO_BITS else None))
+        return CombinedLogicNode(self.name, frozendict(nodes), frozendict(inputs), frozendict(outputs), tuple(wires))
+
+    @property
+    def node_count(self) -> int:
+        return len(self.node_names)
+
+    @property
+    def pin_count(self) -> int:
+        return len(self.pin_node)
+
+    @property
+    def wire_count(self) -> int:
+        return len(self.wire_source)
+
+    def pin_ref(self, pin: int) -> NodePin:
+        """ The pin as it is named in `CombinedLogicNode.wires` """
+        node = self.pin_node[pin]
+        return (self.node_names[node] if node != BOUNDARY else None), self.strings[self.pin_name[pin]]
+
+    def node_pins(self, node: int) -> range:
+        return range(self.pin_start[node], self.pin_start[node + 1])
+
+    def fan_in(self, pin: int) -> array:
+        """ The wires driving the pin """
+        return self.fan_in_wires[self.fan_in_start[pin]:self.fan_in_start[pin + 1]]
+
+    def fan_out(self, pin: int) -> array:
+        """ The wires driven by the pin """
+        return self.fan_out_wires[self.fan_out_start[pin]:self.fan_out_start[pin + 1]]
+
+    def node_fan_in(self, node: int) -> array:
+        """ The wires into any of the node's inputs """
+        return self.fan_in_wires[self.fan_in_start[self.pin_start[node]]:self.fan_in_start[self.pin_start[node + 1]]]
+
+    def node_fan_out(self, node: int) -> array:
+        """ The wires out of any of the node's outputs """
+        return self.fan_out_wires[
+               self.fan_out_start[self.pin_start[node]]:self.fan_out_start[self.pin_start[node + 1]]]
+
+    def nbytes(self) -> int:
+        """ The size of the arrays, not counting the strings and the node types """
+        arrays = (self.node_type, self.pin_start, self.pin_node, self.pin_name, self.pin_kind, self.pin_bits,
+                  self.pin_delayed, self.wire_source, self.wire_target, self.wire_source_lo, self.wire_source_hi,
+                  self.wire_target_lo, self.wire_target_hi, self.fan_in_start, self.fan_in_wires,
+                  self.fan_out_start, self.fan_out_wires)
+        return sum(a.itemsize * len(a) for a in arrays)
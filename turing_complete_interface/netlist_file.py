@@ -0,0 +1,301 @@
+"""
+A binary file format for compiled netlists that is used in place through `mmap`, so that opening even a very large
+circuit only reads its header, and processes opening the same file share its pages:
+
+    write_netlist(node, "cpu.tcnl")
+    with NetlistFile("cpu.tcnl") as f:
+        f.arrays.fan_out(pin)  # a `NetlistArrays` whose columns are memoryviews into the file
+        node = f.to_node()
+
+Layout, all little endian:
+
+    header      magic b"TCNL", format version, section count, flags, name, boundary input and output counts
+    sections    per section its offset in the file and its number of items
+    strings     offsets (one more than strings) into the UTF-8 data of all strings
+    types       the node types, pickled like compile cache entries (library components are only referenced)
+    nodes       name (string index) and type index
+    pins        `NetlistArrays` pin table
+    wires       `NetlistArrays` wire columns and the CSR fan in and fan out
+    schedule    `CombinedLogicNode.execution_order` in CSR form: level starts, then node index and delayed flag
+
+Every section starts 8 byte aligned. Readers reject other format versions instead of guessing.
+"""
+from __future__ import annotations
+
+import io
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from graphlib import CycleError
+from pathlib import Path
+
+from .compile_cache import _NodePickler, _NodeUnpickler
+from .logic_nodes import CombinedLogicNode, Execution
+from .netlist_arrays import NetlistArrays
+
+MAGIC = b"TCNL"
+FORMAT_VERSION = 1
+
+FLAG_SCHEDULE = 1  # The schedule sections are filled, the circuit could be levelized
+
+# Name and typecode of each section, in file order
+SECTIONS = (
+    ("string_offsets", "Q"),
+    ("string_data", "B"),
+    ("types", "B"),
+    ("node_name", "I"),
+    ("node_type", "I"),
+    ("pin_start", "I"),
+    ("pin_node", "i"),
+    ("pin_name", "I"),
+    ("pin_kind", "B"),
+    ("pin_bits", "H"),
+    ("pin_delayed", "b"),
+    ("wire_source", "I"),
+    ("wire_target", "I"),
+    ("wire_source_lo", "i"),
+    ("wire_source_hi", "i"),
+    ("wire_target_lo", "i"),
+    ("wire_target_hi", "i"),
+    ("fan_in_start", "I"),
+    ("fan_in_wires", "I"),
+    ("fan_out_start", "I"),
+    ("fan_out_wires", "I"),
+    ("level_start", "I"),
+    ("level_node", "I"),
+    ("level_delayed", "B"),
+)
+# Columns that are copied 1:1 between the file and `NetlistArrays`
+_ARRAY_COLUMNS = tuple(name for name, _ in SECTIONS[3:21] if name != "node_name")
+
+_HEADER = struct.Struct("<4sHHIIII")
+_SECTION = struct.Struct("<QQ")
+
+
+class NetlistFormatError(ValueError):
+    pass
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def _little_endian(a: array) -> bytes:
+    if sys.byteorder != "little":
+        a = array(a.typecode, a)
+        a.byteswap()
+    return a.tobytes()
+
+
+def write_netlist(node: CombinedLogicNode, file: str | os.PathLike | io.RawIOBase):
+    """ Writes the node to a path (atomically) or to an open binary file """
+    arrays = NetlistArrays.from_node(node)
+    name = arrays.string_id(node.name)
+    node_name = array("I", map(arrays.string_id, arrays.node_names))
+
+    string_data = bytearray()
+    string_offsets = array("Q", [0])
+    for s in arrays.strings:
+        string_data += s.encode("utf-8")
+        string_offsets.append(len(string_data))
+
+    types = io.BytesIO()
+    _NodePickler(types, None).dump(arrays.types)
+
+    flags = 0
+    level_start, level_node, level_delayed = array("I", [0]), array("I"), array("B")
+    try:
+        order = node.execution_order
+    except CycleError:
+        pass
+    else:
+        flags |= FLAG_SCHEDULE
+        node_ids = {n: i for i, n in enumerate(arrays.node_names)}
+        for level in order:
+            for exe in level:
+                level_node.append(node_ids[exe.node])
+                level_delayed.append(exe.delayed)
+            level_start.append(len(level_node))
+
+    columns = {
+        "string_offsets": string_offsets,
+        "string_data": array("B", string_data),
+        "types": array("B", types.getvalue()),
+        "node_name": node_name,
+        **{column: getattr(arrays, column) for column in _ARRAY_COLUMNS},
+        "level_start": level_start,
+        "level_node": level_node,
+        "level_delayed": level_delayed,
+    }
+
+    offset = _align(_HEADER.size + _SECTION.size * len(SECTIONS))
+    table = []
+    for section, typecode in SECTIONS:
+        data = columns[section]
+        assert data.typecode == typecode, (section, data.typecode)
+        table.append((offset, len(data)))
+        offset = _align(offset + data.itemsize * len(data))
+
+    def dump(f):
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(SECTIONS), flags, name,
+                             arrays.boundary_inputs, arrays.boundary_outputs))
+        for entry in table:
+            f.write(_SECTION.pack(*entry))
+        pos = _HEADER.size + _SECTION.size * len(SECTIONS)
+        for (section, _), (start, _) in zip(SECTIONS, table):
+            f.write(bytes(start - pos))
+            data = _little_endian(columns[section])
+            f.write(data)
+            pos = start + len(data)
+
+    if isinstance(file, (str, os.PathLike)):
+        file = Path(file)
+        tmp = file.with_suffix(f"{file.suffix}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            dump(f)
+        os.replace(tmp, file)
+    else:
+        dump(file)
+
+
+class _MappedStrings(Sequence):
+    """ The string table, decoded on access """
+
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return str(self._data[self._offsets[i]:self._offsets[i + 1]], "utf-8")
+
+
+class _MappedNames(Sequence):
+    def __init__(self, strings: _MappedStrings, ids: memoryview):
+        self._strings = strings
+        self._ids = ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._strings[j] for j in self._ids[i]]
+        return self._strings[self._ids[i]]
+
+
+class NetlistFile:
+    """
+    An opened netlist file. The columns of `arrays` and the schedule are memoryviews into the mapped file and
+    only valid until `close`. On big endian machines they are converted copies instead. The node types
+    (`types`, also `arrays.types`) are only unpickled when first needed.
+    """
+
+    def __init__(self, path: str | os.PathLike):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._views: list[memoryview] = []
+            self._open()
+        except BaseException:
+            self.close()
+            raise
+
+    def _open(self):
+        buffer = memoryview(self._mmap)
+        self._views.append(buffer)
+        if len(buffer) < _HEADER.size:
+            raise NetlistFormatError(f"{self.path} is too short for a netlist file")
+        magic, version, section_count, self.flags, name, inputs, outputs = _HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise NetlistFormatError(f"{self.path} is not a netlist file")
+        if version != FORMAT_VERSION or section_count != len(SECTIONS):
+            raise NetlistFormatError(f"{self.path} has netlist format {version}, expected {FORMAT_VERSION}")
+
+        self.sections: dict[str, memoryview | array] = {}
+        for i, (section, typecode) in enumerate(SECTIONS):
+            offset, count = _SECTION.unpack_from(buffer, _HEADER.size + _SECTION.size * i)
+            size = struct.calcsize(typecode) * count
+            if offset + size > len(buffer):
+                raise NetlistFormatError(f"{self.path} is truncated in section {section}")
+            view = buffer[offset:offset + size]
+            self._views.append(view)
+            if sys.byteorder == "little":
+                self.sections[section] = view.cast(typecode)
+                self._views.append(self.sections[section])
+            else:
+                data = array(typecode, view)
+                data.byteswap()
+                self.sections[section] = data
+
+        strings = _MappedStrings(self.sections["string_offsets"], self.sections["string_data"])
+        self.name = strings[name]
+        self.strings = strings
+        self._types = None
+
+        arrays = NetlistArrays(self.name)
+        arrays.strings = strings
+        arrays.node_names = _MappedNames(strings, self.sections["node_name"])
+        for column in _ARRAY_COLUMNS:
+            setattr(arrays, column, self.sections[column])
+        arrays.boundary_inputs = inputs
+        arrays.boundary_outputs = outputs
+        self.arrays = arrays
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views.clear()
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # Slices handed out are still alive, the mapping is closed once they are gone
+
+    @property
+    def types(self):
+        if self._types is None:
+            self._types = _NodeUnpickler(io.BytesIO(self.sections["types"])).load()
+            self.arrays.types = self._types
+        return self._types
+
+    @property
+    def has_schedule(self) -> bool:
+        return bool(self.flags & FLAG_SCHEDULE)
+
+    def level(self, i: int) -> tuple[memoryview, memoryview]:
+        """ The node indexes and delayed flags of the executions in level `i` of the schedule """
+        start, end = self.sections["level_start"][i], self.sections["level_start"][i + 1]
+        return self.sections["level_node"][start:end], self.sections["level_delayed"][start:end]
+
+    @property
+    def level_count(self) -> int:
+        return len(self.sections["level_start"]) - 1
+
+    def execution_order(self) -> tuple[tuple[Execution, ...], ...]:
+        names = self.arrays.node_names
+        return tuple(
+            tuple(Execution(names[n], bool(d)) for n, d in zip(*self.level(i)))
+            for i in range(self.level_count)
+        )
+
+    def to_node(self) -> CombinedLogicNode:
+        """ The node the file was written from, with its schedule already computed """
+        self.types
+        node = self.arrays.to_node()
+        if self.has_schedule:
+            node.__dict__["execution_order"] = self.execution_order()
+        return node
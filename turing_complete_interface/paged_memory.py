@@ -0,0 +1,298 @@
+"""
+Sparse memory for RAM-like components, allocated in 4 KiB pages on first write, so that a large, mostly zero
+address space only costs memory for the pages that were written:
+
+    memory = PagedMemory(2 ** 32)
+    memory.load(image, 0x8000)  # bytes, bytearray, memoryview, a numpy array, ...
+    memory[0x1234] = 0x56
+    memory.dump(0x8000, 256)
+
+`MappedMemory` has the same interface on top of a memory mapped file of any size: a read only program image that
+several processes share, or RAM whose content stays on disk after the simulation.
+
+`RamNodeType` is a node with the pins and behaviour of the game's Ram, that keeps its content in such a memory
+instead of in its state. `tc_components.instantiate_paged_ram` gives each Ram of a compiled node its own.
+"""
+from __future__ import annotations
+
+import mmap
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Any
+
+from bitarray import frozenbitarray
+from bitarray.util import int2ba, ba2int
+from frozendict import frozendict
+
+from .logic_nodes import LogicNodeType, InputPin, OutputPin
+
+PAGE_SIZE = 4096
+
+
+class PagedMemory:
+    def __init__(self, size: int = 2 ** 64, page_size: int = PAGE_SIZE):
+        assert page_size > 0 and page_size & (page_size - 1) == 0, "The page size has to be a power of two"
+        self.size = size
+        self.page_size = page_size
+        self._shift = page_size.bit_length() - 1
+        self._mask = page_size - 1
+        self.pages: dict[int, bytearray] = {}
+        # The page of the last access, most accesses go to the same page as the one before
+        self._mru_index: int | None = None
+        self._mru_page: bytearray | None = None
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f"{type(self).__name__}(size={self.size:#x}, {len(self.pages)} pages)"
+
+    def __getstate__(self):
+        return {"size": self.size, "page_size": self.page_size, "pages": self.pages}
+
+    def __setstate__(self, state):
+        self.__init__(state["size"], state["page_size"])
+        self.pages = state["pages"]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.pages) * self.page_size
+
+    def _check(self, address: int, length: int = 1):
+        if address < 0 or address + length > self.size:
+            raise IndexError(f"Address {address:#x} (+{length}) outside of memory of size {self.size:#x}")
+
+    def _remember(self, index: int, page: bytearray):
+        # The fast path skips the bounds check, so a last page that is only partly inside the memory is excluded
+        if (index + 1) << self._shift <= self.size:
+            self._mru_index, self._mru_page = index, page
+
+    def read_byte(self, address: int) -> int:
+        index = address >> self._shift
+        if index == self._mru_index:
+            return self._mru_page[address & self._mask]
+        self._check(address)
+        page = self.pages.get(index)
+        if page is None:
+            return 0
+        self._remember(index, page)
+        return page[address & self._mask]
+
+    def write_byte(self, address: int, value: int):
+        index = address >> self._shift
+        if index == self._mru_index:
+            self._mru_page[address & self._mask] = value
+            return
+        self._check(address)
+        page = self.pages.get(index)
+        if page is None:
+            if not value:
+                return  # Unallocated pages read as zero anyway
+            page = self.pages[index] = bytearray(self.page_size)
+        self._remember(index, page)
+        page[address & self._mask] = value
+
+    def _chunks(self, address: int, length: int):
+        """ (page index, start in page, end in page, offset in the range) of the pages overlapping the range """
+        offset = 0
+        while offset < length:
+            index, start = divmod(address + offset, self.page_size)
+            end = min(self.page_size, start + length - offset)
+            yield index, start, end, offset
+            offset += end - start
+
+    def read(self, address: int, length: int) -> bytes:
+        self._check(address, length)
+        out = bytearray(length)
+        self.read_into(out, address)
+        return bytes(out)
+
+    def read_into(self, buffer: Any, address: int = 0):
+        """ Fills a writable buffer (bytearray, memoryview, numpy array, ...) from the memory """
+        view = memoryview(buffer).cast("B")
+        self._check(address, len(view))
+        for index, start, end, offset in self._chunks(address, len(view)):
+            page = self.pages.get(index)
+            if page is None:
+                view[offset:offset + end - start] = bytes(end - start)
+            else:
+                view[offset:offset + end - start] = page[start:end]
+
+    def write(self, address: int, data: Any):
+        """ Copies bytes or any other buffer (e.g. a numpy array) into the memory """
+        view = memoryview(data).cast("B")
+        self._check(address, len(view))
+        for index, start, end, offset in self._chunks(address, len(view)):
+            chunk = view[offset:offset + end - start]
+            page = self.pages.get(index)
+            if page is None:
+                if not any(chunk):
+                    continue
+                page = self.pages[index] = bytearray(self.page_size)
+            page[start:end] = chunk
+
+    def load(self, data: Any, address: int = 0):
+        """ Bulk loads an image, e.g. a program """
+        self.write(address, data)
+
+    def dump(self, address: int = 0, length: int = None) -> bytes:
+        """ The content from address, by default up to the end of the last allocated page """
+        if length is None:
+            length = max(0, (max(self.pages, default=-1) + 1) * self.page_size - address)
+        return self.read(address, length)
+
+    def clear(self):
+        self.pages.clear()
+        self._mru_index, self._mru_page = None, None
+
+    def __getitem__(self, item: int | slice) -> int | bytes:
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.size)
+            assert step == 1, "Only contiguous ranges can be read"
+            return self.read(start, max(0, stop - start))
+        return self.read_byte(item)
+
+    def __setitem__(self, item: int | slice, value):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.size)
+            assert step == 1 and len(memoryview(value).cast("B")) == stop - start
+            self.write(start, value)
+        else:
+            self.write_byte(item, value)
+
+
+class MappedMemory:
+    """
+    A file mapped into memory. Writable mappings grow the file to `size` if it is shorter (creating it if
+    needed) and write back to it, read only ones are as large as the file. With `truncate`, a writable mapping
+    starts out as `size` zero bytes instead of the old content of the file.
+    """
+
+    def __init__(self, path: str | os.PathLike, size: int = None, readonly: bool = False, truncate: bool = False):
+        self.path = Path(path)
+        self.readonly = readonly
+        if readonly:
+            with open(self.path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            with open(self.path, "a+b") as f:
+                if truncate:
+                    f.truncate(0)
+                if size is not None and os.fstat(f.fileno()).st_size < size:
+                    f.truncate(size)
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE)
+        self.size = len(self._mmap)
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return f"{type(self).__name__}({str(self.path)!r}, size={self.size:#x}{', readonly' if self.readonly else ''})"
+
+    def __reduce__(self):
+        # Other processes map the same file
+        return type(self), (self.path, self.size, self.readonly)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def nbytes(self) -> int:
+        return self.size
+
+    def _check(self, address: int, length: int = 1):
+        if address < 0 or address + length > self.size:
+            raise IndexError(f"Address {address:#x} (+{length}) outside of {self.path} of size {self.size:#x}")
+
+    def read_byte(self, address: int) -> int:
+        if address < 0:  # mmap would count from the end
+            self._check(address)
+        return self._mmap[address]
+
+    def write_byte(self, address: int, value: int):
+        if address < 0:
+            self._check(address)
+        self._mmap[address] = value
+
+    def read(self, address: int, length: int) -> bytes:
+        self._check(address, length)
+        return self._mmap[address:address + length]
+
+    def read_into(self, buffer: Any, address: int = 0):
+        view = memoryview(buffer).cast("B")
+        self._check(address, len(view))
+        view[:] = self._mmap[address:address + len(view)]
+
+    def write(self, address: int, data: Any):
+        view = memoryview(data).cast("B")
+        self._check(address, len(view))
+        self._mmap[address:address + len(view)] = view
+
+    def load(self, data: Any, address: int = 0):
+        self.write(address, data)
+
+    def dump(self, address: int = 0, length: int = None) -> bytes:
+        return self.read(address, self.size - address if length is None else length)
+
+    def flush(self):
+        if not self.readonly:
+            self._mmap.flush()
+
+    def close(self):
+        self.flush()
+        self._mmap.close()
+
+    def __getitem__(self, item: int | slice) -> int | bytes:
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.size)
+            assert step == 1, "Only contiguous ranges can be read"
+            return self.read(start, max(0, stop - start))
+        return self.read_byte(item)
+
+    def __setitem__(self, item: int | slice, value):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self.size)
+            assert step == 1 and len(memoryview(value).cast("B")) == stop - start
+            self.write(start, value)
+        else:
+            self.write_byte(item, value)
+
+
+# The bits of each byte value, shared by all reads
+byte_bits = tuple(frozenbitarray(int2ba(i, 8, endian="little")) for i in range(256))
+_ZERO = byte_bits[0]
+
+
+@dataclass(frozen=True, eq=False)
+class RamNodeType(LogicNodeType):
+    name: str
+    memory: PagedMemory | MappedMemory
+    address_bits: int = 8
+    inputs: frozendict[str, InputPin] = field(init=False)
+    outputs: frozendict[str, OutputPin] = field(init=False)
+    state_size: int = field(default=0, init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "inputs", frozendict({
+            "address": InputPin(self.address_bits, False),
+            "load": InputPin(1, False),
+            "save": InputPin(1, False),
+            "value_in": InputPin(8, True),
+        }))
+        object.__setattr__(self, "outputs", frozendict({"value_out": OutputPin(8)}))
+
+    def evaluate(self, inputs: frozendict[str, frozenbitarray], state: Optional[frozenbitarray], delayed: bool) -> \
+            tuple[frozendict[str, Optional[frozenbitarray]], Optional[frozenbitarray], None]:
+        # Same as `tc_components.ram_func`: the value is read before a write in the same cycle
+        address = ba2int(inputs["address"])
+        if inputs["load"].any():
+            value = byte_bits[self.memory.read_byte(address)]
+        else:
+            value = _ZERO
+        if delayed and inputs["save"].any():
+            self.memory.write_byte(address, ba2int(inputs["value_in"]))
+        return frozendict({"value_out": value}), None, None
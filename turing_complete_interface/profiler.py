@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from time import perf_counter_ns
+from typing import Optional, Literal, Any
+
+from bitarray import frozenbitarray
+from frozendict import frozendict
+
+from .logic_nodes import LogicNodeType, EvaluationHook
+
+
+@dataclass
+class NodeStats:
+    type_name: str
+    calls: int = 0
+    total_ns: int = 0
+    self_ns: int = 0
+    state_changes: int = 0
+
+    def add(self, other: NodeStats):
+        self.calls += other.calls
+        self.total_ns += other.total_ns
+        self.self_ns += other.self_ns
+        self.state_changes += other.state_changes
+
+
+@dataclass
+class EvaluationProfiler(EvaluationHook):
+    """
+    Records how much time the sub nodes of `CombinedLogicNode`s take while it is active:
+
+        with EvaluationProfiler() as profiler:
+            node.calculate(state, **inputs)
+        print(profiler.table())
+
+    While no profiler is active, `CombinedLogicNode.evaluate` only pays for a single `is None` check.
+    """
+    root_name: str = "main"
+    by_path: dict[tuple[str, ...], NodeStats] = field(default_factory=dict)
+    _stack: list[str] = field(default_factory=list)
+    _child_ns: int = 0
+
+    def __enter__(self) -> EvaluationProfiler:
+        self.install()
+        return self
+
+    def __exit__(self, *args):
+        self.uninstall()
+
+    def call(self, name: str, node: LogicNodeType, inputs: frozendict[str, frozenbitarray],
+             state: Optional[frozenbitarray], delayed: bool | Literal["toplevel"]) -> tuple[Any, ...]:
+        self._stack.append(name)
+        outer_child_ns = self._child_ns
+        self._child_ns = 0
+        start = perf_counter_ns()
+        try:
+            res = self.evaluate_next(name, node, inputs, state, delayed)
+        finally:
+            elapsed = perf_counter_ns() - start
+            path = tuple(self._stack)
+            self._stack.pop()
+            try:
+                stats = self.by_path[path]
+            except KeyError:
+                stats = self.by_path[path] = NodeStats(node.name)
+            stats.calls += 1
+            stats.total_ns += elapsed
+            stats.self_ns += elapsed - self._child_ns
+            self._child_ns = outer_child_ns + elapsed
+        if delayed and res[1] is not None and state is not None and res[1] != state:
+            stats.state_changes += 1
+        return res
+
+    def by_type(self) -> dict[str, NodeStats]:
+        # The total time is summed over all paths, so it counts recursive nesting of the same type more than once
+        out = {}
+        for stats in self.by_path.values():
+            if stats.type_name not in out:
+                out[stats.type_name] = NodeStats(stats.type_name)
+            out[stats.type_name].add(stats)
+        return out
+
+    def table(self, group: Literal["path", "type"] = "path",
+              sort: Literal["self", "total", "calls", "state_changes"] = "self", limit: int = None) -> str:
+        if group == "path":
+            rows = [(".".join((self.root_name, *path)), stats) for path, stats in self.by_path.items()]
+        else:
+            rows = list(self.by_type().items())
+        key = {
+            "self": lambda r: r[1].self_ns,
+            "total": lambda r: r[1].total_ns,
+            "calls": lambda r: r[1].calls,
+            "state_changes": lambda r: r[1].state_changes,
+        }[sort]
+        rows.sort(key=key, reverse=True)
+        if limit is not None:
+            rows = rows[:limit]
+        width = max((len(name) for name, _ in rows), default=4)
+        lines = [f"{group:<{width}} {'type':<24} {'calls':>10} {'total ms':>10} {'self ms':>10} {'changes':>10}"]
+        for name, stats in rows:
+            lines.append(f"{name:<{width}} {stats.type_name:<24} {stats.calls:>10} "
+                         f"{stats.total_ns / 1e6:>10.3f} {stats.self_ns / 1e6:>10.3f} {stats.state_changes:>10}")
+        if group == "type":
+            lines = [line[:width] + line[width + 25:] for line in lines]
+        return "\n".join(lines)
+
+    def collapsed(self) -> str:
+        # The "collapsed stack" format of flamegraph.pl/speedscope/inferno, weighted by self time in microseconds
+        stacks = defaultdict(int)
+        for path, stats in self.by_path.items():
+            stacks[";".join((self.root_name, *path))] += stats.self_ns // 1000
+        return "\n".join(f"{stack} {us}" for stack, us in sorted(stacks.items()) if us) + "\n"
+
+    def clear(self):
+        self.by_path.clear()
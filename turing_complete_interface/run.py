@@ -0,0 +1,239 @@
+"""
+Runs a save without any GUI:
+
+    python -m turing_complete_interface.run -l architecture -s OVERTURE -a programs/fib --cycles 10000
+
+Keyboard components and level inputs read from `--input` (a file or `-` for stdin), level outputs,
+AsciiScreens and the FastBotTurtle are printed to stdout. The simulation speed is reported on stderr.
+"""
+from __future__ import annotations
+
+import sys
+from argparse import ArgumentParser
+from collections import deque
+from contextlib import ExitStack
+from pathlib import Path
+from time import perf_counter
+
+from bitarray import frozenbitarray
+from bitarray.util import int2ba, ba2int
+from frozendict import frozendict
+
+from . import tc_components, compile_cache
+from .circuit_compiler import build_gate
+from .circuit_parser import Circuit, SCHEMATICS_PATH
+from .logic_nodes import LogicNodeType
+from .memory_trace import MemoryTracer, parse_watchpoint
+from .paged_memory import MappedMemory
+from .tc_assembler import assemble
+from .tc_components import screens, AsciiScreen
+
+
+def load_node(level: str, save: str = None, assembly: str = None, verilog: Path = None) -> \
+        tuple[Circuit | None, LogicNodeType]:
+    if verilog is not None:
+        from .verilog_parser import parse_verilog
+        return None, parse_verilog(verilog.read_text())
+    save_name = SCHEMATICS_PATH / level / save
+    circuit = Circuit.parse((save_name / "circuit.data").read_bytes())
+    if level == "architecture" and assembly:
+        assembly_path = (save_name / assembly).with_suffix(".assembly")
+        assembled = assemble(save_name, assembly_path)
+        tc_components.program.clear()
+        tc_components.program.frombytes(assembled)
+    return circuit, build_gate(save, circuit)
+
+
+def render_screen(screen: AsciiScreen) -> str:
+    rows = []
+    for y in range(14):
+        chars = screen.ascii_screen[2 * y * 18 + 1:2 * (y + 1) * 18:2]
+        rows.append("".join(chr(c) if 32 <= c < 127 else " " for c in chars))
+    return "\n".join(rows)
+
+
+class TextFastBotTurtle:
+    def __init__(self):
+        self.pos = (0, 0)
+        self.visited = {(0, 0)}
+
+    def got_output(self, v: int):
+        dx, dy = {0: (1, 0), 1: (0, 1), 2: (-1, 0), 3: (0, -1)}.get(v, (0, 0))
+        self.pos = self.pos[0] + dx, self.pos[1] + dy
+        self.visited.add(self.pos)
+
+    def render(self) -> str:
+        xs = [p[0] for p in self.visited]
+        ys = [p[1] for p in self.visited]
+        return "\n".join(
+            "".join("@" if (x, y) == self.pos else "#" if (x, y) in self.visited else " "
+                    for x in range(min(xs), max(xs) + 1))
+            for y in range(min(ys), max(ys) + 1))
+
+
+def run(node: LogicNodeType, circuit: Circuit | None, input_bytes: bytes, cycles: int | None,
+        until: dict[str, int], fast_bot_turtle: bool = False, raw_output: bool = False, screen_every: int = None,
+        recorder=None, tracer=None) -> tuple[int, str]:
+    inputs = {name: frozenbitarray(pin.bits, endian="little") for name, pin in node.inputs.items()}
+    level_inputs = []
+    level_outputs = []
+    if circuit is not None:
+        for gate in circuit.gates:
+            if gate.name == "Input1_1B" and f"{gate.id}.value" in inputs:
+                level_inputs.append(str(gate.id))
+            elif gate.name == "Output1_1B" and f"{gate.id}.value" in node.outputs:
+                level_outputs.append(str(gate.id))
+
+    queue = deque(input_bytes)
+    tc_components.key_buffer = queue
+    turtle = TextFastBotTurtle() if fast_bot_turtle else None
+    out_stream = sys.stdout.buffer if raw_output else sys.stdout
+    state = node.create_state()
+    cycle = 0
+    reason = "cycle limit"
+    try:
+        while cycles is None or cycle < cycles:
+            for gate_id in level_inputs:
+                inputs[f"{gate_id}.value"] = frozenbitarray(int2ba(queue[0] if queue else 0, 8, endian="little"))
+            if tracer is not None:
+                tracer.cycle = cycle
+            out, state, values = node.evaluate(frozendict(inputs), state, True)
+            if recorder is not None:
+                recorder.sample(values, out)
+            cycle += 1
+            if tracer is not None and tracer.hits:
+                return cycle, f"watchpoint, {tracer.hits[0]}"
+            for gate_id in level_inputs:
+                if out[f"{gate_id}.control"].any():
+                    if not queue:
+                        return cycle, "input exhausted"
+                    queue.popleft()
+            for gate_id in level_outputs:
+                if out[f"{gate_id}.control"].any():
+                    v = ba2int(out[f"{gate_id}.value"])
+                    if turtle is not None:
+                        turtle.got_output(v)
+                    elif raw_output:
+                        out_stream.write(bytes([v]))
+                    else:
+                        print(v, file=out_stream)
+            if screen_every and cycle % screen_every == 0:
+                for screen in screens.values():
+                    print(render_screen(screen), end="\n\n")
+            if any(ba2int(out[name]) == value for name, value in until.items()):
+                return cycle, "halt condition"
+    except KeyboardInterrupt:
+        reason = "interrupted"
+    finally:
+        tc_components.key_buffer = None
+        out_stream.flush()
+        for screen in screens.values():
+            print(render_screen(screen))
+        if turtle is not None:
+            print(turtle.render())
+    return cycle, reason
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="Simulate a save without GUI")
+    parser.add_argument("-l", "--level", action="store")
+    parser.add_argument("-s", "--save", action="store")
+    parser.add_argument("-a", "--assembly", action="store")
+    parser.add_argument("-v", "--verilog", action="store", type=Path)
+    parser.add_argument("-n", "--cycles", type=int, help="Stop after this many cycles")
+    parser.add_argument("--until", action="append", default=[], metavar="OUTPUT=VALUE",
+                        help="Stop once the output pin OUTPUT of the circuit has this value")
+    parser.add_argument("-i", "--input", help="File to read keyboard and level input from, - for stdin")
+    parser.add_argument("--fast-bot-turtle", action="store_true")
+    parser.add_argument("--raw-output", action="store_true", help="Write level outputs as bytes, not numbers")
+    parser.add_argument("--screen-every", type=int, help="Also print the AsciiScreens every N cycles")
+    parser.add_argument("--vcd", type=Path, help="Record the simulation into this VCD file")
+    parser.add_argument("--trace", action="append", help="Glob pattern over the signal paths to record with --vcd")
+    parser.add_argument("--profile", action="store_true", help="Print the nodes that took the most time")
+    parser.add_argument("--no-cache", action="store_true", help="Don't use the compile cache for custom components")
+    parser.add_argument("--paged-ram", action="store_true",
+                        help="Keep the content of Ram components in sparse pages instead of the circuit state")
+    parser.add_argument("--ram-dir", type=Path,
+                        help="Map the content of each Ram component from a file in this directory, implies --paged-ram")
+    parser.add_argument("--keep-ram", action="store_true",
+                        help="Start with the content the files in --ram-dir have, instead of zeroing them")
+    parser.add_argument("--program-image", type=Path,
+                        help="Map this file read only as the program of Program components, instead of --assembly")
+    parser.add_argument("--watch", action="append", default=[], metavar="[r|w]START[-END][@RAM]",
+                        help="Stop on a read (r) or write (w), by default either, of a Ram address in [START, END), "
+                             "optionally only in the Ram components matching the glob pattern RAM")
+    parser.add_argument("--trace-memory", type=Path, help="Log every Ram access into this binary file")
+    ns = parser.parse_args(argv)
+    if ns.no_cache:
+        compile_cache.enabled = False
+    if ns.ram_dir is not None:
+        ns.ram_dir.mkdir(parents=True, exist_ok=True)
+        tc_components.ram_directory = ns.ram_dir
+        tc_components.keep_ram_contents = ns.keep_ram
+    elif ns.keep_ram:
+        parser.error("--keep-ram needs --ram-dir")
+    if ns.program_image is not None:
+        tc_components.program_memory = MappedMemory(ns.program_image, readonly=True)
+    if ns.verilog is None and (ns.level is None or ns.save is None):
+        parser.error("Either --verilog or both --level and --save are required")
+    if ns.cycles is None and not ns.until and ns.input is None:
+        parser.error("Nothing would stop the simulation, give --cycles, --until or --input")
+    try:
+        watchpoints = [parse_watchpoint(w) for w in ns.watch]
+    except ValueError as e:
+        parser.error(f"Invalid --watch: {e}")
+    until = {}
+    for condition in ns.until:
+        name, eq, value = condition.partition("=")
+        if not eq:
+            parser.error(f"--until {condition!r} isn't of the form OUTPUT=VALUE")
+        try:
+            until[name] = int(value, 0)
+        except ValueError:
+            parser.error(f"--until {condition!r} has no valid integer value")
+
+    if ns.input == "-":
+        input_bytes = sys.stdin.buffer.read()
+    elif ns.input is not None:
+        input_bytes = Path(ns.input).read_bytes()
+    else:
+        input_bytes = b""
+
+    start = perf_counter()
+    circuit, node = load_node(ns.level, ns.save, ns.assembly, ns.verilog)
+    node.execution_order
+    if ns.paged_ram or ns.ram_dir is not None:
+        node = tc_components.instantiate_paged_ram(node)
+    print(f"Compiled {node.name} in {perf_counter() - start:.2f}s", file=sys.stderr)
+    unknown = [name for name in until if name not in node.outputs]
+    if unknown:
+        parser.error(f"--until names unknown outputs {', '.join(unknown)}, "
+                     f"the circuit has {', '.join(node.outputs) or 'none'}")
+
+    with ExitStack() as stack:
+        # Every file mapping made for this run, `instantiate_paged_ram` registers all of its Rams in `memories`
+        for memory in (*tc_components.memories.values(), tc_components.program_memory):
+            if isinstance(memory, MappedMemory):
+                stack.callback(memory.close)
+        recorder = profiler = tracer = None
+        if ns.vcd is not None:
+            from .waveform import WaveformRecorder
+            recorder = stack.enter_context(WaveformRecorder(node, ns.vcd, ns.trace or ("*",)))
+        if ns.profile:
+            from .profiler import EvaluationProfiler
+            profiler = stack.enter_context(EvaluationProfiler(root_name=node.name))
+        if watchpoints or ns.trace_memory is not None:
+            tracer = stack.enter_context(MemoryTracer(ns.trace_memory, watchpoints))
+        start = perf_counter()
+        cycles, reason = run(node, circuit, input_bytes, ns.cycles, until, ns.fast_bot_turtle, ns.raw_output,
+                             ns.screen_every, recorder, tracer)
+        elapsed = perf_counter() - start
+    print(f"Stopped after {cycles} cycles ({reason}), {cycles / elapsed if elapsed else 0:.1f} cycles/sec",
+          file=sys.stderr)
+    if profiler is not None:
+        print(profiler.table(group="type", limit=20), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
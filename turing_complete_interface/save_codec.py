@@ -0,0 +1,418 @@
+"""
+A pure Python reader and writer for `circuit.data`, with the same interface as the `save_monger` Nim module:
+`parse_state`, `state_to_binary` and `is_virtual` take and return the same dicts and strings.
+`circuit_parser` falls back to this module when save_monger can't be imported.
+
+Reading works directly on the given buffer (`bytes`, `bytearray`, `mmap` or a `memoryview` of them) with
+`struct.unpack_from`. With `lazy=True` the components and wires are only located, and each one is decoded
+the first time it is accessed.
+"""
+from __future__ import annotations
+
+import re
+from struct import Struct
+from typing import Any, Callable, Sequence, Iterable
+
+FORMAT_VERSION = 1
+TELEPORT_WIRE = 0b0010_0000
+
+COMPONENT_KINDS = (
+    "Error", "Off", "On", "Buffer1", "Not", "And", "And3", "Nand", "Or", "Or3", "Nor", "Xor", "Xnor", "ByteCounter",
+    "VirtualByteCounter", "QwordCounter", "VirtualQwordCounter", "Ram", "VirtualRam", "QwordRam", "VirtualQwordRam",
+    "Stack", "VirtualStack", "Register", "VirtualRegister", "RegisterRed", "VirtualRegisterRed", "RegisterRedPlus",
+    "VirtualRegisterRedPlus", "QwordRegister", "VirtualQwordRegister", "ByteSwitch", "ByteMux", "Decoder1",
+    "Decoder3", "ByteConstant", "ByteNot", "ByteOr", "ByteAnd", "ByteXor", "ByteEqual", "ByteLessUOld",
+    "ByteLessIOld", "ByteNeg", "ByteAdd", "ByteMul", "ByteSplitter", "ByteMaker", "QwordSplitter", "QwordMaker",
+    "FullAdder", "BitMemory", "VirtualBitMemory", "SRLatch", "DELETED_0", "Clock", "WaveformGenerator", "HttpClient",
+    "DELETED_1", "Keypad", "FileRom", "Halt", "WireCluster", "Screen", "Program1", "Program1Red", "DELETED_2",
+    "DELETED_3", "Program4", "LevelGate", "Input1", "Input2Pin", "Input3Pin", "Input4Pin", "InputConditions",
+    "Input8", "Input64", "InputCode", "Input1_1B", "Output1", "Output1Sum", "Output1Car", "Output1Aval",
+    "Output1Bval", "Output2Pin", "Output3Pin", "Output4Pin", "Output8", "Output64", "Output1_1B", "OutputCounter",
+    "InputOutput", "Custom", "VirtualCustom", "QwordProgram", "DelayLine", "VirtualDelayLine", "Console", "ByteShl",
+    "ByteShr", "QwordConstant", "QwordNot", "QwordOr", "QwordAnd", "QwordXor", "QwordNeg", "QwordAdd", "QwordMul",
+    "QwordEqual", "QwordLessU", "QwordLessI", "QwordShl", "QwordShr", "QwordMux", "QwordSwitch", "ProbeComponentBit",
+    "ProbeComponentWord", "AndOrLatch", "NandNandLatch", "NorNorLatch", "ByteLessU", "ByteLessI", "DotMatrixDisplay",
+    "SegmentDisplay", "Input16", "Input32", "Output16", "Output32", "Bidirectional1", "Bidirectional8",
+    "Bidirectional16", "Bidirectional32", "Bidirectional64", "Buffer8", "Buffer16", "Buffer32", "Buffer64",
+    "ProbeWireBit", "ProbeWireWord",)
+KIND_IDS = {name: i for i, name in enumerate(COMPONENT_KINDS)}
+WIRE_KINDS = ("wk_1", "wk_8", "wk_64", "wk_16", "wk_32")
+
+VIRTUAL_KINDS = frozenset({
+    "VirtualDelayLine", "VirtualQwordRam", "VirtualBitMemory", "VirtualRam", "VirtualRegisterRedPlus",
+    "VirtualRegister", "VirtualStack", "VirtualQwordRegister", "VirtualByteCounter", "VirtualRegisterRed",
+    "VirtualQwordCounter", "VirtualCustom",
+})
+# Kinds that store a program name after the custom string (DELETED_2 and DELETED_3 only when reading)
+PROGRAM_KINDS = frozenset({"Program1", "DELETED_2", "DELETED_3", "Program4", "QwordProgram"})
+DELETED_KINDS = frozenset({"Error", "DELETED_0", "DELETED_1", "DELETED_2", "DELETED_3"})
+
+DIRECTIONS = ((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1))
+_DIRECTION_IDS = {d: i for i, d in enumerate(DIRECTIONS)}
+
+_U16 = Struct("<H")
+_I8_POINT = Struct("<bb")
+_I64 = Struct("<q")
+_POINT = Struct("<hh")
+_COMPONENT = Struct("<HhhBq")  # kind, x, y, rotation, permanent_id
+_COMPONENT_V0 = Struct("<HbbBI")
+_WIRE = Struct("<qBB")  # unused id, kind, color
+_WIRE_V0 = Struct("<IBB")
+_HEADER = Struct("<qIIBIB")  # save_version, nand, delay, menu_visible, clock_speed, nesting_level
+
+
+def is_virtual(kind: str) -> bool:
+    return kind in VIRTUAL_KINDS
+
+
+def _point(x: int, y: int) -> dict[str, int]:
+    return {"x": x, "y": y}
+
+
+def _get_string(view: memoryview, i: int) -> tuple[str, int]:
+    n, = _I64.unpack_from(view, i)
+    i += 8
+    # Nim strings are bytes, save_monger hands them to Python as utf-8
+    return str(view[i:i + n], "utf-8", "surrogateescape"), i + n
+
+
+def _skip_string(view: memoryview, i: int) -> int:
+    return i + 8 + _I64.unpack_from(view, i)[0]
+
+
+def _get_component(view: memoryview, i: int) -> tuple[dict[str, Any], int]:
+    kind_id, x, y, rotation, permanent_id = _COMPONENT.unpack_from(view, i)
+    kind = COMPONENT_KINDS[kind_id] if kind_id < len(COMPONENT_KINDS) else "Error"
+    custom_string, i = _get_string(view, i + _COMPONENT.size)
+    component = {
+        "kind": kind, "position": _point(x, y), "rotation": rotation, "real_offset": 0,
+        "permanent_id": permanent_id, "custom_string": custom_string, "custom_id": 0, "program_name": "",
+    }
+    if kind in PROGRAM_KINDS:
+        component["program_name"], i = _get_string(view, i)
+    elif kind == "Custom":
+        component["custom_id"], = _I64.unpack_from(view, i)
+        i += 8
+    return component, i
+
+
+def _skip_component(view: memoryview, i: int) -> tuple[str, int]:
+    kind_id, = _U16.unpack_from(view, i)
+    kind = COMPONENT_KINDS[kind_id] if kind_id < len(COMPONENT_KINDS) else "Error"
+    i = _skip_string(view, i + _COMPONENT.size)
+    if kind in PROGRAM_KINDS:
+        i = _skip_string(view, i)
+    elif kind == "Custom":
+        i += 8
+    return kind, i
+
+
+def _get_path(view: memoryview, i: int) -> tuple[list[dict[str, int]], int]:
+    x, y = _POINT.unpack_from(view, i)
+    i += 4
+    path = [_point(x, y)]
+    segment = view[i]
+    i += 1
+    # A wire between two points that aren't in a straight line
+    if segment == TELEPORT_WIRE:
+        path.append(_point(*_POINT.unpack_from(view, i)))
+        return path, i + 4
+    while segment & 0b0001_1111:
+        dx, dy = DIRECTIONS[segment >> 5]
+        for _ in range(segment & 0b0001_1111):
+            x += dx
+            y += dy
+            path.append(_point(x, y))
+        segment = view[i]
+        i += 1
+    return path, i
+
+
+def _get_wire(view: memoryview, i: int) -> tuple[dict[str, Any], int]:
+    _, kind, color = _WIRE.unpack_from(view, i)
+    comment, i = _get_string(view, i + _WIRE.size)
+    path, i = _get_path(view, i)
+    return {"path": path, "kind": WIRE_KINDS[kind], "color": color, "comment": comment}, i
+
+
+# The segments that end a path, those of length 0 (see `_get_path`)
+_PATH_END = re.compile(b"[" + re.escape(bytes(range(0, 256, 0b0010_0000))) + b"]")
+
+
+def _skip_wire(data, view: memoryview, i: int) -> int:
+    i = _skip_string(view, i + _WIRE.size) + 4
+    if view[i] == TELEPORT_WIRE:
+        return i + 5
+    return _PATH_END.search(data, i).end()
+
+
+class LazyRecords(Sequence):
+    """ Components or wires that are decoded when accessed, then kept """
+
+    def __init__(self, view: memoryview, offsets: list[int], decode: Callable[[memoryview, int], tuple[Any, int]]):
+        self._view = view
+        self._offsets = offsets
+        self._decode = decode
+        self._decoded: list[Any] = [None] * len(offsets)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        record = self._decoded[index]
+        if record is None:
+            record = self._decoded[index] = self._decode(self._view, self._offsets[index])[0]
+        return record
+
+    def __iter__(self):
+        # Records that weren't accessed yet are decoded without keeping them, so a single pass stays small
+        view, decode, decoded = self._view, self._decode, self._decoded
+        for record, offset in zip(decoded, self._offsets):
+            yield record if record is not None else decode(view, offset)[0]
+
+
+def _empty_result() -> dict[str, Any]:
+    return {
+        "components": [], "wires": [], "save_version": 0, "nand": 99999, "delay": 99999, "menu_visible": True,
+        "nesting_level": 0, "clock_speed": 100000, "dependencies": [], "description": "", "centered": False,
+        "camera_position": _point(0, 0),
+    }
+
+
+def _parse_header(view: memoryview, result: dict[str, Any]) -> int:
+    (result["save_version"], result["nand"], result["delay"], menu_visible, result["clock_speed"],
+     result["nesting_level"]) = _HEADER.unpack_from(view, 1)
+    result["menu_visible"] = menu_visible != 0
+    i = 1 + _HEADER.size
+    count, = _I64.unpack_from(view, i)
+    result["dependencies"] = [d for d, in _I64.iter_unpack(view[i + 8:i + 8 + 8 * count])]
+    result["description"], i = _get_string(view, i + 8 + 8 * count)
+    return i
+
+
+def _parse_v1(data, view: memoryview, result: dict[str, Any], meta_only: bool, lazy: bool):
+    i = _parse_header(view, result)
+    result["centered"] = view[i] != 0
+    result["camera_position"] = _point(*_POINT.unpack_from(view, i + 1))
+    i += 6  # centered, camera position and whether there is a cached design
+    if meta_only:
+        return
+
+    count, = _I64.unpack_from(view, i)
+    i += 8
+    if lazy:
+        offsets = []
+        for _ in range(count):
+            kind, end = _skip_component(view, i)
+            if kind != "Error":
+                offsets.append(i)
+            i = end
+        result["components"] = LazyRecords(view, offsets, _get_component)
+    else:
+        components = result["components"]
+        for _ in range(count):
+            component, i = _get_component(view, i)
+            if component["kind"] != "Error":
+                components.append(component)
+
+    count, = _I64.unpack_from(view, i)
+    i += 8
+    if lazy:
+        offsets = []
+        for _ in range(count):
+            offsets.append(i)
+            i = _skip_wire(data, view, i)
+        result["wires"] = LazyRecords(view, offsets, _get_wire)
+    else:
+        wires = result["wires"]
+        for _ in range(count):
+            wire, i = _get_wire(view, i)
+            wires.append(wire)
+
+
+def _parse_v0(view: memoryview, result: dict[str, Any], meta_only: bool):
+    # Before 2022: 8 bit positions, 32 bit ids and wires stored as every point
+    i = _parse_header(view, result)
+    if meta_only:
+        return
+    count, = _I64.unpack_from(view, i)
+    i += 8
+    for _ in range(count):
+        kind_id, x, y, rotation, permanent_id = _COMPONENT_V0.unpack_from(view, i)
+        kind = COMPONENT_KINDS[kind_id] if kind_id < len(COMPONENT_KINDS) else "Error"
+        custom_string, i = _get_string(view, i + _COMPONENT_V0.size)
+        component = {
+            "kind": kind, "position": _point(x, y), "rotation": rotation, "real_offset": 0,
+            "permanent_id": permanent_id, "custom_string": custom_string, "custom_id": 0, "program_name": "",
+        }
+        if kind in PROGRAM_KINDS:
+            component["program_name"], i = _get_string(view, i)
+        elif kind == "Custom":
+            component["custom_id"], = _I64.unpack_from(view, i)
+            i += 8
+        if kind not in DELETED_KINDS:
+            result["components"].append(component)
+    count, = _I64.unpack_from(view, i)
+    i += 8
+    for _ in range(count):
+        _, kind, color = _WIRE_V0.unpack_from(view, i)
+        comment, i = _get_string(view, i + _WIRE_V0.size)
+        points, = _I64.unpack_from(view, i)
+        i += 8
+        path = [_point(x, y) for x, y in _I8_POINT.iter_unpack(view[i:i + 2 * points])]
+        i += 2 * points
+        result["wires"].append({"path": path, "kind": WIRE_KINDS[kind], "color": color, "comment": comment})
+
+
+def _parse_text(data, result: dict[str, Any], meta_only: bool):
+    # The first save format, `|` separated text
+    parts = str(data, "utf-8", "surrogateescape").split("|")
+    if len(parts) not in (4, 5):
+        return
+    if parts[3]:
+        try:
+            nand, delay = parts[3].split(",")[:2]
+            result["nand"], result["delay"] = int(nand), int(delay)
+        except ValueError:
+            pass
+    if len(parts) == 5 and parts[4]:
+        result["save_version"] = int(parts[4])
+    if meta_only:
+        return
+    for comp_string in parts[1].split(";") if parts[1] else ():
+        comp_parts = comp_string.split("`")
+        if len(comp_parts) != 6:
+            continue
+        try:
+            kind = comp_parts[0]
+            if kind not in KIND_IDS:
+                continue
+            x, y = int(comp_parts[1]), int(comp_parts[2])
+            if not (-2 ** 15 <= x < 2 ** 15 and -2 ** 15 <= y < 2 ** 15):
+                continue
+            component = {
+                "kind": kind, "position": _point(x, y), "rotation": int(comp_parts[3]), "real_offset": 0,
+                "permanent_id": int(comp_parts[4]) % 2 ** 32, "custom_string": comp_parts[5], "custom_id": 0,
+                "program_name": "",
+            }
+        except ValueError:
+            continue
+        if kind == "Custom":
+            try:
+                component["custom_id"] = int(comp_parts[5])
+            except ValueError:
+                # save_monger hashes the old string names with Nim's string hash, which isn't reproduced here
+                pass
+        result["components"].append(component)
+    for circ_string in parts[2].split(";") if parts[2] else ():
+        circ_parts = circ_string.split("`")
+        if len(circ_parts) != 5:
+            continue
+        numbers = [int(n) for n in circ_parts[4].split(",")]
+        result["wires"].append({
+            "path": [_point(x, y) for x, y in zip(numbers[::2], numbers[1::2])],
+            "kind": WIRE_KINDS[int(circ_parts[1])],
+            "color": int(circ_parts[2]),
+            "comment": circ_parts[3],
+        })
+
+
+def parse_state(data: bytes | bytearray | memoryview | Iterable[int], meta_only: bool = False,
+                lazy: bool = False) -> dict[str, Any]:
+    # Finding the end of wire paths searches `data` with `re`, which lists (as save_monger takes) can't be
+    if isinstance(data, memoryview):
+        base = data.obj
+        data = base if hasattr(base, "find") and data.nbytes == len(base) else bytes(data)
+    elif not hasattr(data, "find"):
+        data = bytes(data)
+    result = _empty_result()
+    if len(data) == 0:
+        return result
+    view = memoryview(data).cast("B")
+    match view[0]:
+        case 49:  # "1"
+            _parse_text(data, result, meta_only)
+        case 0:
+            _parse_v0(view, result, meta_only)
+        case 1:
+            _parse_v1(data, view, result, meta_only, lazy)
+    return result
+
+
+def _get_xy(point) -> tuple[int, int]:
+    if isinstance(point, dict):
+        return point["x"], point["y"]
+    return point[0], point[1]
+
+
+def _add_string(out: bytearray, s: str):
+    b = s.encode("utf-8", "surrogateescape")
+    out += _I64.pack(len(b))
+    out += b
+
+
+def _add_path(out: bytearray, path: list):
+    path = [_get_xy(p) for p in path]
+    out += _POINT.pack(*path[0])
+    offset = 0
+    high = len(path) - 1
+    while offset < high:
+        original_direction = _DIRECTION_IDS.get((path[offset + 1][0] - path[offset][0],
+                                                 path[offset + 1][1] - path[offset][1]), -1)
+        if original_direction == -1:
+            if len(path) == 2:
+                out.append(TELEPORT_WIRE)
+                out += _POINT.pack(*path[1])
+                return
+            break
+        # 5 bits for the length, so segments are at most 31 long
+        max_length = min(high - offset, 0b0001_1111)
+        length = 1
+        while length < max_length:
+            a, b = path[offset + length], path[offset + length + 1]
+            if _DIRECTION_IDS.get((b[0] - a[0], b[1] - a[1]), -1) != original_direction:
+                break
+            length += 1
+        out.append((original_direction << 5) | length)
+        offset += length
+    out.append(0)
+
+
+def state_to_binary(save_version: int, components: list[dict], wires: list[dict], nand: int, delay: int,
+                    menu_visible: bool, clock_speed: int, nesting_level: int, description: str,
+                    camera_position) -> bytearray:
+    dependencies = []
+    for component in components:
+        if component["kind"] == "Custom" and component["custom_id"] not in dependencies:
+            dependencies.append(component["custom_id"])
+    to_save = [c for c in components if c["kind"] != "WireCluster" and c["kind"] not in VIRTUAL_KINDS]
+
+    out = bytearray([FORMAT_VERSION])
+    out += _HEADER.pack(save_version, nand, delay, bool(menu_visible), clock_speed, nesting_level)
+    out += _I64.pack(len(dependencies))
+    for d in dependencies:
+        out += _I64.pack(d)
+    _add_string(out, description)
+    out.append(1)  # centered
+    out += _POINT.pack(*_get_xy(camera_position))
+    out.append(0)  # has a cached design
+
+    out += _I64.pack(len(to_save))
+    for component in to_save:
+        kind = component["kind"]
+        out += _COMPONENT.pack(KIND_IDS[kind], *_get_xy(component["position"]), component["rotation"],
+                               component["permanent_id"])
+        _add_string(out, component["custom_string"])
+        if kind in ("Program1", "Program4", "QwordProgram"):
+            _add_string(out, component.get("program_name", ""))
+        elif kind == "Custom":
+            out += _I64.pack(component["custom_id"])
+
+    out += _I64.pack(len(wires))
+    for wire in wires:
+        out += _WIRE.pack(0, WIRE_KINDS.index(wire["kind"]), wire["color"])
+        _add_string(out, wire["comment"])
+        _add_path(out, wire["path"])
+    return out
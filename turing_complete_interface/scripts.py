@@ -4,14 +4,12 @@ from typing import Literal, overload, Iterable
 from turing_complete_interface.circuit_builder import build_circuit, IOPosition, layout_with_pydot
 from turing_complete_interface.circuit_compiler import build_gate
 from turing_complete_interface.circuit_parser import Circuit, SCHEMATICS_PATH
-from turing_complete_interface.circuit_viewer import view_circuit
 from turing_complete_interface.from_logic_expression import from_logic_expression
 from turing_complete_interface.from_truth_table import CompactTruthTableGenerator, Pattern, ComponentTemplate, SortPins, \
     FromGates, GatesByKind, CustomByName, FilterPins, Concatenate
 from turing_complete_interface.truth_table import TruthTable, PoS, SoP, LUT, LUTVariable
 from turing_complete_interface.level_layouts import LevelLayout, get_layout
 from turing_complete_interface.logic_nodes import LogicNodeType
-from turing_complete_interface.verilog_parser import parse_verilog, generate_verilog
 
 selected_level: str | None = None
 level_layout: LevelLayout = LevelLayout((-31, -31, 62, 62), None)
@@ -54,6 +52,7 @@ def logic_expression_to_node(expression: str) -> LogicNodeType:
 
 
 def verilog_to_node(verilog: str, module_name: _NameSources | str = USE_MODULE_NAME):
+    from turing_complete_interface.verilog_parser import parse_verilog
     return parse_verilog(verilog)
 
 
@@ -64,6 +63,7 @@ def circuit_to_node(circuit: Circuit, name=None) -> LogicNodeType:
 
 
 def node_to_verilog(node: LogicNodeType, top_module_name: str = None) -> str:
+    from turing_complete_interface.verilog_parser import generate_verilog
     return generate_verilog(node, top_module_name or node.name)
 
 
@@ -116,6 +116,8 @@ def layout_sop(arg: TruthTable | SoP | tuple[SoP, ...], use_buffer) -> Circuit:
 
 
 def show_circuit(circuit: Circuit, no_simulation=False):
+    # Only viewing needs pygame and tkinter, so don't import them for headless scripts
+    from turing_complete_interface.circuit_viewer import view_circuit
     view_circuit(circuit,
                  build_gate(selected_level or "main", circuit) if not no_simulation else None,
                  get_layout(selected_level).new_space())
@@ -0,0 +1,169 @@
+"""
+Runs a simulation in a background thread, so that a viewer can keep rendering at its own frame rate.
+The viewer sends commands (`step`, `run`, `pause`, `toggle`, `set_inputs`) and reads the latest `Snapshot`.
+The io handler is called from the simulation thread with `io_lock` held, which the viewer has to hold as well while
+it uses the handler.
+"""
+from __future__ import annotations
+
+import queue
+import threading
+from dataclasses import dataclass
+from graphlib import CycleError
+from time import perf_counter
+from typing import Mapping, Optional, Any, Protocol
+
+from bitarray import frozenbitarray
+from bitarray.util import int2ba, ba2int
+from frozendict import frozendict
+
+from .logic_nodes import LogicNodeType, NodePin
+
+RATE_WINDOW = 0.5  # seconds over which cycles/sec is averaged
+
+
+class IOHandler(Protocol):
+    # The part of `circuit_viewer.WorldHandler` the simulation talks to
+    def get_input(self) -> int: ...
+
+    def took_input(self): ...
+
+    def got_output(self, v: int): ...
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    cycle: int
+    outputs: Mapping[str, frozenbitarray]
+    values: Mapping[NodePin, frozenbitarray]
+    state: Optional[frozenbitarray]
+    running: bool
+    cycles_per_second: float
+    error: Optional[Exception] = None
+    # The nodes of a combinational cycle, if that is what stopped the simulation
+    cycle_nodes: Optional[list[str]] = None
+
+    def output_ints(self) -> dict[str, int]:
+        return {name: ba2int(v) for name, v in self.outputs.items()}
+
+
+class SimulationWorker:
+    def __init__(self, node: LogicNodeType, io_handler: IOHandler = None, recorder=None):
+        self.node = node
+        self.io_handler = io_handler
+        self.recorder = recorder
+        self.io_lock = threading.Lock()
+        self._inputs = {name: frozenbitarray(pin.bits, endian="little") for name, pin in node.inputs.items()}
+        self._state = node.create_state()
+        self._cycle = 0
+        self._commands: queue.SimpleQueue[tuple[str, Any]] = queue.SimpleQueue()
+        # Double buffered: the worker fills the back buffer, then flips `_front` over to it
+        self._buffers: list[Optional[Snapshot]] = [
+            Snapshot(0, frozendict(), frozendict(), self._state, False, 0.0), None]
+        self._front = 0
+        self._thread = threading.Thread(target=self._main, name=f"Simulation of {node.name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    @property
+    def snapshot(self) -> Snapshot:
+        return self._buffers[self._front]
+
+    def step(self, cycles: int = 1):
+        self._commands.put(("step", cycles))
+
+    def run(self):
+        self._commands.put(("run", None))
+
+    def pause(self):
+        self._commands.put(("pause", None))
+
+    def toggle(self):
+        # Resolved by the worker, `snapshot.running` may not show an earlier command yet
+        self._commands.put(("toggle", None))
+
+    def set_inputs(self, **values: int | frozenbitarray):
+        self._commands.put(("inputs", values))
+
+    def stop(self, timeout: float = None):
+        self._commands.put(("stop", None))
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _publish(self, outputs, values, running: bool, rate: float, error: Exception = None, cycle_nodes=None):
+        back = 1 - self._front
+        self._buffers[back] = Snapshot(self._cycle, outputs, values, self._state, running, rate, error, cycle_nodes)
+        self._front = back
+
+    def _set_inputs(self, values: Mapping[str, int | frozenbitarray]):
+        for name, value in values.items():
+            if isinstance(value, int):
+                value = frozenbitarray(int2ba(value % 2 ** self.node.inputs[name].bits,
+                                              self.node.inputs[name].bits, endian="little"))
+            self._inputs[name] = value
+
+    def _step(self) -> tuple[Mapping[str, frozenbitarray], Mapping[NodePin, frozenbitarray]]:
+        handler = self.io_handler
+        if handler is not None:
+            with self.io_lock:
+                self._set_inputs({"3.value": handler.get_input()})
+        outputs, self._state, values = self.node.evaluate(frozendict(self._inputs), self._state, True)
+        self._cycle += 1
+        if self.recorder is not None:
+            self.recorder.sample(values, outputs)
+        if handler is not None and (outputs["3.control"].any() or outputs["4.control"].any()):
+            with self.io_lock:
+                if outputs["3.control"].any():
+                    handler.took_input()
+                if outputs["4.control"].any():
+                    handler.got_output(ba2int(outputs["4.value"]))
+        return outputs, values
+
+    def _main(self):
+        running = False
+        pending = 0
+        outputs, values = frozendict(), frozendict()
+        rate = 0.0
+        window_start, window_cycle = perf_counter(), 0
+        while True:
+            block = not running and not pending
+            while True:
+                try:
+                    command, arg = self._commands.get(block=block, timeout=RATE_WINDOW if block else None)
+                except queue.Empty:
+                    break
+                block = False
+                match command:
+                    case "step":
+                        pending += arg
+                    case "run":
+                        running = True
+                    case "pause":
+                        running = False
+                        pending = 0
+                    case "toggle":
+                        running = not running and not pending
+                        pending = 0
+                    case "inputs":
+                        self._set_inputs(arg)
+                    case "stop":
+                        return
+            if running or pending:
+                try:
+                    outputs, values = self._step()
+                except CycleError as e:
+                    running, pending = False, 0
+                    self._publish(outputs, values, False, 0.0, e, [exe.node for exe in e.args[-1]])
+                    continue
+                except Exception as e:
+                    running, pending = False, 0
+                    self._publish(outputs, values, False, 0.0, e)
+                    continue
+                if pending:
+                    pending -= 1
+            now = perf_counter()
+            if now - window_start >= RATE_WINDOW:
+                rate = (self._cycle - window_cycle) / (now - window_start)
+                window_start, window_cycle = now, self._cycle
+            self._publish(outputs, values, running or bool(pending), rate)
@@ -0,0 +1,110 @@
+"""
+A uniform grid over world coordinates, to find the gates and wires inside a rectangle without looking at all of them.
+"""
+from __future__ import annotations
+
+from math import floor
+from typing import Generic, TypeVar, Iterable
+
+from .circuit_parser import Circuit, GateReference, GateShape, CircuitWire, Pos
+
+_T = TypeVar("_T")
+
+
+class GridIndex(Generic[_T]):
+    def __init__(self, cell_size: int = 16):
+        self.cell_size = cell_size
+        self.items: list[_T] = []
+        self.cells: dict[tuple[int, int], list[int]] = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def _cell_range(self, x0: float, y0: float, x1: float, y1: float) -> tuple[int, int, int, int]:
+        s = self.cell_size
+        return floor(min(x0, x1) / s), floor(min(y0, y1) / s), floor(max(x0, x1) / s), floor(max(y0, y1) / s)
+
+    def _insert_index(self, i: int, x0: float, y0: float, x1: float, y1: float):
+        cx0, cy0, cx1, cy1 = self._cell_range(x0, y0, x1, y1)
+        cells = self.cells
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cell = cells.get((cx, cy))
+                if cell is None:
+                    cells[cx, cy] = [i]
+                elif cell[-1] != i:
+                    cell.append(i)
+
+    def insert(self, item: _T, x0: float, y0: float, x1: float, y1: float) -> int:
+        """ Adds an item covering the rectangle with the corners (x0, y0) and (x1, y1), both inclusive """
+        i = len(self.items)
+        self.items.append(item)
+        self._insert_index(i, x0, y0, x1, y1)
+        return i
+
+    def insert_path(self, item: _T, points: Iterable[Pos]) -> int:
+        """ Adds an item covering the segments between consecutive points, e.g. a wire """
+        i = len(self.items)
+        self.items.append(item)
+        it = iter(points)
+        last = next(it, None)
+        if last is not None:
+            self._insert_index(i, *last, *last)
+        for p in it:
+            self._insert_index(i, *last, *p)
+            last = p
+        return i
+
+    def query(self, x0: float, y0: float, x1: float, y1: float) -> list[_T]:
+        """ The items that might intersect the rectangle, in the order they were inserted """
+        cx0, cy0, cx1, cy1 = self._cell_range(x0, y0, x1, y1)
+        found = set()
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.cells):
+            # Zoomed out far enough that looking at the filled cells is cheaper
+            for (cx, cy), cell in self.cells.items():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1:
+                    found.update(cell)
+        else:
+            cells = self.cells
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    cell = cells.get((cx, cy))
+                    if cell is not None:
+                        found.update(cell)
+        items = self.items
+        return [items[i] for i in sorted(found)]
+
+
+def gate_rect(gate: GateReference, shape: GateShape) -> tuple[int, int, int, int]:
+    x, y, w, h = shape.bounding_box
+    (ax, ay), (bx, by) = gate.translate((x, y)), gate.translate((x + w - 1, y + h - 1))
+    return min(ax, bx), min(ay, by), max(ax, bx), max(ay, by)
+
+
+class CircuitIndex:
+    """
+    The gates (together with their shapes) and wires of a circuit. Built once, `is_current` tells
+    whether gates or wires have been added since.
+    """
+
+    def __init__(self, circuit: Circuit, cell_size: int = 16):
+        from .tc_components import get_component
+
+        self.circuit = circuit
+        self.gates: GridIndex[tuple[GateReference, GateShape]] = GridIndex(cell_size)
+        self.wires: GridIndex[CircuitWire] = GridIndex(cell_size)
+        for gate in circuit.gates:
+            shape, _ = get_component(gate.name, gate.custom_data if gate.name != "Custom" else gate.custom_id, True)
+            self.gates.insert((gate, shape), *gate_rect(gate, shape))
+        for wire in circuit.wires:
+            self.wires.insert_path(wire, wire.positions)
+
+    def is_current(self, circuit: Circuit) -> bool:
+        return (circuit is self.circuit and len(circuit.gates) == len(self.gates)
+                and len(circuit.wires) == len(self.wires))
+
+    def gates_in(self, x0: float, y0: float, x1: float, y1: float) -> list[tuple[GateReference, GateShape]]:
+        return self.gates.query(x0, y0, x1, y1)
+
+    def wires_in(self, x0: float, y0: float, x1: float, y1: float) -> list[CircuitWire]:
+        return self.wires.query(x0, y0, x1, y1)
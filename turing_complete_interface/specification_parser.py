@@ -1,13 +1,22 @@
 from __future__ import annotations
 
+import hashlib
+import io
+import os
+import pickle
+import re
+from collections import defaultdict
+from dataclasses import dataclass
 from graphlib import TopologicalSorter
 from pathlib import Path
+from typing import Iterator, Mapping
 
 import lark
 from frozendict import frozendict
 from lark import Transformer, v_args
 from tree_ql import LarkQuery
 
+from turing_complete_interface import compile_cache
 from turing_complete_interface.logic_nodes import InputPin, OutputPin, Wire, CombinedLogicNode, LogicNodeType, \
     builtins_gates
 
@@ -90,7 +99,7 @@ NAME: /\w+/
 INT: /\d+/
 %ignore /\s+/
 %ignore /#[^\n]*/
-""", parser="lalr", maybe_placeholders=True)
+""", parser="lalr", maybe_placeholders=True, cache=True)
 
 name_query = LarkQuery('/name/*[@type=="NAME"]/@value')
 deps_query = LarkQuery('/components/component/*[1::2]')
@@ -101,34 +110,222 @@ def get_name_of_component(path: Path) -> str:
     return name_query.execute(tree)
 
 
-def load_all_components(base_path: Path) -> dict[str, LogicNodeType]:
-    parsed = {}
+def _parse_spec(spec: Path, text: str = None) -> tuple[str, tuple[str, ...], lark.Tree] | None:
+    try:
+        tree = parser.parse(spec.read_text("utf-8") if text is None else text)
+    except lark.LarkError as e:
+        print(f"Can't parse {spec}", e)
+        return None
+    deps = deps_query.execute(tree)
+    if deps is None:
+        deps = []
+    elif not isinstance(deps, list):
+        deps = [deps]
+    return name_query.execute(tree), tuple(d for d in deps if d not in builtins_gates), tree
+
+
+def _build_components(parsed: dict[str, tuple[tuple[str, ...], lark.Tree]], compiled: dict[str, LogicNodeType]):
+    # Dependencies that are not in `parsed` have to already be in `compiled`
     sorter = TopologicalSorter()
-    for spec in base_path.rglob("*.spec"):
-        try:
-            tree = parser.parse(spec.read_text("utf-8"))
-        except lark.LarkError as e:
-            print(f"Can't parse {spec}", e)
-            continue
-        name = name_query.execute(tree)
-        parsed[name] = tree
-
-        deps = deps_query.execute(tree)
-        if deps is not None and not isinstance(deps, list):
-            deps = [deps]
-        if deps:
-            sorter.add(name, *filter(lambda n: n not in builtins_gates, deps))
-        else:
-            sorter.add(name)
+    for name, (deps, _) in parsed.items():
+        sorter.add(name, *(d for d in deps if d in parsed))
     sorter.prepare()
-    compiled = {**builtins_gates}
     builder = Builder(compiled)
     while sorter.is_active():
         for name in sorter.get_ready():
-            tree = parsed[name]
-            compiled[name] = builder.transform(tree)
+            compiled[name] = builder.transform(parsed[name][1])
             sorter.done(name)
+
+
+def load_all_components(base_path: Path, cache_file: Path = None) -> dict[str, LogicNodeType]:
+    if cache_file is not None:
+        return _load_all_components_cached(base_path, cache_file)
+    parsed = {}
+    for spec in base_path.rglob("*.spec"):
+        if (res := _parse_spec(spec)) is not None:
+            name, deps, tree = res
+            parsed[name] = deps, tree
+    compiled = {**builtins_gates}
+    _build_components(parsed, compiled)
+    return compiled
+
+
+SPEC_CACHE_FORMAT = 2
+
+
+@dataclass(frozen=True)
+class _SpecFileEntry:
+    mtime: int
+    size: int
+    hash: str
+    name: str | None  # None if the file couldn't be parsed
+    deps: tuple[str, ...]
+
+
+class _SpecPickler(pickle.Pickler):
+    # The builtin gates contain lambdas, store them by name
+    def persistent_id(self, obj):
+        if isinstance(obj, LogicNodeType) and builtins_gates.get(obj.name) is obj:
+            return obj.name
+        return None
+
+
+class _SpecUnpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        return builtins_gates[pid]
+
+
+def spec_cache_file(base_path: Path) -> Path | None:
+    if not compile_cache.enabled or (cache_path := compile_cache.get_cache_path()) is None:
+        return None
+    digest = hashlib.sha256(str(base_path.resolve()).encode()).hexdigest()[:16]
+    return cache_path / "specs" / f"{digest}.pickle"
+
+
+def _read_spec_cache(cache_file: Path) -> tuple[dict[str, _SpecFileEntry], dict[str, LogicNodeType]]:
+    try:
+        data = _SpecUnpickler(io.BytesIO(cache_file.read_bytes())).load()
+    except FileNotFoundError:
+        return {}, {}
+    except Exception as e:
+        print(f"Ignoring broken spec cache {cache_file}:", type(e), e)
+        return {}, {}
+    if data.get("version") != (SPEC_CACHE_FORMAT, compile_cache.library_version()):
+        return {}, {}
+    return data["files"], data["components"]
+
+
+def _write_spec_cache(cache_file: Path, files: dict[str, _SpecFileEntry], components: dict[str, LogicNodeType]):
+    buffer = io.BytesIO()
+    _SpecPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump({
+        "version": (SPEC_CACHE_FORMAT, compile_cache.library_version()),
+        "files": files,
+        "components": {name: node for name, node in components.items() if name not in builtins_gates},
+    })
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(buffer.getvalue())
+        os.replace(tmp, cache_file)
+    except OSError as e:
+        print("Can't write spec cache:", type(e), e)
+
+
+def _load_all_components_cached(base_path: Path, cache_file: Path) -> dict[str, LogicNodeType]:
+    # Only the specs that changed (by mtime and size, then by content hash) and the ones that depend on them
+    # are parsed and compiled again, everything else comes out of the cache file.
+    old_files, old_components = _read_spec_cache(cache_file)
+    files: dict[str, _SpecFileEntry] = {}
+    changed: set[str] = set()
+    parsed = {}
+    for spec in base_path.rglob("*.spec"):
+        key = str(spec.relative_to(base_path))
+        st = spec.stat()
+        old = old_files.get(key)
+        if old is not None and (old.mtime, old.size) == (st.st_mtime_ns, st.st_size):
+            files[key] = old
+            continue
+        raw = spec.read_bytes()
+        digest = hashlib.sha256(raw).hexdigest()
+        if old is not None and old.hash == digest:
+            files[key] = _SpecFileEntry(st.st_mtime_ns, st.st_size, digest, old.name, old.deps)
+            continue
+        if old is not None and old.name is not None:
+            changed.add(old.name)
+        res = _parse_spec(spec, raw.decode("utf-8"))
+        if res is None:
+            files[key] = _SpecFileEntry(st.st_mtime_ns, st.st_size, digest, None, ())
+            continue
+        name, deps, tree = res
+        files[key] = _SpecFileEntry(st.st_mtime_ns, st.st_size, digest, name, deps)
+        parsed[name] = deps, tree
+        changed.add(name)
+    for key in old_files.keys() - files.keys():
+        if old_files[key].name is not None:
+            changed.add(old_files[key].name)
+
+    dependents = defaultdict(set)
+    for entry in files.values():
+        for dep in entry.deps:
+            dependents[dep].add(entry.name)
+    dirty = set()
+    frontier = list(changed)
+    while frontier:
+        name = frontier.pop()
+        if name not in dirty:
+            dirty.add(name)
+            frontier.extend(dependents[name])
+    for key, entry in files.items():
+        if entry.name is not None and (entry.name in dirty or entry.name not in old_components) \
+                and entry.name not in parsed:
+            if (res := _parse_spec(base_path / key)) is not None:
+                parsed[res[0]] = res[1:]
+
+    compiled = {**builtins_gates}
+    compiled.update((name, node) for name, node in old_components.items() if name not in dirty)
+    _build_components(parsed, compiled)
+    if parsed or files != old_files:
+        _write_spec_cache(cache_file, files, compiled)
     return compiled
 
 
-spec_components = load_all_components(Path(__file__).parent / "components")
+_name_re = re.compile(r"^\s*name\s*:\s*(\w+)", re.MULTILINE)
+
+
+class SpecLibrary(Mapping[str, LogicNodeType]):
+    # Lazy version of `load_all_components`: Nothing is loaded before the first lookup. Then the whole
+    # library is loaded from the spec cache if that is enabled. Otherwise only the names are looked up
+    # (via a regex, not lark) and a component is parsed and compiled when it is first requested.
+    def __init__(self, base_path: Path):
+        self.base_path = base_path
+        self._compiled: dict[str, LogicNodeType] = {**builtins_gates}
+        self._cache_loaded = False
+        self._files: dict[str, Path] | None = None
+        self._compiling: set[str] = set()
+        self._builder = Builder(self)
+
+    @property
+    def files(self) -> dict[str, Path]:
+        if self._files is None:
+            self._files = {}
+            for spec in self.base_path.rglob("*.spec"):
+                if match := _name_re.search(spec.read_text("utf-8")):
+                    self._files[match.group(1)] = spec
+        return self._files
+
+    def __getitem__(self, name: str) -> LogicNodeType:
+        try:
+            return self._compiled[name]
+        except KeyError:
+            pass
+        if not self._cache_loaded:
+            # With a spec cache available, loading everything at once is a single read
+            self._cache_loaded = True
+            if (cache_file := spec_cache_file(self.base_path)) is not None:
+                self._compiled.update(load_all_components(self.base_path, cache_file))
+                if name in self._compiled:
+                    return self._compiled[name]
+        spec = self.files[name]
+        if name in self._compiling:
+            raise ValueError(f"Spec component {name} depends on itself")
+        try:
+            tree = parser.parse(spec.read_text("utf-8"))
+        except lark.LarkError as e:
+            print(f"Can't parse {spec}", e)
+            raise KeyError(name)
+        self._compiling.add(name)
+        try:
+            node = self._compiled[name] = self._builder.transform(tree)
+        finally:
+            self._compiling.discard(name)
+        return node
+
+    def __iter__(self) -> Iterator[str]:
+        yield from builtins_gates
+        yield from (name for name in self.files if name not in builtins_gates)
+
+    def __len__(self) -> int:
+        return len(builtins_gates.keys() | self.files.keys())
+
+
+spec_components = SpecLibrary(Path(__file__).parent / "components")
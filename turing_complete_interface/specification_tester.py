@@ -8,7 +8,7 @@ from pprint import pprint
 from lark import LarkError
 
 from .logic_nodes import LogicNodeType
-from .specification_parser import load_all_components, get_name_of_component
+from .specification_parser import load_all_components, get_name_of_component, spec_cache_file
 
 
 class BitsInput(tk.Frame):
@@ -92,7 +92,8 @@ def main(cmdline):
     parser = argparse.ArgumentParser()
     parser.add_argument("main_gate", action="store")
     ns = parser.parse_args(cmdline)
-    components = load_all_components((Path(__file__).parent / "components"))
+    base_path = Path(__file__).parent / "components"
+    components = load_all_components(base_path, spec_cache_file(base_path))
     if ns.main_gate.endswith(".spec"):
         try:
             ns.main_gate = get_name_of_component(Path(ns.main_gate))
@@ -0,0 +1,197 @@
+"""
+Random but valid netlists for scaling experiments. The same config and seed always produce the same node:
+
+    node = generate(SyntheticConfig(size=100_000, seed=1))
+    circuit = lay_out(node)
+
+Only components of the game are used, so that the result can also be laid out into a save.
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass, field
+from math import ceil, sqrt
+from typing import Mapping
+
+from frozendict import frozendict
+
+from .circuit_builder import build_circuit, IOPosition, Space
+from .circuit_parser import Circuit
+from .logic_nodes import CombinedLogicNode, LogicNodeType, InputPin, OutputPin, Wire, NodePin
+from .tc_components import get_component, rev_components
+
+
+@dataclass(frozen=True)
+class SyntheticConfig:
+    size: int = 1000
+    # Number of combinational layers. Non-delayed inputs only connect to earlier layers
+    depth: int = 32
+    inputs: int = 16
+    outputs: int = 16
+    seed: int = 0
+    # The chance of a node being byte wide, and of a wire connecting a bit pin to a byte pin (or vice versa)
+    byte_ratio: float = 0.2
+    conversion_ratio: float = 0.1
+    stateful_ratio: float = 0.05
+    # The chance of a source coming from the layer directly before, instead of any layer before
+    locality: float = 0.8
+    # 1 picks sources uniformly, larger values concentrate the fan out on fewer nodes
+    fan_out_skew: float = 1.0
+    # Component names with their relative weights. The mix of pin counts is the fan in distribution
+    bit_gates: Mapping[str, float] = field(default_factory=lambda: {
+        "Nand": 4, "And": 2, "Or": 2, "Nor": 1, "Xor": 1, "Xnor": 1, "Not": 2, "And3": 1, "Or3": 1,
+    })
+    byte_gates: Mapping[str, float] = field(default_factory=lambda: {
+        "ByteAnd": 1, "ByteOr": 1, "ByteXor": 1, "ByteNot": 1, "ByteAdd": 2, "ByteSwitch": 2,
+        "ByteEqual": 1, "ByteLessU": 1,
+    })
+    bit_stateful: Mapping[str, float] = field(default_factory=lambda: {"BitMemory": 1})
+    byte_stateful: Mapping[str, float] = field(default_factory=lambda: {"Register": 1})
+
+
+class _Sources:
+    # The output pins of each width in creation order, with the index at which each layer ends
+    def __init__(self, rng: random.Random, config: SyntheticConfig):
+        self.rng = rng
+        self.config = config
+        self.pins: dict[int, list[NodePin]] = {1: [], 8: []}
+        self.layer_ends: dict[int, list[int]] = {1: [], 8: []}
+
+    def add(self, pin: NodePin, bits: int):
+        self.pins[bits].append(pin)
+
+    def end_layer(self):
+        for bits, pins in self.pins.items():
+            self.layer_ends[bits].append(len(pins))
+
+    def pick(self, bits: int, layer: int) -> NodePin | None:
+        ends = self.layer_ends[bits]
+        if layer > len(ends):
+            layer = len(ends)
+        hi = ends[layer - 1]
+        lo = ends[layer - 2] if layer >= 2 and self.rng.random() < self.config.locality else 0
+        if lo == hi:
+            lo = 0
+        if hi == 0:
+            return None
+        return self.pins[bits][lo + int((hi - lo) * self.rng.random() ** self.config.fan_out_skew)]
+
+
+def _choose(rng: random.Random, weights: Mapping[str, float]) -> str:
+    return rng.choices(list(weights), list(weights.values()))[0]
+
+
+def generate(config: SyntheticConfig = SyntheticConfig()) -> CombinedLogicNode:
+    rng = random.Random(config.seed)
+    sources = _Sources(rng, config)
+    components: dict[str, LogicNodeType] = {}
+
+    def component(gate_name: str) -> LogicNodeType:
+        if gate_name not in components:
+            components[gate_name] = get_component(gate_name, "")[1]
+        return components[gate_name]
+
+    # The inputs and outputs of the circuit are single bits, byte values are made from them and split into them
+    inputs = {}
+    for i in range(config.inputs):
+        inputs[f"in{i}"] = InputPin(1)
+        sources.add((None, f"in{i}"), 1)
+    sources.end_layer()
+
+    nodes = {}
+    wires = []
+    delayed_pins = []
+
+    def connect(target: NodePin, bits: int, layer: int):
+        if rng.random() < config.conversion_ratio:
+            source_bits = 8 if bits == 1 else 1
+        else:
+            source_bits = bits
+        source = sources.pick(source_bits, layer)
+        if source is None:
+            source_bits = 8 if source_bits == 1 else 1
+            source = sources.pick(source_bits, layer)
+        if source_bits == bits:
+            wires.append(Wire(source, target, (0, bits), (0, bits)))
+        elif bits == 1:
+            b = rng.randrange(8)
+            wires.append(Wire(source, target, (b, b + 1), (0, 1)))
+        else:
+            wires.append(Wire(source, target, (0, 1), (0, 1)))
+            for b in range(1, 8):
+                wires.append(Wire(sources.pick(1, layer), target, (0, 1), (b, b + 1)))
+
+    per_layer, extra = divmod(config.size, config.depth)
+    for layer in range(1, config.depth + 1):
+        for _ in range(per_layer + (layer <= extra)):
+            byte = rng.random() < config.byte_ratio
+            if rng.random() < config.stateful_ratio:
+                gate_name = _choose(rng, config.byte_stateful if byte else config.bit_stateful)
+            else:
+                gate_name = _choose(rng, config.byte_gates if byte else config.bit_gates)
+            node = component(gate_name)
+            name = f"g{len(nodes)}"
+            nodes[name] = node
+            for pin_name, pin in node.inputs.items():
+                if pin.delayed:
+                    delayed_pins.append(((name, pin_name), pin.bits))
+                else:
+                    connect((name, pin_name), pin.bits, layer)
+            for pin_name, pin in node.outputs.items():
+                sources.add((name, pin_name), pin.bits)
+        sources.end_layer()
+
+    # Delayed inputs can be fed from anywhere, which creates feedback loops through the stateful nodes
+    for target, bits in delayed_pins:
+        connect(target, bits, config.depth + 1)
+
+    outputs = {}
+    for i in range(config.outputs):
+        outputs[f"out{i}"] = OutputPin(1)
+        connect((None, f"out{i}"), 1, config.depth + 1)
+
+    return CombinedLogicNode(f"Synthetic{config.size}_{config.seed}", frozendict(nodes), frozendict(inputs),
+                             frozendict(outputs), tuple(wires))
+
+
+def lay_out(node: CombinedLogicNode, space: Space = None) -> Circuit:
+    if space is None:
+        # Leave about as much free space as there is taken, including the byte splitters and makers
+        area = 0
+        for n in node.nodes.values():
+            _, _, w, h = get_component(*rev_components[n.name], no_node=True)[0].bounding_box
+            area += w * h
+        area += 9 * (len(node.inputs) + len(node.outputs))
+        area += 24 * sum(w.source_bits != w.target_bits for w in node.wires)
+        side = ceil(sqrt(area * 2)) + 8
+        space = Space(-(side // 2), -(side // 2), side, side)
+    return build_circuit(node, IOPosition.from_node(node), space)
+
+
+if __name__ == '__main__':
+    import argparse
+    from pathlib import Path
+    from time import perf_counter
+
+    parser = argparse.ArgumentParser(description="Generate a random netlist and optionally lay it out into a save")
+    parser.add_argument("--size", type=int, default=SyntheticConfig.size)
+    parser.add_argument("--depth", type=int, default=SyntheticConfig.depth)
+    parser.add_argument("--seed", type=int, default=SyntheticConfig.seed)
+    parser.add_argument("--byte-ratio", type=float, default=SyntheticConfig.byte_ratio)
+    parser.add_argument("--stateful-ratio", type=float, default=SyntheticConfig.stateful_ratio)
+    parser.add_argument("--fan-out-skew", type=float, default=SyntheticConfig.fan_out_skew)
+    parser.add_argument("--save", type=Path, help="Lay the netlist out and write it to this circuit.data")
+    ns = parser.parse_args()
+
+    start = perf_counter()
+    node = generate(SyntheticConfig(size=ns.size, depth=ns.depth, seed=ns.seed, byte_ratio=ns.byte_ratio,
+                                    stateful_ratio=ns.stateful_ratio, fan_out_skew=ns.fan_out_skew))
+    print(f"{node.name}: {len(node.nodes)} nodes, {len(node.wires)} wires, state size {node.state_size} "
+          f"({perf_counter() - start:.2f}s)")
+    if ns.save is not None:
+        start = perf_counter()
+        circuit = lay_out(node)
+        ns.save.parent.mkdir(parents=True, exist_ok=True)
+        ns.save.write_bytes(bytes(circuit.to_bytes()))
+        print(f"Laid out {len(circuit.gates)} gates and {len(circuit.wires)} wires into {ns.save} "
+              f"({perf_counter() - start:.2f}s)")
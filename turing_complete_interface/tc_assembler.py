@@ -13,7 +13,7 @@ NUMBER: /\d+/
 NAME: /[^\d+\-|&^*\/#\s][^+\-|&^*\/#\s]*/
 %ignore /#[^\n]/
 %ignore / /
-""", parser="lalr")
+""", parser="lalr", cache=True)
 
 
 def assemble(save_path: Path, assembly_file: Path) -> bytes:
@@ -1,5 +1,8 @@
+import hashlib
 import json
-from dataclasses import dataclass, field
+import os
+from collections import deque
+from dataclasses import dataclass, field, replace
 from typing import Callable
 from pathlib import Path
 
@@ -13,6 +16,8 @@ from .circuit_parser import GateShape, GateReference, SPECIAL_RED, NORMAL, Circu
 from .logic_nodes import LogicNodeType, DirectLogicNodeType, InputPin, OutputPin, build_or as ln_build_or, \
     builtins_gates, CombinedLogicNode, Wire
 from .specification_parser import load_all_components, spec_components
+from .paged_memory import PagedMemory, MappedMemory, RamNodeType, byte_bits
+from . import compile_cache
 
 
 def ram_func(args, state: frozenbitarray, delayed):
@@ -33,11 +38,68 @@ def ram_func(args, state: frozenbitarray, delayed):
 
 
 program = bitarray([0] * 8 * (2 ** 8), endian="little")
+# When set, Program components read from this instead of `program`, e.g. a read only `MappedMemory` of a large
+# image. Addresses wrap around at its size, like they do at 256 for `program`.
+program_memory: PagedMemory | MappedMemory | None = None
+
+# The memories of the Ram components of nodes made by `instantiate_paged_ram`, by the dotted path of the Ram
+memories: dict[str, PagedMemory | MappedMemory] = {}
+# When set, `instantiate_paged_ram` maps the Ram at each path from `ram_<path>.bin` in this directory instead, so that
+# its content is still there after the simulation
+ram_directory: Path | None = None
+# Whether those files keep the content they have from an earlier simulation, instead of starting out zeroed like a Ram
+keep_ram_contents: bool = False
+
+
+def build_paged_ram(path: str) -> RamNodeType:
+    if ram_directory is not None:
+        memory = MappedMemory(ram_directory / f"ram_{path}.bin", 256, truncate=not keep_ram_contents)
+    else:
+        memory = PagedMemory(256)
+    memories[path] = memory
+    return RamNodeType("PagedRam", memory)
+
+
+def instantiate_paged_ram(node: LogicNodeType) -> LogicNodeType:
+    """
+    A copy of the node in which every Ram keeps its content in its own `PagedMemory` (see `build_paged_ram`)
+    instead of in the state. The same compiled custom component is used by all its instances, so the combined
+    nodes that contain a Ram are copied per instance; the others stay shared.
+    """
+    ram = get_component("Ram")[1]
+    has_ram: dict[int, bool] = {}
+
+    def contains_ram(n: LogicNodeType) -> bool:
+        if id(n) not in has_ram:
+            has_ram[id(n)] = n is ram or isinstance(n, CombinedLogicNode) and any(
+                contains_ram(sub) for sub in n.nodes.values())
+        return has_ram[id(n)]
+
+    def instantiate(n: LogicNodeType, path: str) -> LogicNodeType:
+        if n is ram:
+            return build_paged_ram(path)
+        if not contains_ram(n):
+            return n
+        copy = replace(n, nodes=frozendict({
+            name: instantiate(sub, f"{path}.{name}" if path else name) for name, sub in n.nodes.items()
+        }))
+        if "execution_order" in n.__dict__:
+            # A RamNodeType has the same pins as the Ram, so the schedule stays the same
+            copy.__dict__["execution_order"] = n.execution_order
+        return copy
+
+    return instantiate(node, "")
 
 
 def build_rom(shape: GateShape, data):
     def f(args, state: frozenbitarray, delayed):
         address = ba2int(args["address"])
+        if program_memory is not None:
+            size = len(program_memory)
+            return frozendict({
+                name: byte_bits[program_memory.read_byte((address + i) % size)]
+                for i, name in enumerate(out_names)
+            }), state
         ret = frozendict({
             name: program[(address + i) % 256 * 8:(address + i) % 256 * 8 + 8]
             for i, name in enumerate(out_names)
@@ -151,13 +213,17 @@ def buffer(args, *_):
 
 
 last_key: int = 0
+# When set, each enabled Keyboard read takes the next key from here instead of `last_key` (0 once it is empty)
+key_buffer: deque[int] | None = None
 
 
 def keyboard(args, _, _1):
-    if args["enable"].any():
+    if not args["enable"].any():
+        key = 0
+    elif key_buffer is None:
         key = last_key
     else:
-        key = 0
+        key = key_buffer.popleft() if key_buffer else 0
     return frozendict({"out": frozenbitarray(int2ba(key, 8, "little"))}), None
 
 
@@ -237,11 +303,17 @@ def noop(*_):
     return frozendict(), None
 
 
+@dataclass(frozen=True)
+class _SpecReference:
+    # Stands in for a spec component in `std_components` until it is first requested
+    name: str
+
+
 def load_components():
     with Path(__file__).with_name("tc_components.json").open() as f:
         data = json.load(f)
 
-    components: dict[str, tuple[GateShape, LogicNodeType | Callable[[GateReference], LogicNodeType]]] = {}
+    components: dict[str, tuple[GateShape, LogicNodeType | _SpecReference | Callable[[GateReference], LogicNodeType]]] = {}
     node_to_component: dict[str, tuple[str, str]] = {}
     for category, raw in data.items():
         assert category in category_colors, category
@@ -275,11 +347,11 @@ def load_components():
             elif d["type"] == "builtin":
                 node = builtins_gates[d["builtin_name"]]
             elif d["type"] == "combined":
-                node = spec_components[d["spec"]]
+                node = _SpecReference(d["spec"])
             else:
                 assert False, d["type"]
             components[name] = shape, node
-            if isinstance(node, LogicNodeType):
+            if isinstance(node, (LogicNodeType, _SpecReference)):
                 assert node.name not in node_to_component, f"Non unique node name {node.name}"
                 node_to_component[node.name] = name, ""
     return components, node_to_component
@@ -321,42 +393,123 @@ def compute_gate_shape(circuit, name: str) -> GateShape:
 @dataclass
 class _CustomComponentRef:
     path: Path
-    circuit: Circuit
+    file: Path
+    id: int
+    content_hash: str
+    dependencies: tuple[int, ...] = ()
+    _circuit: Circuit = None
     shape: GateShape = None
     node: LogicNodeType = None
 
+    @property
+    def circuit(self) -> Circuit:
+        if self._circuit is None:
+            self._circuit = Circuit.parse(self.file.read_bytes())
+        return self._circuit
+
     def get(self, no_node: bool = False):
         if self.shape is None:
             self.shape = compute_gate_shape(self.circuit, f"Custom_{self.path.name}")
         if self.node is None and not no_node:
-            from .circuit_compiler import build_gate
-            self.node = build_gate(f"Custom_{self.path.name}", self.circuit)
+            from .circuit_compiler import build_gate, apply_input_pins
+            key = self.cache_key
+            self.node = compile_cache.load(key)
+            if self.node is not None:
+                apply_input_pins(self.shape, self.node.inputs)
+            else:
+                self.node = build_gate(f"Custom_{self.path.name}", self.circuit)
+                compile_cache.store(key, self.node)
             if self.node.name in rev_components:
                 raise ValueError(f"Non unique node name {self.node.name} (for Custom component {self.path.name})")
             rev_components[self.node.name] = ("Custom", self.id)
         return self.shape, self.node
 
     @property
-    def id(self) -> int:
-        return self.circuit.save_version
+    def cache_key(self) -> str:
+        # A custom component compiles differently when one of the custom components it uses changes
+        return compile_cache.cache_key(self.content_hash.encode(), f"Custom_{self.path.name}",
+                                       (cc_by_id[d].cache_key for d in self.dependencies if d in cc_by_id))
 
     @property
     def name(self):
         return self.path.name
 
 
+INDEX_FORMAT = 1
+
+
+def _index_file() -> Path | None:
+    cache_path = compile_cache.get_cache_path()
+    return cache_path / "custom_components.json" if cache_path is not None else None
+
+
+def _read_index(base: Path) -> dict[str, dict]:
+    file = _index_file()
+    try:
+        data = json.loads(file.read_text())
+    except (OSError, ValueError, AttributeError):
+        return {}
+    if data.get("format") != INDEX_FORMAT or data.get("base") != str(base):
+        return {}
+    return data["entries"]
+
+
+def _write_index(base: Path, entries: dict[str, dict]):
+    file = _index_file()
+    if file is None:
+        return
+    try:
+        file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = file.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"format": INDEX_FORMAT, "base": str(base), "entries": entries}))
+        tmp.replace(file)
+    except OSError as e:
+        print("Can't write custom component index:", type(e), e)
+
+
 def load_custom():
-    global cc_by_path, cc_by_id
+    # Only reads the metadata of each save (and only for files that changed since the last run).
+    # The full circuit is parsed when the component is first requested.
+    global _custom_loaded
+    _custom_loaded = True
     base = SCHEMATICS_PATH / "component_factory"
+    old_index = _read_index(base) if compile_cache.enabled else {}
+    index = {}
+    # Loading again forgets the components found before, also those whose save is gone. Their nodes come back
+    # from the compile cache when they're requested again.
+    for ref in cc_by_path.values():
+        if ref.node is not None and rev_components.get(ref.node.name) == ("Custom", ref.id):
+            del rev_components[ref.node.name]
+    cc_by_path.clear()
+    cc_by_id.clear()
     for path in Path(base).rglob("circuit.data"):
+        rel = str(path.relative_to(base).parent)
         try:
-            circuit = Circuit.parse(path.read_bytes())
-            # Don't compile immediately. Wait if we are asked
-            ref = _CustomComponentRef(path.relative_to(base).parent, circuit)
-            cc_by_id[circuit.save_version] = ref
-            cc_by_path[str(path.relative_to(base).parent)] = ref
+            st = path.stat()
+            entry = old_index.get(rel)
+            if entry is None or entry["mtime"] != st.st_mtime_ns or entry["size"] != st.st_size:
+                data = path.read_bytes()
+                meta = Circuit.parse(data, meta_only=True)
+                dependencies = meta.dependencies
+                if data[:1] == b"1":  # The old text format doesn't list the dependencies in its header
+                    dependencies = sorted({g.custom_id for g in Circuit.parse(data).gates
+                                           if g is not None and g.name == "Custom"})
+                entry = {
+                    "mtime": st.st_mtime_ns,
+                    "size": st.st_size,
+                    "id": meta.save_version,
+                    "hash": hashlib.sha256(data).hexdigest(),
+                    "dependencies": list(dependencies),
+                }
+            index[rel] = entry
+            ref = _CustomComponentRef(path.relative_to(base).parent, path, entry["id"], entry["hash"],
+                                      tuple(entry["dependencies"]))
+            cc_by_id[ref.id] = ref
+            cc_by_path[rel] = ref
         except Exception as e:
             print(type(e), e)
+    if index != old_index and compile_cache.enabled:
+        _write_index(base, index)
 
 
 std_components: dict[str, tuple[GateShape, LogicNodeType]]
@@ -364,11 +517,12 @@ rev_components: dict[str, tuple[str, str | int]]
 std_components, rev_components = load_components()
 cc_by_path: dict[str, _CustomComponentRef] = {}
 cc_by_id: dict[int, _CustomComponentRef] = {}
-if SCHEMATICS_PATH is not None:
-    load_custom()
+_custom_loaded = False
 
 
 def get_custom_component(custom_data: str | int, no_node: bool = False):
+    if not _custom_loaded and SCHEMATICS_PATH is not None:
+        load_custom()
     try:
         ref = cc_by_id[int(custom_data)]
     except (ValueError, KeyError):
@@ -385,6 +539,9 @@ def get_component(gate_name: str | GateReference, custom_data: str | int = None,
     if gate_name == "Custom":
         return get_custom_component(custom_data, no_node).get(no_node)
     s, n = std_components[gate_name]
+    if isinstance(n, _SpecReference):
+        n = spec_components[n.name]
+        std_components[gate_name] = s, n
     if callable(n):
         if not no_node:
             n = n(gate_name, custom_data)
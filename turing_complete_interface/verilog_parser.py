@@ -43,7 +43,7 @@ module_item: "input" [range_expression] NAME ";"-> input_decl
 
 INT: /\d+/
 
-""", parser="lalr", maybe_placeholders=True)
+""", parser="lalr", maybe_placeholders=True, cache=True)
 
 
 def _build_wires(selected_bits: tuple[int, int], target: NodePin, target_bits: tuple[int, int],
@@ -0,0 +1,191 @@
+"""
+Streams the values of selected signals to a VCD file, which can be opened with e.g. GTKWave or Surfer:
+
+    with WaveformRecorder(node, "trace.vcd.gz", ["pc.*", "alu.adder*.out"]) as recorder:
+        for _ in range(cycles):
+            out, state, values = node.evaluate(inputs, state, True)
+            recorder.sample(values, out)
+
+Signals are named by their dotted path, e.g. `alu.adder1.out` is the output pin `out` of the node `adder1`
+inside the node `alu`. Top level inputs and outputs are just their name. The patterns are `fnmatch` patterns
+over these paths, so `*` also matches across dots.
+"""
+from __future__ import annotations
+
+import gzip
+from fnmatch import fnmatchcase
+from pathlib import Path
+from time import strftime
+from typing import Iterable, Mapping, Optional, Literal, Any, TextIO
+
+from bitarray import frozenbitarray
+from frozendict import frozendict
+
+from .logic_nodes import CombinedLogicNode, LogicNodeType, NodePin, EvaluationHook
+
+Scope = tuple[str, ...]
+
+
+def _identifier(i: int) -> str:
+    # VCD identifiers use the printable ASCII characters
+    chars = []
+    while True:
+        i, r = divmod(i, 94)
+        chars.append(chr(33 + r))
+        if not i:
+            return "".join(chars)
+        i -= 1
+
+
+class WaveformRecorder(EvaluationHook):
+    def __init__(self, node: CombinedLogicNode, file: str | Path | TextIO, patterns: Iterable[str] = ("*",),
+                 compress: bool = None, timescale: str = "1 ns", buffer_lines: int = 4096, root_name: str = None):
+        self.node = node
+        self.root_name = root_name or node.name
+        self.patterns = tuple(patterns)
+        self.buffer_lines = buffer_lines
+        self.time = 0
+        self._buffer: list[str] = []
+
+        # Per signal: the scope (path of the CombinedLogicNode it is inside of) and the key in that scope's values
+        self.signals: list[tuple[str, Scope, NodePin, int]] = []
+        self._collect(node, ())
+        self._last: list[Optional[frozenbitarray]] = [None] * len(self.signals)
+        self._ids = [_identifier(i) for i in range(len(self.signals))]
+        # The values of the nested scopes of the current step, captured while evaluating
+        self._scopes: set[Scope] = {scope for _, scope, _, _ in self.signals if scope}
+        self._prefixes: set[Scope] = {scope[:i] for scope in self._scopes for i in range(1, len(scope) + 1)}
+        self._captured: dict[Scope, Mapping[NodePin, frozenbitarray]] = {}
+        self._stack: list[str] = []
+
+        if isinstance(file, (str, Path)):
+            if compress is None:
+                compress = str(file).endswith(".gz")
+            self._file = gzip.open(file, "wt", encoding="ascii") if compress else open(file, "w", encoding="ascii")
+            self._owns_file = True
+        else:
+            self._file = file
+            self._owns_file = False
+        self._write_header(timescale)
+
+    def _could_match(self, path: str) -> bool:
+        # Whether a signal below this path can match, judged by the part of each pattern before its first wildcard
+        for pattern in self.patterns:
+            literal = pattern
+            for i, c in enumerate(pattern):
+                if c in "*?[":
+                    literal = pattern[:i]
+                    break
+            if literal.startswith(path + ".") or (path + ".").startswith(literal):
+                return True
+        return False
+
+    def _matches(self, path: str) -> bool:
+        return any(fnmatchcase(path, pattern) for pattern in self.patterns)
+
+    def _collect(self, node: LogicNodeType, scope: Scope):
+        prefix = "".join(s + "." for s in scope)
+        if not scope:
+            for name, pin in node.inputs.items():
+                if self._matches(name):
+                    self.signals.append((name, scope, (None, name), pin.bits))
+            for name, pin in node.outputs.items():
+                if self._matches(name):
+                    self.signals.append((name, scope, (None, name), pin.bits))
+        for name, sub_node in sorted(node.nodes.items()):
+            for pin_name, pin in sub_node.outputs.items():
+                path = f"{prefix}{name}.{pin_name}"
+                if self._matches(path):
+                    self.signals.append((path, scope, (name, pin_name), pin.bits))
+            if isinstance(sub_node, CombinedLogicNode) and self._could_match(prefix + name):
+                self._collect(sub_node, (*scope, name))
+
+    def _write_header(self, timescale: str):
+        lines = [
+            f"$date {strftime('%Y-%m-%d %H:%M:%S')} $end",
+            "$version turing_complete_interface $end",
+            f"$timescale {timescale} $end",
+            f"$scope module {self.root_name} $end",
+        ]
+        current: list[str] = []
+        for (path, scope, key, bits), ident in sorted(zip(self.signals, self._ids), key=lambda t: t[0][0].split(".")):
+            *modules, var = path.split(".")
+            common = 0
+            while common < min(len(current), len(modules)) and current[common] == modules[common]:
+                common += 1
+            lines.extend("$upscope $end" for _ in current[common:])
+            lines.extend(f"$scope module {m} $end" for m in modules[common:])
+            current = modules
+            lines.append(f"$var wire {bits} {ident} {var} $end")
+        lines.extend("$upscope $end" for _ in current)
+        lines.append("$upscope $end")
+        lines.append("$enddefinitions $end")
+        self._file.write("\n".join(lines) + "\n")
+
+    def __enter__(self) -> WaveformRecorder:
+        if self._scopes:
+            self.install()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def call(self, name: str, node: LogicNodeType, inputs: frozendict[str, frozenbitarray],
+             state: Optional[frozenbitarray], delayed: bool | Literal["toplevel"]) -> tuple[Any, ...]:
+        self._stack.append(name)
+        try:
+            res = self.evaluate_next(name, node, inputs, state, delayed)
+            path = tuple(self._stack)
+            if path in self._scopes:
+                self._captured[path] = res[2]
+        finally:
+            self._stack.pop()
+        return res
+
+    def sample(self, values: Mapping[NodePin, frozenbitarray], outputs: Mapping[str, frozenbitarray] = None,
+               time: int = None):
+        """
+        Records the values of one step: `values` is what `CombinedLogicNode.evaluate` returned for the top level
+        node, `outputs` its outputs. Only signals whose value changed since the last sample are written.
+        """
+        if time is None:
+            time = self.time
+        self.time = time + 1
+        changes = []
+        last = self._last
+        captured = self._captured
+        for i, (_, scope, key, bits) in enumerate(self.signals):
+            if scope:
+                scope_values = captured.get(scope)
+                value = scope_values.get(key) if scope_values is not None else None
+            elif key[0] is None and outputs is not None and key[1] in outputs:
+                value = outputs[key[1]]
+            else:
+                value = values.get(key)
+            if value is None or value == last[i]:
+                continue
+            last[i] = value
+            if bits == 1:
+                changes.append(f"{value.to01()}{self._ids[i]}")
+            else:
+                changes.append(f"b{value[::-1].to01()} {self._ids[i]}")
+        if changes:
+            self._buffer.append(f"#{time}")
+            self._buffer.extend(changes)
+            if len(self._buffer) >= self.buffer_lines:
+                self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._buffer.clear()
+        self._file.flush()
+
+    def close(self):
+        self.uninstall()
+        if self._file.closed:
+            return
+        self._buffer.append(f"#{self.time}")
+        self.flush()
+        if self._owns_file:
+            self._file.close()
@@ -74,6 +74,12 @@ class WorldView:
             out.append(sp)
         return out, in_bounds
 
+    def visible_rect(self, margin: float = 0) -> tuple[float, float, float, float]:
+        # The corners (x0, y0, x1, y1) of the world area on the screen, widened by margin world units
+        x0, y0 = self.s2w((0, 0))
+        x1, y1 = self.s2w(self.screen.get_size())
+        return min(x0, x1) - margin, min(y0, y1) - margin, max(x0, x1) + margin, max(y0, y1) + margin
+
     def ms2w(self, points: list[POINT_COMPATIBLE]) -> list[tuple[float, float]]:
         return [self.s2w(p) for p in points]
 